@@ -572,7 +572,11 @@ def _compare_indexes_and_uniques(
             if autogen_context.run_filters(
                 obj.const, obj.name, "index", False, None
             ):
-                modify_ops.ops.append(ops.CreateIndexOp.from_index(obj.const))
+                create_index_op = ops.CreateIndexOp.from_index(obj.const)
+                if not is_create_table:
+                    impl = autogen_context.migration_context.impl
+                    impl.correct_for_autogen_new_index(create_index_op)
+                modify_ops.ops.append(create_index_op)
                 log.info(
                     "Detected added index '%s' on %s",
                     obj.name,
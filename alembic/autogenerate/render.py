@@ -219,6 +219,8 @@ def _drop_table(autogen_context, op):
 @renderers.dispatch_for(ops.CreateIndexOp)
 def _add_index(autogen_context, op):
     index = op.to_index()
+    kwargs = dict(index.kwargs)
+    kwargs.update(op.kw)
 
     has_batch = autogen_context._has_batch
 
@@ -250,11 +252,11 @@ def _add_index(autogen_context, op):
                 [
                     "%s=%s"
                     % (key, _render_potential_expr(val, autogen_context))
-                    for key, val in index.kwargs.items()
+                    for key, val in kwargs.items()
                 ]
             )
         )
-        if len(index.kwargs)
+        if len(kwargs)
         else "",
     }
     return text
@@ -1,3 +1,4 @@
+import itertools
 import os
 
 from . import autogenerate as autogen
@@ -342,9 +343,15 @@ def show(config, rev):
             config.print_stdout(sc.log_entry)
 
 
-def history(config, rev_range=None, verbose=False, indicate_current=False):
+def history(
+    config, rev_range=None, verbose=False, indicate_current=False, limit=None
+):
     """List changeset scripts in chronological order.
 
+    Revisions are written as they are produced, newest first; the
+    revision modules themselves aren't imported where the header of
+    each revision can be read from its source.
+
     :param config: a :class:`.Config` instance.
 
     :param rev_range: string revision range
@@ -355,9 +362,21 @@ def history(config, rev_range=None, verbose=False, indicate_current=False):
 
      ..versionadded:: 0.9.9
 
+    :param limit: maximum number of revisions to list; traversal of the
+     revision history stops once this many have been listed.
+
+     .. versionadded:: 1.0.8
+
     """
 
-    script = ScriptDirectory.from_config(config)
+    if config._script_directory is not None:
+        # a ScriptDirectory kept by a long running process; its loading
+        # of revisions is left as configured
+        script = config._script_directory
+    else:
+        script = ScriptDirectory.from_config(config)
+        # only the header of each revision is displayed
+        script.lazy_revisions = True
     if rev_range is not None:
         if ":" not in rev_range:
             raise util.CommandError(
@@ -373,9 +392,13 @@ def history(config, rev_range=None, verbose=False, indicate_current=False):
     )
 
     def _display_history(config, script, base, head, currents=()):
-        for sc in script.walk_revisions(
+        revisions = script.walk_revisions(
             base=base or "base", head=head or "heads"
-        ):
+        )
+        if limit is not None:
+            revisions = itertools.islice(revisions, limit)
+
+        for sc in revisions:
 
             if indicate_current:
                 sc._db_current_indicator = sc.revision in currents
@@ -562,3 +585,208 @@ def edit(config, rev):
             )
         for sc in revs:
             util.edit(sc.path)
+
+
+def serve(config, socket_path):
+    """Run a long-lived process which accepts commands over a local
+    Unix socket.
+
+    The configuration, the :class:`.ScriptDirectory` and its revision
+    map, and an :class:`~sqlalchemy.engine.Engine` for the
+    ``sqlalchemy.url`` of the configuration, if present, are kept loaded
+    between commands; revisions are reloaded when the version
+    directories or the configuration file change.  Commands are sent
+    using the ``--socket`` option of the ``alembic`` runner, e.g.
+    ``alembic --socket /path/to/socket current``.
+
+    :param config: a :class:`.Config` instance.
+
+    :param socket_path: filesystem path of the Unix socket to listen on.
+
+    .. versionadded:: 1.0.8
+
+    .. seealso::
+
+        :class:`alembic.server.MigrationServer`
+
+    """
+    from .server import MigrationServer
+
+    server = MigrationServer(config, socket_path)
+    util.msg("Listening on %s" % socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def fleet_upgrade(
+    config, revision, targets, workers=4, tag=None, version_table=None
+):
+    """Upgrade many databases, or schemas, which share the same migration
+    scripts, reporting the outcome for each.
+
+    Targets which are already at the given revision are skipped; others
+    are upgraded concurrently, each by running ``env.py`` with a
+    connection to the target passed in :attr:`.Config.attributes`.  A
+    target of the form ``@<filename>`` reads further targets from the
+    given file, one per line.
+
+    :param config: a :class:`.Config` instance.
+
+    :param revision: string revision target.
+
+    :param targets: a sequence of database URLs and/or schema names.
+
+    :param workers: the number of targets to upgrade at once.
+
+    :param tag: an arbitrary "tag" that can be intercepted by custom
+     ``env.py`` scripts via the :meth:`.EnvironmentContext.get_tag_argument`
+     method.
+
+    :param version_table: the name of the version table which ``env.py``
+     configures, checked before each target is upgraded; defaults to
+     ``alembic_version``.
+
+    .. versionadded:: 1.0.8
+
+    .. seealso::
+
+        :func:`alembic.fleet.upgrade_fleet`
+
+    """
+    from .fleet import upgrade_fleet
+
+    names = []
+    for target in util.to_list(targets):
+        if target.startswith("@"):
+            with open(target[1:]) as file_:
+                names.extend(
+                    line.strip()
+                    for line in file_
+                    if line.strip() and not line.startswith("#")
+                )
+        else:
+            names.append(target)
+
+    results = upgrade_fleet(
+        config,
+        names,
+        revision,
+        workers=workers or 4,
+        tag=tag,
+        version_table=version_table or "alembic_version",
+    )
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if result.error is not None:
+            detail = str(result.error)
+        else:
+            detail = "%s -> %s" % (
+                ", ".join(result.from_heads) or "base",
+                ", ".join(result.to_heads) or "base",
+            )
+        config.print_stdout(
+            "%-8s %s: %s (%.2fs)",
+            result.status,
+            result.target,
+            detail,
+            result.elapsed,
+        )
+    config.print_stdout(
+        "%d targets: %s",
+        len(results),
+        ", ".join(
+            "%d %s" % (counts[status], status) for status in sorted(counts)
+        ),
+    )
+
+    failed = counts.get("failed", 0)
+    if failed:
+        raise util.CommandError(
+            "Upgrade failed for %d of %d targets" % (failed, len(results))
+        )
+
+
+def plan(config, revision, verbose=False, tag=None):
+    """Display the operations which upgrading to the given revision would
+    run, with the lock each takes and the rows it is estimated to read or
+    rewrite, without running them.
+
+    The tables' row counts are estimated from the statistics of the
+    database, where the dialect provides them.
+
+    :param config: a :class:`.Config` instance.
+
+    :param revision: string revision target.
+
+    :param verbose: also display the SQL of each operation.
+
+    :param tag: an arbitrary "tag" that can be intercepted by custom
+     ``env.py`` scripts via the :meth:`.EnvironmentContext.get_tag_argument`
+     method.
+
+    .. versionadded:: 1.0.8
+
+    .. seealso::
+
+        :func:`alembic.plan.plan_upgrade`
+
+    """
+    from .plan import plan_upgrade
+
+    script = ScriptDirectory.from_config(config)
+
+    def do_plan(rev, context):
+        if context.as_sql:
+            raise util.CommandError(
+                "plan requires a database connection; "
+                "it can't be run in --sql mode"
+            )
+        planned = plan_upgrade(context, script, revision, heads=rev)
+
+        total = unknown = count = 0
+        for step in planned:
+            config.print_stdout(step.step.short_log)
+            for op in step.operations:
+                count += 1
+                if op.cost is None:
+                    unknown += 1
+                else:
+                    total += op.cost
+                config.print_stdout(
+                    "    %-20s %-30s %12s %-24s %s",
+                    op.name,
+                    ".".join(name for name in (op.schema, op.table) if name)
+                    or "-",
+                    "~%d rows" % op.rows if op.rows is not None else "?",
+                    op.lock or "-",
+                    op.effect,
+                )
+                if verbose and op.sql.strip():
+                    for line in op.sql.strip().splitlines():
+                        config.print_stdout("        %s", line)
+            if step.error is not None:
+                config.print_stdout(
+                    "    planning stopped: %s: %s",
+                    type(step.error).__name__,
+                    step.error,
+                )
+        config.print_stdout(
+            "%d operations in %d steps; ~%d rows scanned or rewritten; "
+            "%d operations of unknown cost",
+            count,
+            len(planned),
+            total,
+            unknown,
+        )
+        return []
+
+    with EnvironmentContext(
+        config, script, fn=do_plan, destination_rev=revision, tag=tag
+    ):
+        script.run_env()
@@ -137,6 +137,11 @@ class Config(object):
 
     """
 
+    _script_directory = None
+    """A :class:`.ScriptDirectory` to be returned by
+    :meth:`.ScriptDirectory.from_config`, rather than loading a new one;
+    established by ``alembic serve``."""
+
     @util.memoized_property
     def attributes(self):
         """A Python dictionary for storage of additional state.
@@ -414,6 +419,28 @@ class CommandLine(object):
                         "format is [start]:[end]",
                     ),
                 ),
+                "limit": (
+                    "-l",
+                    "--limit",
+                    dict(
+                        type=int, help="Limit the number of revisions listed"
+                    ),
+                ),
+                "workers": (
+                    "-w",
+                    "--workers",
+                    dict(
+                        type=int, help="Number of targets to upgrade at once",
+                    ),
+                ),
+                "version_table": (
+                    "--version-table",
+                    dict(
+                        type=str,
+                        help="Name of the version table configured by "
+                        "env.py, checked before upgrading each target",
+                    ),
+                ),
                 "indicate_current": (
                     "-i",
                     "--indicate-current",
@@ -427,6 +454,9 @@ class CommandLine(object):
                 "directory": "location of scripts directory",
                 "revision": "revision identifier",
                 "revisions": "one or more revisions, or 'heads' for all heads",
+                "socket_path": "path of the Unix socket to listen on",
+                "targets": "one or more database URLs or schema names, "
+                "or @<file> to read them from a file, one per line",
             }
             for arg in kwargs:
                 if arg in kwargs_opts:
@@ -435,14 +465,14 @@ class CommandLine(object):
                     parser.add_argument(*args, **kw)
 
             for arg in positional:
-                if arg == "revisions":
+                if arg in ("revisions", "targets"):
                     subparser.add_argument(
                         arg, nargs="+", help=positional_help.get(arg)
                     )
                 else:
                     subparser.add_argument(arg, help=positional_help.get(arg))
 
-        parser = ArgumentParser(prog=prog)
+        parser = self._argument_parser(prog=prog)
         parser.add_argument(
             "-c",
             "--config",
@@ -469,7 +499,26 @@ class CommandLine(object):
             action="store_true",
             help="Raise a full stack trace on error",
         )
-        subparsers = parser.add_subparsers()
+        parser.add_argument(
+            "--socket",
+            type=str,
+            help="Send the command to an 'alembic serve' process "
+            "listening on the given Unix socket",
+        )
+        parser.add_argument(
+            "--profile",
+            type=str,
+            metavar="FILE",
+            help="Profile the command, writing pstats output to the given "
+            "file and the time taken by each phase to stderr",
+        )
+        parser.add_argument(
+            "--profile-imports",
+            action="store_true",
+            help="Write the time taken by each Python module imported "
+            "by the command to stderr",
+        )
+        subparsers = parser.add_subparsers(parser_class=self._argument_parser)
 
         for fn in [getattr(command, n) for n in dir(command)]:
             if (
@@ -491,6 +540,9 @@ class CommandLine(object):
                 subparser.set_defaults(cmd=(fn, positional, kwarg))
         self.parser = parser
 
+    def _argument_parser(self, **kw):
+        return ArgumentParser(**kw)
+
     def run_cmd(self, config, options):
         fn, positional, kwarg = options.cmd
 
@@ -512,13 +564,45 @@ class CommandLine(object):
             # see http://bugs.python.org/issue9253, argparse
             # behavior changed incompatibly in py3.3
             self.parser.error("too few arguments")
+        elif options.socket and options.cmd[0] is not command.serve:
+            from .server import send_command
+
+            try:
+                status = send_command(
+                    options.socket,
+                    sys.argv[1:] if argv is None else argv,
+                    sys.stdout,
+                )
+            except util.CommandError as e:
+                if options.raiseerr:
+                    raise
+                util.err(str(e))
+            else:
+                if status:
+                    sys.exit(status)
         else:
-            cfg = Config(
-                file_=options.config,
-                ini_section=options.name,
-                cmd_opts=options,
-            )
-            self.run_cmd(cfg, options)
+            profiler = None
+            if options.profile or options.profile_imports:
+                from .profiling import CommandProfiler
+
+                profiler = CommandProfiler(
+                    options.profile, imports=options.profile_imports
+                )
+                profiler.start()
+            try:
+                cfg = Config(
+                    file_=options.config,
+                    ini_section=options.name,
+                    cmd_opts=options,
+                )
+                if profiler is not None:
+                    with profiler.phase("config parse"):
+                        cfg.file_config
+                self.run_cmd(cfg, options)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                    profiler.report(sys.stderr)
 
 
 def main(argv=None, prog=None, **kwargs):
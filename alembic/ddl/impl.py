@@ -1,6 +1,11 @@
+import logging
+import time
+
+from sqlalchemy import exc as sqla_exc
 from sqlalchemy import schema
 from sqlalchemy import text
 from sqlalchemy import types as sqltypes
+from sqlalchemy.util import LRUCache
 
 from . import base
 from .. import util
@@ -9,6 +14,8 @@ from ..util.compat import string_types
 from ..util.compat import text_type
 from ..util.compat import with_metaclass
 
+log = logging.getLogger(__name__)
+
 
 class ImplMeta(type):
     def __init__(cls, classname, bases, dict_):
@@ -40,6 +47,27 @@ class DefaultImpl(with_metaclass(ImplMeta)):
     transactional_ddl = False
     command_terminator = ";"
 
+    # called with the text of each statement rendered in "offline" mode;
+    # see alembic.runtime.metrics
+    _statement_hook = None
+
+    # a StatementProfiler, set for the duration of run_migrations()
+    _statement_profiler = None
+
+    # a LockRetryPolicy; see alembic.runtime.retry
+    _lock_retry_policy = None
+
+    # set while emitting statements which aren't counted by StepMetrics
+    # nor profiled, such as the SAVEPOINT around a retried statement
+    _recording_suspended = False
+
+    # MigrationContext.autocommit_block of the context using this impl
+    _autocommit_block = None
+
+    # called with the number and delay of each retry of a statement
+    # which timed out waiting for a lock; see alembic.runtime.metrics
+    _lock_retry_hook = None
+
     def __init__(
         self,
         dialect,
@@ -57,6 +85,7 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         self.output_buffer = output_buffer
         self.memo = {}
         self.context_opts = context_opts
+        self._compiled_cache = LRUCache(500)
         if transactional_ddl is not None:
             self.transactional_ddl = transactional_ddl
 
@@ -74,6 +103,45 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         self.output_buffer.write(text_type(text + "\n\n"))
         self.output_buffer.flush()
 
+    def set_lock_timeout(self, timeout):
+        """Limit the time each statement waits to acquire a lock to the
+        given number of seconds, for the remainder of the session.
+
+        Used by :class:`.LockRetryPolicy`; the default implementation
+        warns that lock timeouts aren't supported.
+
+        .. versionadded:: 1.0.8
+
+        """
+        util.warn(
+            "lock_timeout isn't supported for the %s dialect"
+            % self.dialect.name
+        )
+
+    def supports_autocommit(self):
+        """Return True if the connection may be put into "autocommit" mode
+        by :meth:`.MigrationContext.autocommit_block`.
+
+        SQLAlchemy dialects name the isolation levels they accept within
+        ``_isolation_lookup``; a dialect which handles ``AUTOCOMMIT``
+        apart from these should override this method.
+
+        .. versionadded:: 1.0.8
+
+        """
+        levels = getattr(self.dialect, "_isolation_lookup", None)
+        return levels is None or "AUTOCOMMIT" in levels
+
+    def is_lock_timeout(self, err):
+        """Return True if the given :class:`~sqlalchemy.exc.DBAPIError`
+        indicates that a statement timed out waiting for a lock, and may
+        be retried.
+
+        .. versionadded:: 1.0.8
+
+        """
+        return False
+
     def requires_recreate_in_batch(self, batch_op):
         """Return True if the given :class:`.BatchOperationsImpl`
         would need the table to be recreated and copied in order to
@@ -104,7 +172,11 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         execution_options=None,
         multiparams=(),
         params=util.immutabledict(),
+        inline_params=None,
     ):
+        # inline_params are rendered in place of the placeholder values of
+        # the bound parameters of the construct in "offline" mode; these
+        # are used only by the statements against the version table
         if isinstance(construct, string_types):
             construct = text(construct)
         if self.as_sql:
@@ -112,26 +184,135 @@ class DefaultImpl(with_metaclass(ImplMeta)):
                 # TODO: coverage
                 raise Exception("Execution arguments not allowed with as_sql")
 
-            if self.literal_binds and not isinstance(
-                construct, schema.DDLElement
-            ):
-                compile_kw = dict(compile_kwargs={"literal_binds": True})
-            else:
-                compile_kw = {}
-
-            self.static_output(
-                text_type(
-                    construct.compile(dialect=self.dialect, **compile_kw)
-                )
-                .replace("\t", "    ")
-                .strip()
-                + self.command_terminator
-            )
+            profiler = self._statement_profiler
+            if profiler is not None:
+                started = time.time()
+            statement = self._render_offline(construct, inline_params)
+            if profiler is not None:
+                profiler._rendered(construct, statement, time.time() - started)
+            if self._statement_hook is not None:
+                self._statement_hook(statement)
+            self.static_output(statement + self.command_terminator)
         else:
+            if inline_params:
+                params = inline_params
             conn = self.connection
             if execution_options:
                 conn = conn.execution_options(**execution_options)
+            return self._execute(conn, construct, multiparams, params)
+
+    def _execute(self, conn, construct, multiparams, params):
+        policy = self._lock_retry_policy
+        if policy is None or not policy.retries:
+            return self._execute_attempt(conn, construct, multiparams, params)
+
+        attempt = 0
+        while True:
+            # a failed statement aborts the transaction on some
+            # databases, so each attempt is rolled back on its own
+            savepoint = None
+            if self.transactional_ddl and self.connection.in_transaction():
+                savepoint = self._without_recording(
+                    self.connection.begin_nested
+                )
+            try:
+                result = self._execute_attempt(
+                    conn, construct, multiparams, params
+                )
+            except sqla_exc.DBAPIError as err:
+                if savepoint is not None:
+                    self._without_recording(savepoint.rollback)
+                attempt += 1
+                if attempt > policy.retries or not self.is_lock_timeout(err):
+                    raise
+                delay = policy.delay(attempt)
+                log.warning(
+                    "Timed out waiting for a lock; retrying in %.1f "
+                    "seconds (retry %d of %d): %s",
+                    delay,
+                    attempt,
+                    policy.retries,
+                    err.statement,
+                )
+                if self._lock_retry_hook is not None:
+                    self._lock_retry_hook(attempt, delay)
+                policy.sleep(delay)
+            else:
+                if savepoint is not None:
+                    self._without_recording(savepoint.commit)
+                return result
+
+    def _execute_attempt(self, conn, construct, multiparams, params):
+        profiler = self._statement_profiler
+        if profiler is None:
             return conn.execute(construct, *multiparams, **params)
+        profiler._executing(construct)
+        try:
+            return conn.execute(construct, *multiparams, **params)
+        finally:
+            profiler._executed()
+
+    def _without_recording(self, fn):
+        self._recording_suspended = True
+        try:
+            return fn()
+        finally:
+            self._recording_suspended = False
+
+    def _render_offline(self, construct, params):
+        """Render a construct as a string for "offline" mode.
+
+        Structurally identical constructs, such as the same DDL emitted
+        repeatedly, are compiled only once.  A statement passed along with
+        inline parameters is compiled once as well, rendering the values of
+        its bound parameters, which serve as placeholders and so should be
+        distinct from any other text of the statement; these are replaced
+        with the rendering of the given parameters each time it's used.
+
+        """
+        if params:
+            key = (construct, tuple(sorted(params)))
+        else:
+            key = _offline_cache_key(construct)
+
+        entry = self._compiled_cache.get(key) if key is not None else None
+        if entry is None:
+            entry = self._compile_offline(construct, params)
+            if key is not None:
+                self._compiled_cache[key] = entry
+
+        string, compiled, binds = entry
+        for name, type_, placeholder in binds:
+            string = string.replace(
+                placeholder, compiled.render_literal_value(params[name], type_)
+            )
+        return string
+
+    def _compile_offline(self, construct, params):
+        if params or (
+            self.literal_binds and not isinstance(construct, schema.DDLElement)
+        ):
+            compile_kw = dict(compile_kwargs={"literal_binds": True})
+        else:
+            compile_kw = {}
+
+        binds = []
+        if params:
+            # literal binds aren't collected by the compiler; locate the
+            # placeholders and their types from a plain compilation
+            compiled = construct.compile(dialect=self.dialect)
+            for name in params:
+                bind = compiled.binds[name]
+                binds.append(
+                    (
+                        name,
+                        bind.type,
+                        compiled.render_literal_value(bind.value, bind.type),
+                    )
+                )
+        compiled = construct.compile(dialect=self.dialect, **compile_kw)
+        string = text_type(compiled).replace("\t", "    ").strip()
+        return string, compiled, binds
 
     def execute(self, sql, execution_options=None):
         self._exec(sql, execution_options)
@@ -369,6 +550,14 @@ class DefaultImpl(with_metaclass(ImplMeta)):
     def _compat_autogen_column_reflect(self, inspector):
         return self.autogen_column_reflect
 
+    def correct_for_autogen_new_index(self, create_index_op):
+        """Adjust the :class:`.CreateIndexOp` which autogenerate renders
+        for an index added to an existing table.
+
+        .. versionadded:: 1.0.8
+
+        """
+
     def correct_for_autogen_foreignkeys(self, conn_fks, metadata_fks):
         pass
 
@@ -409,6 +598,56 @@ class DefaultImpl(with_metaclass(ImplMeta)):
         """
         self.static_output("COMMIT" + self.command_terminator)
 
+    def version_table_schemas(self, version_table, schemas):
+        """Return those of the given schemas which contain a version
+        table of the given name.
+
+        This is used by
+        :meth:`.MigrationContext.get_current_heads_for_schemas`; dialects
+        may check all the schemas at once against their catalog, rather
+        than one at a time as by default.
+
+        .. versionadded:: 1.0.8
+
+        """
+        return [
+            schema
+            for schema in schemas
+            if self.connection.dialect.has_table(
+                self.connection, version_table, schema
+            )
+        ]
+
+    def table_row_estimates(self, tables):
+        """Return a dictionary of each of the given ``(schema, name)``
+        tuples of existing tables to an estimate of the number of rows
+        within the table, or None where no estimate is available.
+
+        This is used by ``alembic plan``; dialects read estimates from
+        the statistics within their catalog, rather than by counting rows.
+        By default, no estimates are available.
+
+        .. versionadded:: 1.0.8
+
+        """
+        return dict((table, None) for table in tables)
+
+    def use_schema(self, schema):
+        """Emit the statement which makes the given schema the one in which
+        unqualified names are found and created, or if None, restores that
+        of the connection.
+
+        This is used for each schema given to
+        :paramref:`.EnvironmentContext.configure.tenant_schemas`.
+
+        .. versionadded:: 1.0.8
+
+        """
+        raise util.CommandError(
+            "Running migrations per schema is not supported for dialect %s"
+            % self.dialect.name
+        )
+
     def render_type(self, type_obj, autogen_context):
         return False
 
@@ -453,3 +692,68 @@ _type_comparators = {
     sqltypes.Integer: _integer_compare,
     sqltypes.DateTime: _datetime_compare,
 }
+
+
+def _offline_cache_key(construct):
+    # a key for constructs whose compiled form is determined entirely by
+    # plain values, or None if the construct can't be cached
+    if isinstance(construct, sqla_compat.TextClause):
+        if not construct._bindparams:
+            return (sqla_compat.TextClause, construct.text)
+    elif isinstance(construct, base.AlterTable):
+        key = [type(construct)]
+        for name, value in sorted(vars(construct).items()):
+            if isinstance(value, schema.Column):
+                value = _column_key(construct, value)
+            else:
+                value = _attributes_key(value)
+            if value is None:
+                return None
+            key.append((name, value))
+        return tuple(key)
+    return None
+
+
+def _column_key(construct, column):
+    # only the name of a dropped column is rendered; an added column is
+    # keyed only if it's rendered from its name, type and nullability
+    if isinstance(construct, base.DropColumn):
+        return _attributes_key(column.name)
+    elif not isinstance(construct, base.AddColumn) or (
+        column.primary_key
+        or column.autoincrement is True
+        or column.default is not None
+        or column.server_default is not None
+        or column.constraints
+        or column.foreign_keys
+        or column.dialect_kwargs
+        or getattr(column, "comment", None) is not None
+        or getattr(column, "system", False)
+    ):
+        return None
+    type_ = _attributes_key(column.type)
+    if type_ is None:
+        return None
+    return (
+        _attributes_key(column.name),
+        column.is_literal,
+        type_,
+        column.nullable,
+    )
+
+
+def _attributes_key(value):
+    # a key for a plain value, or for a type made up of plain values,
+    # such as String(50); None if there isn't one
+    if isinstance(value, sqltypes.TypeEngine):
+        key = [type(value)]
+        for name, attr in sorted(vars(value).items()):
+            attr = _attributes_key(attr)
+            if attr is None:
+                return None
+            key.append((name, attr))
+        return tuple(key)
+    elif value is None or isinstance(value, string_types + (bool, int)):
+        return (type(value), value, getattr(value, "quote", None))
+    else:
+        return None
@@ -38,6 +38,14 @@ class MSSQLImpl(DefaultImpl):
             self.static_output(self.batch_separator)
         return result
 
+    def supports_autocommit(self):
+        # pyodbc and pymssql accept AUTOCOMMIT apart from the isolation
+        # levels of the dialect
+        return (
+            self.dialect.driver in ("pyodbc", "pymssql")
+            or super(MSSQLImpl, self).supports_autocommit()
+        )
+
     def emit_begin(self):
         self.static_output("BEGIN TRANSACTION" + self.command_terminator)
 
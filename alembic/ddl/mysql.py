@@ -1,6 +1,14 @@
+import math
 import re
 
+from sqlalchemy import Column
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
 from sqlalchemy import schema
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import Table
 from sqlalchemy import types as sqltypes
 from sqlalchemy.ext.compiler import compiles
 
@@ -100,6 +108,48 @@ class MySQLImpl(DefaultImpl):
                 )
             )
 
+    def table_row_estimates(self, tables):
+        tables = list(tables)
+        if not tables:
+            return {}
+        default_schema = self.connection.scalar(select([func.database()]))
+        info = Table(
+            "tables",
+            MetaData(),
+            Column("table_schema", String),
+            Column("table_name", String),
+            Column("table_rows", Integer),
+            schema="information_schema",
+        )
+        query = (
+            select([info.c.table_schema, info.c.table_name, info.c.table_rows])
+            .where(info.c.table_name.in_(set(name for schema, name in tables)))
+            .where(
+                info.c.table_schema.in_(
+                    set(schema or default_schema for schema, name in tables)
+                )
+            )
+        )
+        estimates = dict(
+            ((schema, name), rows)
+            for schema, name, rows in self.connection.execute(query)
+        )
+        return dict(
+            ((schema, name), estimates.get((schema or default_schema, name)))
+            for schema, name in tables
+        )
+
+    def set_lock_timeout(self, timeout):
+        # whole seconds; lock_wait_timeout applies to the metadata locks
+        # taken by DDL, innodb_lock_wait_timeout to row locks
+        timeout = max(1, int(math.ceil(timeout)))
+        self._exec("SET SESSION lock_wait_timeout = %d" % timeout)
+        self._exec("SET SESSION innodb_lock_wait_timeout = %d" % timeout)
+
+    def is_lock_timeout(self, err):
+        # ER_LOCK_WAIT_TIMEOUT
+        return bool(err.orig.args) and err.orig.args[0] == 1205
+
     def drop_constraint(self, const):
         if isinstance(const, schema.CheckConstraint) and _is_type_bound(const):
             return
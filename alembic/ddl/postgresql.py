@@ -1,12 +1,24 @@
 import logging
 import re
+import sys
 
+from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import exc as sqla_exc
+from sqlalchemy import Float
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
 from sqlalchemy import Numeric
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import Table
 from sqlalchemy import text
 from sqlalchemy import types as sqltypes
 from sqlalchemy.dialects.postgresql import BIGINT
 from sqlalchemy.dialects.postgresql import INTEGER
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.schema import DropIndex
 from sqlalchemy.sql.expression import ColumnClause
 from sqlalchemy.sql.expression import UnaryExpression
 from sqlalchemy.types import NULLTYPE
@@ -22,6 +34,7 @@ from .base import RenameTable
 from .impl import DefaultImpl
 from .. import util
 from ..autogenerate import render
+from ..operations import estimate
 from ..operations import ops
 from ..operations import schemaobj
 from ..operations.base import BatchOperations
@@ -45,6 +58,186 @@ class PostgresqlImpl(DefaultImpl):
             if constraint.name is not None:
                 self.drop_constraint(constraint)
 
+    def create_index(self, index):
+        if not index.dialect_options["postgresql"]["concurrently"]:
+            return super(PostgresqlImpl, self).create_index(index)
+
+        # CREATE INDEX CONCURRENTLY can't run within a transaction, and
+        # leaves an invalid index behind when it fails
+        with self._autocommit_block():
+            if not self.as_sql:
+                self._drop_invalid_index(index)
+            try:
+                self._exec(CreateIndex(index))
+            except sqla_exc.DBAPIError:
+                exc_info = sys.exc_info()
+                if not self.as_sql:
+                    try:
+                        self._drop_invalid_index(index)
+                    except sqla_exc.DBAPIError as err:
+                        log.warning(
+                            "Couldn't drop invalid index %s: %s",
+                            index.name,
+                            err,
+                        )
+                compat.reraise(*exc_info)
+
+    def drop_index(self, index):
+        if not index.dialect_options["postgresql"]["concurrently"]:
+            return super(PostgresqlImpl, self).drop_index(index)
+
+        with self._autocommit_block():
+            self._exec(DropIndex(index))
+
+    def correct_for_autogen_new_index(self, create_index_op):
+        if self.context_opts.get("postgresql_concurrent_indexes"):
+            create_index_op.kw["postgresql_concurrently"] = True
+
+    def _drop_invalid_index(self, index):
+        pg_index = Table(
+            "pg_index",
+            MetaData(),
+            Column("indexrelid", Integer),
+            Column("indisvalid", Boolean),
+            schema="pg_catalog",
+        )
+        pg_class = Table(
+            "pg_class",
+            MetaData(),
+            Column("oid", Integer),
+            Column("relname", String),
+            Column("relnamespace", Integer),
+            schema="pg_catalog",
+        )
+        pg_namespace = Table(
+            "pg_namespace",
+            MetaData(),
+            Column("oid", Integer),
+            Column("nspname", String),
+            schema="pg_catalog",
+        )
+        schema = index.table.schema
+        query = (
+            select([pg_index.c.indisvalid])
+            .select_from(
+                pg_index.join(
+                    pg_class, pg_class.c.oid == pg_index.c.indexrelid
+                ).join(
+                    pg_namespace,
+                    pg_namespace.c.oid == pg_class.c.relnamespace,
+                )
+            )
+            .where(pg_class.c.relname == index.name)
+            .where(
+                pg_namespace.c.nspname
+                == (schema if schema is not None else func.current_schema())
+            )
+        )
+        if self.connection.scalar(query) is False:
+            log.warning(
+                "Dropping invalid index %s left by a failed concurrent build",
+                index.name,
+            )
+            self._exec(DropIndex(index))
+
+    def version_table_schemas(self, version_table, schemas):
+        schemas = list(schemas)
+        if not schemas:
+            return []
+        tables = Table(
+            "tables",
+            MetaData(),
+            Column("table_schema", String),
+            Column("table_name", String),
+            schema="information_schema",
+        )
+        present = set(
+            row[0]
+            for row in self.connection.execute(
+                select([tables.c.table_schema])
+                .where(tables.c.table_name == version_table)
+                .where(tables.c.table_schema.in_(schemas))
+            )
+        )
+        return [schema for schema in schemas if schema in present]
+
+    def table_row_estimates(self, tables):
+        tables = list(tables)
+        if not tables:
+            return {}
+        default_schema = self.connection.scalar(
+            select([func.current_schema()])
+        )
+        pg_namespace = Table(
+            "pg_namespace",
+            MetaData(),
+            Column("oid", Integer),
+            Column("nspname", String),
+            schema="pg_catalog",
+        )
+        pg_class = Table(
+            "pg_class",
+            MetaData(),
+            Column("relname", String),
+            Column("relnamespace", Integer),
+            Column("relkind", String),
+            Column("reltuples", Float),
+            schema="pg_catalog",
+        )
+        query = (
+            select(
+                [
+                    pg_namespace.c.nspname,
+                    pg_class.c.relname,
+                    pg_class.c.reltuples,
+                ]
+            )
+            .select_from(
+                pg_class.join(
+                    pg_namespace, pg_class.c.relnamespace == pg_namespace.c.oid
+                )
+            )
+            .where(pg_class.c.relkind.in_(["r", "p", "m"]))
+            .where(
+                pg_class.c.relname.in_(set(name for schema, name in tables))
+            )
+            .where(
+                pg_namespace.c.nspname.in_(
+                    set(schema or default_schema for schema, name in tables)
+                )
+            )
+        )
+        # reltuples is -1 for a table which has never been analyzed
+        estimates = dict(
+            ((schema, name), int(reltuples) if reltuples >= 0 else None)
+            for schema, name, reltuples in self.connection.execute(query)
+        )
+        return dict(
+            ((schema, name), estimates.get((schema or default_schema, name)))
+            for schema, name in tables
+        )
+
+    def set_lock_timeout(self, timeout):
+        self._exec("SET lock_timeout = %d" % (timeout * 1000))
+
+    def supports_autocommit(self):
+        # the isolation levels of psycopg2 are looked up from the DBAPI
+        # itself, and pg8000 accepts AUTOCOMMIT apart from its levels
+        return self.dialect.driver in ("psycopg2", "psycopg2cffi", "pg8000")
+
+    def is_lock_timeout(self, err):
+        # lock_not_available
+        return getattr(err.orig, "pgcode", None) == "55P03"
+
+    def use_schema(self, schema):
+        if schema is None:
+            self._exec("RESET search_path")
+        else:
+            self._exec(
+                "SET search_path TO %s"
+                % self.dialect.identifier_preparer.quote_schema(schema)
+            )
+
     def compare_server_default(
         self,
         inspector_column,
@@ -445,6 +638,44 @@ if util.sqla_100:
         return _exclude_constraint(constraint, autogen_context, False)
 
 
+estimate.lock_names["postgresql"] = {
+    estimate.EXCLUSIVE: "ACCESS EXCLUSIVE",
+    estimate.SHARED: "SHARE",
+    estimate.ROW: "ROW EXCLUSIVE",
+}
+
+
+@estimate.estimators.dispatch_for(ops.AddColumnOp, "postgresql")
+def _estimate_add_column(operation, dialect):
+    # from PostgreSQL 11, a non-volatile default is stored in the catalog
+    # rather than written into each row
+    if operation.column.server_default is not None and (
+        dialect.server_version_info is None
+        or dialect.server_version_info < (11,)
+    ):
+        return estimate.EXCLUSIVE, estimate.REWRITE
+    return estimate.EXCLUSIVE, estimate.METADATA
+
+
+@estimate.estimators.dispatch_for(ops.CreateIndexOp, "postgresql")
+def _estimate_create_index(operation, dialect):
+    if operation.kw.get("postgresql_concurrently"):
+        return "SHARE UPDATE EXCLUSIVE", estimate.SCAN
+    return estimate.SHARED, estimate.SCAN
+
+
+@estimate.estimators.dispatch_for(ops.DropIndexOp, "postgresql")
+def _estimate_drop_index(operation, dialect):
+    if operation.kw.get("postgresql_concurrently"):
+        return "SHARE UPDATE EXCLUSIVE", estimate.METADATA
+    return estimate.EXCLUSIVE, estimate.METADATA
+
+
+@estimate.estimators.dispatch_for(ops.CreateForeignKeyOp, "postgresql")
+def _estimate_create_foreign_key(operation, dialect):
+    return "SHARE ROW EXCLUSIVE", estimate.SCAN
+
+
 def _postgresql_autogenerate_prefix(autogen_context):
 
     imports = autogen_context.imports
@@ -0,0 +1,374 @@
+"""Upgrade many databases, or schemas within a database, which share the
+same migration scripts.
+
+.. versionadded:: 1.0.8
+
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
+import time
+
+from sqlalchemy import engine_from_config
+
+from . import util
+from .config import Config
+from .operations import Operations
+from .runtime.environment import EnvironmentContext
+from .runtime.migration import MigrationContext
+from .script import ScriptDirectory
+
+log = logging.getLogger(__name__)
+
+
+class TargetResult(object):
+    """The outcome of upgrading a single target within
+    :func:`.upgrade_fleet`.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    CURRENT = "current"
+    """Status of a target which was already at the destination revision,
+    and so had no migrations run."""
+
+    UPGRADED = "upgraded"
+    """Status of a target which was upgraded."""
+
+    FAILED = "failed"
+    """Status of a target for which the version check or the upgrade
+    raised an error."""
+
+    def __init__(
+        self, target, status, from_heads=(), to_heads=(), elapsed=0, error=None
+    ):
+        self.target = target
+        self.status = status
+        self.from_heads = from_heads
+        self.to_heads = to_heads
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return "TargetResult(%r, %r)" % (self.target, self.status)
+
+    def to_dict(self):
+        """Return a dictionary of the result, suitable for JSON."""
+
+        return {
+            "target": self.target,
+            "status": self.status,
+            "from": list(self.from_heads),
+            "to": list(self.to_heads),
+            "elapsed": self.elapsed,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+def upgrade_fleet(
+    config,
+    targets,
+    revision="heads",
+    workers=4,
+    tag=None,
+    version_table="alembic_version",
+):
+    """Upgrade each of the given targets to the given revision, returning
+    a list of :class:`.TargetResult`, one for each target in the order
+    given.
+
+    Each target is either a database URL, recognized by containing
+    ``://``, or otherwise the name of a schema within the database of the
+    ``sqlalchemy.url`` of the configuration.  The migration scripts and
+    their :class:`.RevisionMap` are loaded once and shared by all
+    targets, and targets are upgraded concurrently by a pool of
+    ``workers`` threads.  Connections are drawn from one
+    :class:`~sqlalchemy.engine.Engine` per database URL, so that targets
+    which are schemas of the same database share one connection pool;
+    the pool should allow at least ``workers`` connections, which may be
+    configured using the ``sqlalchemy.pool_size`` option.
+
+    For each target, the version table is first checked, using the
+    table named by ``version_table`` within the schema of the target,
+    if any; the version tables of all schema targets are checked
+    together, using
+    :meth:`.MigrationContext.get_current_heads_for_schemas`.  Targets
+    already at the destination revision are skipped;
+    others are upgraded by running ``env.py`` with the
+    :class:`.Config` of the target.  This :class:`.Config` shares the
+    parsed configuration file and :class:`.ScriptDirectory` of the given
+    one, and has within :attr:`.Config.attributes` the
+    :class:`~sqlalchemy.engine.Connection` to use as ``"connection"``,
+    the target as ``"target"``, and, for schema targets, the schema name
+    as ``"schema"``.  ``env.py`` should use the connection in place of
+    creating its own engine, and for schema targets, configure the
+    context to use the schema, as the ``generic`` template does::
+
+        schema = config.attributes.get("schema", None)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            version_table_schema=schema,
+        )
+
+        with context.begin_transaction():
+            if schema is not None:
+                context.get_context().impl.use_schema(schema)
+            context.run_migrations()
+            if schema is not None:
+                context.get_context().impl.use_schema(None)
+
+    The ``use_schema()`` method of the dialect implementation quotes the
+    schema name as needed; dialects other than PostgreSQL don't support
+    schema targets, and raise an error.
+
+    The heads of each target which is upgraded are reported as found
+    by the :class:`.MigrationContext` configured within ``env.py``, such
+    that they reflect the version table ``env.py`` makes use of.
+
+    A failure of one target is recorded within its result, and does not
+    prevent other targets from being upgraded.
+
+    :param config: a :class:`.Config` instance.
+
+    :param targets: a sequence of database URLs and/or schema names.
+
+    :param revision: string revision target.
+
+    :param workers: the number of targets to upgrade at once.
+
+    :param tag: an arbitrary "tag" that can be intercepted by custom
+     ``env.py`` scripts via the :meth:`.EnvironmentContext.get_tag_argument`
+     method.
+
+    :param version_table: the name of the version table which ``env.py``
+     configures, checked before each target is upgraded.  If None, as
+     when the name isn't known ahead of time, targets aren't checked, and
+     ``env.py`` is run for every target.
+
+    .. versionadded:: 1.0.8
+
+    """
+    targets = list(targets)
+    script = ScriptDirectory.from_config(config)
+    try:
+        destination = frozenset(
+            rev.revision for rev in script.get_revisions(revision)
+        )
+    except util.CommandError:
+        # e.g. a relative revision, which depends on the current version
+        destination = None
+
+    engines = _EngineSet(config)
+    if version_table is not None:
+        known_heads = _schema_heads(
+            engines,
+            [target for target in targets if "://" not in target],
+            version_table,
+        )
+    else:
+        known_heads = {}
+
+    def upgrade_target(target):
+        start = time.time()
+        result = TargetResult(target, TargetResult.FAILED)
+        try:
+            _upgrade_target(
+                config,
+                script,
+                engines,
+                target,
+                revision,
+                destination,
+                tag,
+                version_table,
+                known_heads.get(target),
+                result,
+            )
+        except Exception as err:
+            log.error("Upgrade of %s failed", target, exc_info=sys.exc_info())
+            result.status = TargetResult.FAILED
+            result.error = err
+        result.elapsed = time.time() - start
+        return result
+
+    pool = ThreadPool(max(1, min(workers or 1, len(targets) or 1)))
+    try:
+        with EnvironmentContext._thread_local_proxies():
+            with Operations._thread_local_proxies():
+                return pool.map(upgrade_target, targets, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+        engines.dispose()
+
+
+def _upgrade_target(
+    config,
+    script,
+    engines,
+    target,
+    revision,
+    destination,
+    tag,
+    version_table,
+    known_heads,
+    result,
+):
+    if "://" in target:
+        url, schema = target, None
+    else:
+        url, schema = None, target
+
+    if known_heads is not None:
+        result.from_heads = known_heads
+        if destination is not None and set(known_heads) == destination:
+            result.status = TargetResult.CURRENT
+            result.to_heads = known_heads
+            return
+
+    with engines.connect(url) as connection:
+        if known_heads is None and version_table is not None:
+            result.from_heads = _current_heads(
+                connection, schema, version_table
+            )
+            if (
+                destination is not None
+                and set(result.from_heads) == destination
+            ):
+                result.status = TargetResult.CURRENT
+                result.to_heads = result.from_heads
+                return
+
+        target_config = Config(
+            file_=config.config_file_name,
+            ini_section=config.config_ini_section,
+            output_buffer=config.output_buffer,
+            stdout=config.stdout,
+            cmd_opts=config.cmd_opts,
+            config_args=config.config_args,
+        )
+        # share the parsed configuration file and the loaded revisions
+        target_config.__dict__["file_config"] = config.file_config
+        target_config._script_directory = script
+        target_config.attributes.update(config.attributes)
+        target_config.attributes.update(
+            connection=connection, target=target, schema=schema
+        )
+
+        upgraded = _upgrade(target_config, script, revision, tag)
+        if upgraded is not None:
+            # the version table of the context configured by env.py
+            result.from_heads, context = upgraded
+            result.to_heads = _current_heads(
+                connection, context.version_table_schema, context.version_table
+            )
+        elif version_table is not None:
+            result.to_heads = _current_heads(connection, schema, version_table)
+        else:
+            # env.py didn't run migrations
+            result.to_heads = result.from_heads
+
+        if result.to_heads == result.from_heads:
+            result.status = TargetResult.CURRENT
+        else:
+            result.status = TargetResult.UPGRADED
+
+
+def _upgrade(config, script, revision, tag):
+    # as command.upgrade(), where env.py may be run within several threads
+    # at once; older Pythons register the module in sys.modules by name
+    # while it runs, so each thread's is named distinctly.  Returns the
+    # heads before the upgrade along with the MigrationContext which
+    # env.py configured, or None if env.py didn't run migrations
+    if ":" in revision:
+        raise util.CommandError("Range revision not allowed")
+
+    contexts = []
+
+    def upgrade(rev, context):
+        contexts.append((rev, context))
+        return script._upgrade_revs(revision, rev)
+
+    with EnvironmentContext(
+        config, script, fn=upgrade, destination_rev=revision, tag=tag
+    ):
+        util.load_python_file(
+            script.dir,
+            "env.py",
+            "env_py_%d" % threading.current_thread().ident,
+        )
+
+    if not contexts:
+        return None
+    heads, context = contexts[0]
+    return tuple(heads), context
+
+
+def _schema_heads(engines, schemas, version_table):
+    # the heads of all the schema targets, queried together up front so
+    # that those already current are skipped without a connection each
+    if not schemas:
+        return {}
+    try:
+        with engines.connect(None) as connection:
+            context = MigrationContext.configure(
+                connection, opts={"version_table": version_table}
+            )
+            return context.get_current_heads_for_schemas(schemas)
+    except Exception:
+        # reported for each target as it is checked individually
+        log.warning(
+            "Couldn't check the versions of all schemas at once",
+            exc_info=sys.exc_info(),
+        )
+        return {}
+
+
+def _current_heads(connection, schema, version_table):
+    context = MigrationContext.configure(
+        connection,
+        opts={"version_table": version_table, "version_table_schema": schema},
+    )
+    return context.get_current_heads()
+
+
+class _EngineSet(object):
+    # one Engine per database URL, created on first use from the
+    # configuration's section and shared among the pool's threads
+
+    def __init__(self, config):
+        self.config = config
+        self.engines = {}
+        self._lock = threading.Lock()
+
+    def connect(self, url):
+        with self._lock:
+            engine = self.engines.get(url)
+            if engine is None:
+                engine = self.engines[url] = self._create_engine(url)
+        return engine.connect()
+
+    def _create_engine(self, url):
+        connection = self.config.attributes.get("connection", None)
+        if url is None and connection is not None:
+            # an Engine passed in by the caller, e.g. "alembic serve"
+            return connection
+
+        section = dict(self.config.get_section(self.config.config_ini_section))
+        if url is not None:
+            section["sqlalchemy.url"] = url
+        elif not section.get("sqlalchemy.url"):
+            raise util.CommandError(
+                "No sqlalchemy.url is configured for schema targets"
+            )
+        return engine_from_config(section, prefix="sqlalchemy.")
+
+    def dispose(self):
+        connection = self.config.attributes.get("connection", None)
+        for engine in self.engines.values():
+            if engine is not connection:
+                engine.dispose()
+        self.engines.clear()
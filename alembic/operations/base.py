@@ -339,6 +339,8 @@ class Operations(util.ModuleClsProxy):
         .. versionadded:: 0.8.0
 
         """
+        if self.migration_context._operation_hook is not None:
+            self.migration_context._operation_hook(operation)
         fn = self._to_impl.dispatch(
             operation, self.migration_context.impl.__dialect__
         )
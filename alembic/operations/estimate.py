@@ -0,0 +1,146 @@
+"""Estimate the locks taken and the work done by migration operations.
+
+Estimators are registered per :class:`.MigrateOperation` subclass, and
+optionally per dialect name, using :data:`.estimators`; each is passed the
+operation and the :class:`~sqlalchemy.engine.interfaces.Dialect` in use,
+and returns a tuple of the lock taken upon the table the operation acts
+upon, or None if no lock is taken on an existing table, and the effect of
+the operation on that table, being one of :data:`.METADATA`,
+:data:`.SCAN`, :data:`.REWRITE`, :data:`.DATA` or :data:`.UNKNOWN`.
+
+The estimators registered here use generic lock names, ``"exclusive"``
+for a lock which blocks reads and writes, ``"shared"`` for one which
+blocks writes and ``"row"`` for row-level locks.  Dialects may give the
+names their database uses for these within :data:`.lock_names`, and
+register estimators of their own for operations which differ.
+
+.. versionadded:: 1.0.8
+
+"""
+from sqlalchemy import types as sqltypes
+
+from . import ops
+from .. import util
+from ..util.compat import string_types
+
+METADATA = "metadata"
+"""The operation changes only the catalog, regardless of the number of
+rows in the table."""
+
+SCAN = "scan"
+"""The operation reads every row of the table, e.g. to build an index or
+to validate a constraint."""
+
+REWRITE = "rewrite"
+"""The operation rewrites every row of the table."""
+
+DATA = "data"
+"""The operation inserts, updates or deletes rows."""
+
+UNKNOWN = "unknown"
+"""The effect of the operation can't be determined."""
+
+EXCLUSIVE = "exclusive"
+SHARED = "shared"
+ROW = "row"
+
+estimators = util.Dispatcher()
+
+lock_names = {}
+"""A dictionary of dialect names to dictionaries of the generic lock
+names to those of the dialect."""
+
+
+def estimate_operation(operation, dialect):
+    """Return a tuple of the lock taken and the effect of the given
+    :class:`.MigrateOperation` upon the given dialect."""
+
+    lock, effect = estimators.dispatch(operation, dialect.name)(
+        operation, dialect
+    )
+    return lock_names.get(dialect.name, {}).get(lock, lock), effect
+
+
+@estimators.dispatch_for(ops.MigrateOperation)
+def _unknown(operation, dialect):
+    return None, UNKNOWN
+
+
+@estimators.dispatch_for(ops.CreateTableOp)
+def _create_table(operation, dialect):
+    return None, METADATA
+
+
+@estimators.dispatch_for(ops.DropTableOp)
+@estimators.dispatch_for(ops.AlterTableOp)
+@estimators.dispatch_for(ops.DropIndexOp)
+@estimators.dispatch_for(ops.DropConstraintOp)
+def _metadata(operation, dialect):
+    return EXCLUSIVE, METADATA
+
+
+@estimators.dispatch_for(ops.AddColumnOp)
+def _add_column(operation, dialect):
+    if operation.column.server_default is not None:
+        # the default is written into every existing row
+        return EXCLUSIVE, REWRITE
+    return EXCLUSIVE, METADATA
+
+
+@estimators.dispatch_for(ops.AlterColumnOp)
+def _alter_column(operation, dialect):
+    if operation.modify_type is not None and not _widens(operation):
+        return EXCLUSIVE, REWRITE
+    elif operation.modify_nullable is False:
+        # existing rows are checked for NULL
+        return EXCLUSIVE, SCAN
+    else:
+        return EXCLUSIVE, METADATA
+
+
+@estimators.dispatch_for(ops.CreateIndexOp)
+def _create_index(operation, dialect):
+    return SHARED, SCAN
+
+
+@estimators.dispatch_for(ops.AddConstraintOp)
+def _add_constraint(operation, dialect):
+    # existing rows are validated against the constraint
+    return EXCLUSIVE, SCAN
+
+
+@estimators.dispatch_for(ops.BulkInsertOp)
+def _bulk_insert(operation, dialect):
+    return ROW, DATA
+
+
+@estimators.dispatch_for(ops.ExecuteSQLOp)
+def _execute(operation, dialect):
+    from ..runtime.metrics import _ddl_re
+    from ..runtime.metrics import _dml_re
+
+    sqltext = operation.sqltext
+    if not isinstance(sqltext, string_types):
+        sqltext = getattr(sqltext, "text", "")
+    if _dml_re.match(sqltext):
+        return ROW, DATA
+    elif _ddl_re.match(sqltext):
+        return EXCLUSIVE, UNKNOWN
+    else:
+        return None, UNKNOWN
+
+
+def _widens(operation):
+    # a change to a string type of the same kind with at least the
+    # existing length, which databases generally apply to the catalog only
+    existing, new = operation.existing_type, operation.modify_type
+    if isinstance(existing, type):
+        existing = existing()
+    if isinstance(new, type):
+        new = new()
+    return (
+        isinstance(existing, sqltypes.String)
+        and type(new) is type(existing)
+        and existing.length is not None
+        and (new.length is None or new.length >= existing.length)
+    )
@@ -0,0 +1,262 @@
+"""Plan an upgrade before running it, estimating the locks taken and the
+rows read or rewritten by each operation of the pending migrations.
+
+.. versionadded:: 1.0.8
+
+"""
+import io
+import re
+
+from .operations import Operations
+from .operations import ops
+from .operations.estimate import estimate_operation
+from .operations.estimate import METADATA
+from .operations.estimate import REWRITE
+from .operations.estimate import SCAN
+from .runtime.metrics import _statement_table
+from .runtime.migration import MigrationContext
+from .util.compat import string_types
+
+
+class PlannedOperation(object):
+    """An operation which a pending migration would invoke, within a
+    :class:`.PlannedStep`.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    def __init__(self, operation, table, schema, lock, effect):
+        self.operation = operation
+        """The :class:`.MigrateOperation`."""
+
+        self.name = _operation_name(operation)
+        """The name of the operation, e.g. ``"add_column"``."""
+
+        self.table = table
+        """The name of the table the operation acts upon, if known."""
+
+        self.schema = schema
+        """The schema of :attr:`.table`, if given."""
+
+        self.lock = lock
+        """The lock the operation takes on :attr:`.table`, as named by
+        the database, or None."""
+
+        self.effect = effect
+        """The effect of the operation on the rows of :attr:`.table`; one
+        of the effects within :mod:`alembic.operations.estimate`, such as
+        ``"rewrite"``."""
+
+        self.rows = None
+        """The estimated number of rows within :attr:`.table` before the
+        migrations run, from the statistics of the database; zero for a
+        table created by an earlier operation of the plan, and None if no
+        estimate is available."""
+
+        self.sql = ""
+        """The SQL the operation renders in "offline" mode."""
+
+    @property
+    def cost(self):
+        """The estimated number of rows the operation reads or writes, or
+        None if unknown."""
+
+        if self.effect == METADATA:
+            return 0
+        elif self.effect in (SCAN, REWRITE):
+            return self.rows
+        elif isinstance(self.operation, ops.BulkInsertOp):
+            return len(self.operation.rows)
+        else:
+            return None
+
+    def to_dict(self):
+        """Return a dictionary of the operation, suitable for JSON."""
+
+        return {
+            "operation": self.name,
+            "table": self.table,
+            "schema": self.schema,
+            "lock": self.lock,
+            "effect": self.effect,
+            "rows": self.rows,
+            "cost": self.cost,
+            "sql": self.sql,
+        }
+
+
+class PlannedStep(object):
+    """A pending migration step within the result of
+    :func:`.plan_upgrade`.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    def __init__(self, step):
+        self.step = step
+        """The :class:`.MigrationStep`."""
+
+        self.operations = []
+        """The :class:`.PlannedOperation` objects of the operations which
+        the step invokes, in order."""
+
+        self.error = None
+        """The exception raised by the ``upgrade()`` function, if any, in
+        which case :attr:`.operations` includes only those invoked before
+        it was raised."""
+
+    @property
+    def cost(self):
+        """The total :attr:`.PlannedOperation.cost` of the operations of
+        the step whose cost is known."""
+
+        return sum(op.cost for op in self.operations if op.cost is not None)
+
+    def to_dict(self):
+        """Return a dictionary of the step, suitable for JSON."""
+
+        return {
+            "from": list(self.step.from_revisions_no_deps),
+            "to": list(self.step.to_revisions_no_deps),
+            "description": self.step.short_log,
+            "error": str(self.error) if self.error is not None else None,
+            "operations": [op.to_dict() for op in self.operations],
+        }
+
+
+def plan_upgrade(context, script, revision, heads=None):
+    """Return a list of :class:`.PlannedStep`, one for each migration
+    step which upgrading the database of the given "online"
+    :class:`.MigrationContext` to the given revision would run.
+
+    The ``upgrade()`` function of each step is run against a
+    :class:`.MigrationContext` in "offline" mode for the dialect of the
+    given one, so that the operations it invokes are recorded rather than
+    run; the SQL each renders is kept along with it.  An ``upgrade()``
+    function which depends upon the results of queries, or which expects
+    arguments from ``env.py``, may raise; the error is recorded within
+    the :class:`.PlannedStep`.
+
+    Each operation is estimated using
+    :func:`alembic.operations.estimate.estimate_operation`, and the
+    number of rows within the tables the operations act upon is
+    estimated from the statistics of the database, using the
+    ``table_row_estimates()`` method of the dialect implementation.
+
+    :param context: an "online" :class:`.MigrationContext`.
+
+    :param script: the :class:`.ScriptDirectory`.
+
+    :param revision: string revision target.
+
+    :param heads: the current heads of the database; if not given,
+     these are read from the version table.
+
+    .. versionadded:: 1.0.8
+
+    """
+    if heads is None:
+        heads = context.get_current_heads()
+    planner = _Planner(context.dialect)
+    planned = [
+        planner.plan_step(step)
+        for step in script._upgrade_revs(revision, heads)
+    ]
+    _estimate_rows(context, planned)
+    return planned
+
+
+class _Planner(object):
+    # records the operations of each step, as invoked against an
+    # "offline" context through MigrationContext._operation_hook
+
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.buf = io.StringIO()
+        self.context = MigrationContext.configure(
+            dialect=dialect, opts={"as_sql": True, "output_buffer": self.buf}
+        )
+        self.context._operation_hook = self._operation
+        self._step = self._last = None
+
+    def plan_step(self, step):
+        self._step = PlannedStep(step)
+        self._last = None
+        with Operations.context(self.context):
+            try:
+                step.migration_fn()
+            except Exception as err:
+                self._step.error = err
+        self._flush()
+        return self._step
+
+    def _operation(self, operation):
+        self._flush()
+        lock, effect = estimate_operation(operation, self.dialect)
+        schema, table = _operation_table(operation)
+        self._last = PlannedOperation(operation, table, schema, lock, effect)
+        self._step.operations.append(self._last)
+
+    def _flush(self):
+        # SQL rendered since the previous operation belongs to it
+        sql = self.buf.getvalue()
+        self.buf.seek(0)
+        self.buf.truncate()
+        if self._last is not None:
+            self._last.sql += sql
+
+
+def _estimate_rows(context, planned):
+    created = set()
+    existing = {}
+    for step in planned:
+        for op in step.operations:
+            if op.table is None:
+                continue
+            key = (op.schema, op.table)
+            if isinstance(op.operation, ops.CreateTableOp):
+                created.add(key)
+            if key in created:
+                op.rows = 0
+            else:
+                existing.setdefault(key, []).append(op)
+    if existing:
+        estimates = context.impl.table_row_estimates(list(existing))
+        for key, table_ops in existing.items():
+            for op in table_ops:
+                op.rows = estimates.get(key)
+
+
+def _operation_name(operation):
+    name = type(operation).__name__
+    if name.endswith("Op"):
+        name = name[:-2]
+    return re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name).lower()
+
+
+def _operation_table(operation):
+    # the (schema, name) of the table an operation acts upon
+    if isinstance(operation, ops.CreateForeignKeyOp):
+        return operation.kw.get("source_schema"), operation.source_table
+    elif isinstance(operation, (ops.BulkInsertOp, ops.ExecuteSQLOp)):
+        if isinstance(operation, ops.BulkInsertOp):
+            table = operation.table
+        else:
+            table = getattr(operation.sqltext, "table", None)
+        if table is not None:
+            return getattr(table, "schema", None), table.name
+        sqltext = operation.sqltext
+        if not isinstance(sqltext, string_types):
+            sqltext = getattr(sqltext, "text", "")
+        name = _statement_table(sqltext)
+        if name is None:
+            return None, None
+        schema, _, name = name.rpartition(".")
+        return schema or None, name
+    else:
+        return (
+            getattr(operation, "schema", None),
+            getattr(operation, "table_name", None),
+        )
@@ -0,0 +1,256 @@
+"""Profile Alembic commands, breaking down the time taken by phase.
+
+.. versionadded:: 1.0.8
+
+"""
+from contextlib import contextmanager
+import cProfile
+import functools
+import sys
+import threading
+import time
+import types
+
+from . import util
+from .runtime.migration import MigrationContext
+from .script import ScriptDirectory
+from .script.revision import RevisionMap
+from .util.compat import compat_builtins
+
+
+class CommandProfiler(object):
+    """Time the phases of an Alembic command, and optionally profile it
+    with :mod:`cProfile` and record the time taken by each Python import.
+
+    The phases are:
+
+    * ``config parse`` - reading the ``.ini`` file.
+    * ``script load`` - locating and loading the revision files, and
+      building the :class:`.RevisionMap`.
+    * ``revision resolution`` - resolving revision identifiers and
+      determining the steps to run, within the :class:`.RevisionMap`.
+    * ``env load`` - running ``env.py``, other than the phases above and
+      below, including the modules it imports and connecting to the
+      database.
+    * ``migration run`` - running the migrations, within
+      :meth:`.MigrationContext.run_migrations`.
+    * ``other`` - everything else.
+
+    The time within each phase excludes that of the other phases it
+    encompasses; for example, revisions resolved while the migrations
+    run are counted under ``revision resolution``.  Only the thread
+    which starts the profiler is timed.
+
+    This is used by the ``--profile`` and ``--profile-imports`` options of
+    the ``alembic`` command line::
+
+        alembic --profile upgrade.prof upgrade head
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    phases = (
+        "config parse",
+        "script load",
+        "revision resolution",
+        "env load",
+        "migration run",
+        "other",
+    )
+
+    _timed = (
+        (ScriptDirectory, "from_config", "script load"),
+        (RevisionMap, "_revision_map", "script load"),
+        (RevisionMap, "get_revisions", "revision resolution"),
+        (RevisionMap, "get_revision", "revision resolution"),
+        (RevisionMap, "iterate_revisions", "revision resolution"),
+        (RevisionMap, "filter_for_lineage", "revision resolution"),
+        (RevisionMap, "get_current_head", "revision resolution"),
+        (ScriptDirectory, "run_env", "env load"),
+        (MigrationContext, "run_migrations", "migration run"),
+    )
+
+    def __init__(self, stats_file=None, imports=False):
+        self.stats_file = stats_file
+        self.imports = imports
+        self.times = dict((phase, 0.0) for phase in self.phases)
+        """A dictionary of each phase to the seconds spent within it."""
+
+        self.import_times = {}
+        """A dictionary of each module imported to a tuple of the seconds
+        spent importing it, including and excluding the modules it
+        imports in turn; empty unless ``imports`` is set."""
+
+        self.total = None
+        self._stack = []
+        self._patched = []
+        self._imports = []
+        self._profile = None
+        self._thread = None
+        self._mark = None
+
+    @contextmanager
+    def phase(self, phase):
+        """Count the time within the block towards the given phase."""
+
+        self._enter(phase)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def start(self):
+        """Begin timing, and profiling if a ``stats_file`` was given."""
+
+        self._thread = threading.current_thread()
+        for cls, name, phase in self._timed:
+            self._patch(cls, name, phase)
+        if self.imports:
+            self._original_import = compat_builtins.__import__
+            compat_builtins.__import__ = self._import
+        self._started = self._mark = time.time()
+        if self.stats_file is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        """Stop timing, and write the :mod:`pstats` file, if any."""
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.stats_file)
+        now = time.time()
+        self._charge(now)
+        self.total = now - self._started
+        if self.imports:
+            compat_builtins.__import__ = self._original_import
+        for cls, name, original in reversed(self._patched):
+            setattr(cls, name, original)
+        self._patched[:] = []
+
+    def report(self, out, limit=20):
+        """Write the time taken by each phase and, if recorded, by the
+        ``limit`` slowest imports, to the given file."""
+
+        if self.stats_file is not None:
+            out.write("Profile written to %s\n" % self.stats_file)
+        out.write("%-24s %10s %7s\n" % ("Phase", "Seconds", "%"))
+        for phase in self.phases:
+            out.write(
+                "%-24s %10.3f %6.1f%%\n"
+                % (
+                    phase,
+                    self.times[phase],
+                    self.times[phase] * 100.0 / (self.total or 1),
+                )
+            )
+        out.write("%-24s %10.3f\n" % ("total", self.total))
+
+        if self.imports:
+            out.write("\n%-48s %10s %10s\n" % ("Import", "Cumulative", "Self"))
+            slowest = sorted(
+                self.import_times.items(),
+                key=lambda item: item[1][0],
+                reverse=True,
+            )[:limit]
+            for name, (cumulative, self_time) in slowest:
+                out.write(
+                    "%-48s %10.3f %10.3f\n" % (name, cumulative, self_time)
+                )
+
+    def _charge(self, now):
+        phase = self._stack[-1] if self._stack else "other"
+        self.times[phase] += now - self._mark
+        self._mark = now
+
+    def _enter(self, phase):
+        self._charge(time.time())
+        self._stack.append(phase)
+
+    def _exit(self):
+        self._charge(time.time())
+        self._stack.pop()
+
+    def _patch(self, cls, name, phase):
+        original = cls.__dict__[name]
+        if isinstance(original, classmethod):
+            timed = classmethod(self._timed_fn(original.__func__, phase))
+        elif isinstance(original, util.memoized_property):
+            timed = util.memoized_property(
+                self._timed_fn(original.fget, phase)
+            )
+        else:
+            timed = self._timed_fn(original, phase)
+        setattr(cls, name, timed)
+        self._patched.append((cls, name, original))
+
+    def _timed_fn(self, fn, phase):
+        @functools.wraps(fn)
+        def timed(*arg, **kw):
+            if threading.current_thread() is not self._thread:
+                return fn(*arg, **kw)
+            self._enter(phase)
+            try:
+                result = fn(*arg, **kw)
+            finally:
+                self._exit()
+            if isinstance(result, types.GeneratorType):
+                return self._timed_generator(result, phase)
+            return result
+
+        return timed
+
+    def _timed_generator(self, gen, phase):
+        # time each step of a generator, e.g. iterate_revisions(), as
+        # it's consumed
+        while True:
+            self._enter(phase)
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def _import(self, name, globals_=None, locals_=None, fromlist=(), level=0):
+        module_name = _absolute_name(name, globals_, level)
+        if module_name in sys.modules and fromlist:
+            # "from package import submodule"
+            module = sys.modules[module_name]
+            for item in fromlist:
+                if item != "*" and not hasattr(module, item):
+                    module_name = "%s.%s" % (module_name, item)
+                    break
+        if (
+            module_name in sys.modules
+            or threading.current_thread() is not self._thread
+        ):
+            return self._original_import(
+                name, globals_, locals_, fromlist, level
+            )
+
+        # time spent within imports nested within this one is
+        # subtracted to give the time of this module itself
+        self._imports.append(0.0)
+        start = time.time()
+        try:
+            return self._original_import(
+                name, globals_, locals_, fromlist, level
+            )
+        finally:
+            elapsed = time.time() - start
+            nested = self._imports.pop()
+            if self._imports:
+                self._imports[-1] += elapsed
+            self.import_times[module_name] = (elapsed, elapsed - nested)
+
+
+def _absolute_name(name, globals_, level):
+    if level <= 0 or not globals_:
+        return name
+    package = globals_.get("__package__") or globals_.get("__name__", "")
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    return "%s.%s" % (package, name) if name else package
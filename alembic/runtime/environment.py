@@ -1,6 +1,16 @@
+import collections
+import logging
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
+import types
+
 from .migration import MigrationContext
 from .. import util
 from ..operations import Operations
+from ..util import compat
+
+log = logging.getLogger(__name__)
 
 
 class EnvironmentContext(util.ModuleClsProxy):
@@ -66,7 +76,8 @@ class EnvironmentContext(util.ModuleClsProxy):
 
     """
 
-    _migration_context = None
+    _main_migration_context = None
+    _concurrent = None
 
     config = None
     """An instance of :class:`.Config` representing the
@@ -94,6 +105,19 @@ class EnvironmentContext(util.ModuleClsProxy):
         self.script = script
         self.context_opts = kw
 
+    @property
+    def _migration_context(self):
+        if self._concurrent is not None:
+            return getattr(self._concurrent, "migration_context", None)
+        return self._main_migration_context
+
+    @_migration_context.setter
+    def _migration_context(self, migration_context):
+        if self._concurrent is not None:
+            self._concurrent.migration_context = migration_context
+        else:
+            self._main_migration_context = migration_context
+
     def __enter__(self):
         """Establish a context which provides a
         :class:`.EnvironmentContext` object to
@@ -106,8 +130,12 @@ class EnvironmentContext(util.ModuleClsProxy):
         self._install_proxy()
         return self
 
-    def __exit__(self, *arg, **kw):
-        self._remove_proxy()
+    def __exit__(self, type_, value, traceback):
+        try:
+            if self._migration_context is not None:
+                self._migration_context.close_output(complete=type_ is None)
+        finally:
+            self._remove_proxy()
 
     def is_offline_mode(self):
         """Return True if the current migrations environment
@@ -292,6 +320,8 @@ class EnvironmentContext(util.ModuleClsProxy):
         transactional_ddl=None,
         transaction_per_migration=False,
         output_buffer=None,
+        output_directory=None,
+        output_compression=None,
         starting_rev=None,
         tag=None,
         template_args=None,
@@ -311,6 +341,16 @@ class EnvironmentContext(util.ModuleClsProxy):
         sqlalchemy_module_prefix="sa.",
         user_module_prefix=None,
         on_version_apply=None,
+        coalesce_version_writes=False,
+        offline_workers=None,
+        tenant_schemas=None,
+        step_metrics=False,
+        step_metrics_report=None,
+        statement_profiler=None,
+        slow_statement_threshold=None,
+        lock_timeout=None,
+        lock_retries=None,
+        lock_retry_backoff=None,
         **kw
     ):
         """Configure a :class:`.MigrationContext` within this
@@ -365,6 +405,118 @@ class EnvironmentContext(util.ModuleClsProxy):
 
          .. versionadded:: 0.6.5
 
+        :param coalesce_version_writes: if True, track the movement of
+         heads during a series of migrations in memory, and write only
+         the net change to the version table, once, after the last
+         migration has run, rather than issuing an UPDATE, INSERT or
+         DELETE after each migration.  This reduces the number of round
+         trips to the database for a long series of migrations.
+
+         The version table is only written once if the migrations run
+         within a single transaction which also includes their DDL, that
+         is, ``transactional_ddl`` is in effect,
+         :paramref:`.EnvironmentContext.configure.transaction_per_migration`
+         is not set, and :meth:`.EnvironmentContext.run_migrations` is
+         called within :meth:`.EnvironmentContext.begin_transaction`,
+         so that a failed migration rolls back the version table along
+         with everything else.  Otherwise, the version table is written
+         after each migration as usual.   The heads passed to
+         :paramref:`.EnvironmentContext.configure.on_version_apply`
+         callables are those tracked in memory.
+
+         .. versionadded:: 1.0.8
+
+        :param step_metrics: if True, record the wall time, the number of
+         DDL and DML statements, the number of rows affected and, where
+         each migration runs in a transaction of its own, the time spent
+         in that transaction, for each migration step run by
+         :meth:`.run_migrations`.  These are made available as a
+         :class:`.StepMetrics` object on the :attr:`.MigrationInfo.metrics`
+         attribute of the :class:`.MigrationInfo` passed to
+         :paramref:`.EnvironmentContext.configure.on_version_apply`
+         callables.
+
+         .. versionadded:: 1.0.8
+
+        :param step_metrics_report: path of a file to which a JSON report
+         of the metrics of each step is written at the end of
+         :meth:`.run_migrations`, including when a migration fails;
+         implies :paramref:`.EnvironmentContext.configure.step_metrics`.
+         With :paramref:`.EnvironmentContext.configure.tenant_schemas`,
+         the steps of all schemas are written to the one report, each
+         along with its ``version_table_schema``.
+
+         .. versionadded:: 1.0.8
+
+        :param statement_profiler: if True, record the time taken to
+         compile and to execute each statement run by :meth:`.run_migrations`
+         using a :class:`.StatementProfiler`, which adds up the timings for
+         each revision and each table, and logs the totals of each step.
+         A :class:`.StatementProfiler` subclass or instance may be passed
+         in place of True.  The profiler used is available afterwards as
+         the ``statement_profiler`` attribute of the
+         :class:`.MigrationContext`.  If not given, the
+         ``statement_profiler`` option of the ``alembic.ini`` file is used,
+         which may be ``true`` or the ``module:ClassName`` path of a
+         :class:`.StatementProfiler` subclass.
+
+         .. versionadded:: 1.0.8
+
+        :param slow_statement_threshold: statements which take at least
+         this many seconds are logged as warnings, with the revision which
+         emitted them; implies
+         :paramref:`.EnvironmentContext.configure.statement_profiler`.  If
+         not given, the ``slow_statement_threshold`` option of the
+         ``alembic.ini`` file is used.
+
+         .. versionadded:: 1.0.8
+
+        :param lock_timeout: a number of seconds; when running migrations
+         against a database connection, each statement which waits longer
+         than this to acquire a lock fails, and is retried according to
+         :paramref:`.EnvironmentContext.configure.lock_retries`.  Supported
+         on PostgreSQL and MySQL.  If not given, the ``lock_timeout``
+         option of the ``alembic.ini`` file is used.  See
+         :class:`.LockRetryPolicy`.
+
+         .. versionadded:: 1.0.8
+
+        :param lock_retries: the number of times to retry a statement which
+         times out waiting for a lock, waiting
+         :paramref:`.EnvironmentContext.configure.lock_retry_backoff`
+         seconds before the first retry, and twice as long before each
+         subsequent one, shortened at random by up to half.  A
+         :class:`.LockRetryPolicy` may be passed instead, in which case
+         the other ``lock_`` parameters are ignored.  If not given, the
+         ``lock_retries`` option of the ``alembic.ini`` file is used.
+
+         .. versionadded:: 1.0.8
+
+        :param lock_retry_backoff: the number of seconds to wait before
+         the first retry of a statement; defaults to one.  If not given,
+         the ``lock_retry_backoff`` option of the ``alembic.ini`` file is
+         used.
+
+         .. versionadded:: 1.0.8
+
+        :param offline_workers: when using ``--sql`` to generate SQL
+         scripts, render the ``upgrade()`` or ``downgrade()`` functions of
+         independent branches of the revision graph across a pool of this
+         many worker processes.  Revisions which follow one another with no
+         branch point or merge point in between are rendered in order by
+         a single worker; the output is written in the same order as when
+         rendering serially.  Each worker establishes its own
+         :class:`.MigrationContext` against the same dialect and with
+         the same options; if any option which may concern the rendering of
+         the migrations, or any argument passed to
+         :meth:`.EnvironmentContext.run_migrations`, is other than a plain
+         value, such as a callable, the migrations are rendered serially
+         instead.  Migration scripts should make use only of the ``op``
+         directives and their arguments, and not of state established
+         within ``env.py``.
+
+         .. versionadded:: 1.0.8
+
         :param output_buffer: a file-like object that will be used
          for textual output
          when the ``--sql`` option is used to generate SQL scripts.
@@ -375,6 +527,31 @@ class EnvironmentContext(util.ModuleClsProxy):
          object.
         :param output_encoding: when using ``--sql`` to generate SQL
          scripts, apply this encoding to the string output.
+        :param output_directory: when using ``--sql`` to generate SQL
+         scripts, write the SQL for each migration step to its own file
+         within this directory, rather than to a single output buffer.
+         Files are named in the order they are to be applied, e.g.
+         ``0001_ae1027a6acf.sql``; any SQL emitted before the first step
+         is part of the first file, and that emitted after the last step
+         is part of the last file.  Once the run completes, a
+         ``manifest.json`` file is written to the directory, listing each
+         file in order along with the revisions it represents, a SHA-256
+         checksum of its SQL and whether it begins and/or ends a
+         transaction.  Output is written in ``output_encoding``, which
+         defaults to ``utf-8`` in this mode.  The directory is created if
+         it doesn't exist; existing files of the same names are overwritten,
+         so each call to :meth:`.configure` should be given a
+         different directory.
+
+         .. versionadded:: 1.0.8
+
+        :param output_compression: used with
+         :paramref:`.EnvironmentContext.configure.output_directory`; set to
+         ``"gzip"`` to compress each file, which will be named with a
+         ``.gz`` suffix.  Checksums are of the uncompressed SQL.
+
+         .. versionadded:: 1.0.8
+
         :param literal_binds: when using ``--sql`` to generate SQL
          scripts, pass through the ``literal_binds`` flag to the compiler
          so that any literal values that would ordinarily be bound
@@ -409,6 +586,24 @@ class EnvironmentContext(util.ModuleClsProxy):
          The default is ``'alembic_version'``.
         :param version_table_schema: Optional schema to place version
          table within.
+        :param tenant_schemas: a sequence of schema names, each holding
+         the same set of tables, which :meth:`.run_migrations` migrates in
+         turn upon the same connection, for a database which keeps one
+         schema per tenant.  Each schema is made the default schema for
+         its migrations, on PostgreSQL by emitting ``SET search_path``,
+         and keeps its own version table, as though
+         :paramref:`.EnvironmentContext.configure.version_table_schema`
+         were set to it.  The current heads of all the schemas are
+         queried together before any are migrated, using
+         :meth:`.MigrationContext.get_current_heads_for_schemas`, and
+         schemas which are already at the destination revision are
+         skipped.  Migrations run within the transaction established by
+         :meth:`.begin_transaction`, if any, for all the schemas; use
+         :paramref:`.EnvironmentContext.configure.transaction_per_migration`
+         to commit each migration of each schema separately.
+
+         .. versionadded:: 1.0.8
+
         :param version_table_pk: boolean, whether the Alembic version table
          should use a primary key constraint for the "value" column; this
          only takes effect when the table is first created.
@@ -767,15 +962,30 @@ class EnvironmentContext(util.ModuleClsProxy):
          be placed between each statement when generating offline
          Oracle migrations.  Defaults to ``/``.  Oracle doesn't add a
          semicolon between statements like most other backends.
+        :param postgresql_concurrent_indexes: when True, autogenerate
+         renders indexes added to existing PostgreSQL tables with
+         ``postgresql_concurrently=True``, so that they're built without
+         blocking writes to the table.  Such indexes are created outside of
+         the migration's transaction; see
+         :meth:`.MigrationContext.autocommit_block`.
+
+         .. versionadded:: 1.0.8
 
         """
         opts = self.context_opts
+        if self._concurrent is not None:
+            # each thread of run_concurrently() configures its own context
+            opts = dict(opts)
         if transactional_ddl is not None:
             opts["transactional_ddl"] = transactional_ddl
         if output_buffer is not None:
             opts["output_buffer"] = output_buffer
         elif self.config.output_buffer is not None:
             opts["output_buffer"] = self.config.output_buffer
+        if output_directory is not None:
+            opts["output_directory"] = output_directory
+        if output_compression is not None:
+            opts["output_compression"] = output_compression
         if starting_rev:
             opts["starting_rev"] = starting_rev
         if tag:
@@ -783,6 +993,33 @@ class EnvironmentContext(util.ModuleClsProxy):
         if template_args and "template_args" in opts:
             opts["template_args"].update(template_args)
         opts["transaction_per_migration"] = transaction_per_migration
+        opts["coalesce_version_writes"] = coalesce_version_writes
+        opts["offline_workers"] = offline_workers
+        opts["tenant_schemas"] = tenant_schemas
+        opts["step_metrics"] = step_metrics
+        opts["step_metrics_report"] = step_metrics_report
+        if statement_profiler is None:
+            statement_profiler = self.config.get_main_option(
+                "statement_profiler"
+            )
+        if slow_statement_threshold is None:
+            slow_statement_threshold = self.config.get_main_option(
+                "slow_statement_threshold"
+            )
+            if slow_statement_threshold is not None:
+                slow_statement_threshold = float(slow_statement_threshold)
+        opts["statement_profiler"] = statement_profiler
+        opts["slow_statement_threshold"] = slow_statement_threshold
+        for name, value, type_ in (
+            ("lock_timeout", lock_timeout, float),
+            ("lock_retries", lock_retries, int),
+            ("lock_retry_backoff", lock_retry_backoff, float),
+        ):
+            if value is None:
+                value = self.config.get_main_option(name)
+                if value is not None:
+                    value = type_(value)
+            opts[name] = value
         opts["target_metadata"] = target_metadata
         opts["include_symbol"] = include_symbol
         opts["include_object"] = include_object
@@ -807,6 +1044,8 @@ class EnvironmentContext(util.ModuleClsProxy):
 
         opts.update(kw)
 
+        if self._migration_context is not None:
+            self._migration_context.close_output()
         self._migration_context = MigrationContext.configure(
             connection=connection,
             url=url,
@@ -835,9 +1074,238 @@ class EnvironmentContext(util.ModuleClsProxy):
         first been made available via :meth:`.configure`.
 
         """
+        tenant_schemas = self.get_context().opts.get("tenant_schemas")
+        if tenant_schemas is not None:
+            self._run_tenant_migrations(tenant_schemas, kw)
+            return
+
         with Operations.context(self._migration_context):
             self.get_context().run_migrations(**kw)
 
+    def _run_tenant_migrations(self, schemas, kw):
+        context = self.get_context()
+        schemas = list(schemas)
+        heads_by_schema = context.get_current_heads_for_schemas(schemas)
+
+        destination = None
+        if not context.as_sql and self.get_revision_argument() is not None:
+            try:
+                destination = set(
+                    rev.revision
+                    for rev in self.script.get_revisions(
+                        self.get_revision_argument()
+                    )
+                )
+            except util.CommandError:
+                # e.g. a relative revision, resolved per schema
+                pass
+
+        recorder = context._step_metrics_recorder
+        switched = complete = False
+        try:
+            for schema in schemas:
+                heads = heads_by_schema[schema]
+                if destination is not None and set(heads) == destination:
+                    log.info("Schema %s is up to date", schema)
+                    continue
+
+                log.info("Migrating schema %s", schema)
+                tenant_context = context._for_schema(schema)
+                tenant_context._known_heads = heads
+                if context.as_sql:
+                    context.impl.static_output("-- Schema %s" % schema)
+                context.impl.use_schema(schema)
+                switched = True
+
+                self._migration_context = tenant_context
+                try:
+                    with Operations.context(tenant_context):
+                        tenant_context.run_migrations(**kw)
+                finally:
+                    self._migration_context = context
+            complete = True
+        finally:
+            # the steps of all schemas are written to one report
+            if recorder is not None:
+                recorder.close(complete=complete)
+
+        if switched:
+            context.impl.use_schema(None)
+
+    def run_concurrently(self, fn, args, workers=4):
+        """Call the given function once for each of the given arguments,
+        across a pool of threads, such that the migrations of several
+        databases may be run at the same time.
+
+        Each call to the function takes place within one of up to
+        ``workers`` threads, where :meth:`.configure` establishes a
+        :class:`.MigrationContext` used only by that call, so that
+        :meth:`.run_migrations`, :meth:`.begin_transaction`,
+        :meth:`.execute` and the ``op`` directives within migration
+        scripts act upon the database configured by that call.  The
+        function should therefore make use of its own connection, and
+        in "offline" mode, its own ``output_buffer``.
+
+        If the function is a generator, it is run up until its first
+        ``yield`` for every argument, and is only resumed once all the
+        calls have reached that point; each is resumed within the thread
+        it was started in.  If any call fails, the others are instead
+        resumed with a :class:`.CommandError` raised at the ``yield``.
+        This allows each database's migrations to be committed only if
+        those of every database have succeeded::
+
+            def migrate(name):
+                with engines[name].connect() as connection:
+                    context.configure(connection=connection)
+                    with connection.begin():
+                        context.run_migrations(engine_name=name)
+                        yield
+
+            context.run_concurrently(migrate, engines)
+
+        Once all the calls have completed, if any has failed, a
+        :class:`.CommandError` is raised naming each argument for which
+        the function failed.
+
+        When run as part of the ``revision`` command, where the results of
+        autogenerate for each database are gathered together, the function
+        is instead called for each argument in turn within the current
+        thread.
+
+        .. versionadded:: 1.0.8
+
+        :param fn: a callable, or generator function, accepting a single
+         argument.
+        :param args: a sequence of arguments, such as database names,
+         with which ``fn`` will be called.
+        :param workers: the number of threads to run at once.  Generators
+         waiting at their ``yield`` don't hold onto a thread, however each
+         keeps its connection and transaction open; these should be
+         allowed for by the connection pool of each database.
+
+        """
+        args = list(args)
+        if not args:
+            return
+
+        if "revision_context" in self.context_opts:
+            for arg in args:
+                result = fn(arg)
+                if isinstance(result, types.GeneratorType):
+                    for _ in result:
+                        pass
+            return
+
+        # build the revision map up front, rather than within each thread
+        self.script.get_heads()
+
+        lock = threading.Lock()
+        ready = threading.Event()
+        waiting = [len(args)]
+        failures = []
+        todo = collections.deque(args)
+
+        def fail(arg, exc_info):
+            log.error("Migrations failed for %s", arg, exc_info=exc_info)
+            with lock:
+                failures.append((arg, exc_info))
+
+        def arrive():
+            with lock:
+                waiting[0] -= 1
+                if not waiting[0]:
+                    ready.set()
+
+        def start(arg):
+            # run up until the first yield, returning the generator if any
+            generator = None
+            try:
+                try:
+                    result = fn(arg)
+                    if isinstance(result, types.GeneratorType):
+                        generator = result
+                        next(generator)
+                except StopIteration:
+                    generator = None
+                except Exception:
+                    generator = None
+                    fail(arg, sys.exc_info())
+            finally:
+                arrive()
+            return generator
+
+        def finish(arg, generator):
+            try:
+                if generator is not None:
+                    if failures:
+                        abort = util.CommandError(
+                            "Migrations for %s not completed as those of "
+                            "another failed" % (arg,)
+                        )
+                        try:
+                            generator.throw(abort)
+                        except util.CommandError as err:
+                            if err is not abort:
+                                raise
+                    else:
+                        for _ in generator:
+                            pass
+            except Exception:
+                fail(arg, sys.exc_info())
+            finally:
+                migration_context = self._migration_context
+                if migration_context is not None:
+                    migration_context.close_output(complete=not failures)
+
+        def work(worker):
+            # threads take the name of the argument at hand, for logging
+            thread = threading.current_thread()
+            name = thread.name
+            started = []
+            try:
+                while True:
+                    try:
+                        arg = todo.popleft()
+                    except IndexError:
+                        break
+                    thread.name = str(arg)
+                    generator = start(arg)
+                    started.append((arg, generator, self._migration_context))
+                    # the next argument configures a context of its own
+                    self._migration_context = None
+
+                ready.wait()
+                for arg, generator, migration_context in started:
+                    thread.name = str(arg)
+                    self._migration_context = migration_context
+                    finish(arg, generator)
+            finally:
+                thread.name = name
+                self._migration_context = None
+
+        size = max(1, min(workers or 1, len(args)))
+        pool = ThreadPool(size)
+        with Operations._thread_local_proxies():
+            self._concurrent = threading.local()
+            try:
+                pool.map(work, range(size), chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+                self._concurrent = None
+
+        if failures:
+            compat.raise_from_cause(
+                util.CommandError(
+                    "Migrations failed for %s"
+                    % ", ".join(
+                        "%s (%s)" % (arg, exc_info[1])
+                        for arg, exc_info in failures
+                    )
+                ),
+                failures[0][1],
+            )
+
     def execute(self, sql, execution_options=None):
         """Execute the given SQL using the current change context.
 
@@ -0,0 +1,602 @@
+import collections
+import json
+import logging
+import re
+import time
+
+from sqlalchemy import Constraint
+from sqlalchemy import event
+from sqlalchemy import Index
+from sqlalchemy.sql.expression import TableClause
+
+from .. import util
+from ..ddl.base import AlterTable
+from ..util import sqla_compat
+from ..util.compat import string_types
+
+log = logging.getLogger(__name__)
+
+_ddl_re = re.compile(
+    r"\s*(?:CREATE|ALTER|DROP|TRUNCATE|COMMENT|RENAME|GRANT|REVOKE)\b", re.I
+)
+_dml_re = re.compile(
+    r"\s*(?:INSERT|UPDATE|DELETE|MERGE|UPSERT|REPLACE|COPY)\b", re.I
+)
+_table_re = re.compile(
+    r"\s*(?:(?:CREATE|ALTER|DROP|TRUNCATE)\s+TABLE(?:\s+IF\s+(?:NOT\s+)?"
+    r"EXISTS)?|INSERT\s+INTO|UPDATE|DELETE\s+FROM|"
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+\S+\s+ON)\s+([\w.\"`\[\]]+)",
+    re.I,
+)
+
+
+class StepMetrics(object):
+    """Timings and statement counts recorded for a single migration step,
+    available as :attr:`.MigrationInfo.metrics` when
+    :paramref:`.EnvironmentContext.configure.step_metrics` is set.
+
+    Statements are counted as they are executed on the connection of the
+    :class:`.MigrationContext`, including those executed directly upon
+    it rather than using ``op`` directives, and those which write the
+    version table.  In "offline" mode, statements are counted as they
+    are rendered.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    elapsed = None
+    """Wall time in seconds taken by the ``upgrade()`` or ``downgrade()``
+    function of the step and the update of the version table, not
+    including the beginning or committing of a transaction."""
+
+    transaction_time = None
+    """Wall time in seconds from beginning to committing the transaction
+    of this step, if the step runs within a transaction of its own, as
+    when :paramref:`.EnvironmentContext.configure.transaction_per_migration`
+    is set; otherwise None.
+
+    As :paramref:`.EnvironmentContext.configure.on_version_apply`
+    callbacks are run before the transaction is committed, this is
+    None within the callbacks, and is filled in once the transaction is
+    committed."""
+
+    statements = 0
+    """The total number of statements executed.
+
+    In "offline" mode, the statements of steps rendered ahead of the run
+    by :paramref:`.EnvironmentContext.configure.offline_workers` aren't
+    counted, and this and the other statement counts are None."""
+
+    ddl_statements = 0
+    """The number of statements executed which are DDL, such as
+    ``CREATE``, ``ALTER`` or ``DROP``."""
+
+    dml_statements = 0
+    """The number of statements executed which are DML, such as
+    ``INSERT``, ``UPDATE`` or ``DELETE``."""
+
+    rows_affected = None
+    """The total number of rows affected by DML statements, as reported
+    by the DBAPI; None in "offline" mode."""
+
+    lock_retries = 0
+    """The number of times a statement was retried after timing out
+    waiting for a lock, as configured by
+    :paramref:`.EnvironmentContext.configure.lock_retries`."""
+
+    lock_retry_delay = 0.0
+    """The total number of seconds spent waiting before retrying
+    statements which timed out waiting for a lock."""
+
+    def __init__(self, as_sql=False):
+        if not as_sql:
+            self.rows_affected = 0
+
+    def to_dict(self):
+        """Return a dictionary of the metrics, suitable for JSON."""
+
+        return {
+            "elapsed": self.elapsed,
+            "transaction_time": self.transaction_time,
+            "statements": self.statements,
+            "ddl_statements": self.ddl_statements,
+            "dml_statements": self.dml_statements,
+            "rows_affected": self.rows_affected,
+            "lock_retries": self.lock_retries,
+            "lock_retry_delay": self.lock_retry_delay,
+        }
+
+
+class StepMetricsRecorder(object):
+    """Records :class:`.StepMetrics` for each step run by
+    :meth:`.MigrationContext.run_migrations`, and optionally writes
+    them to a JSON report at the end of the run.
+
+    One recorder is shared by the contexts of all schemas migrated using
+    :paramref:`.EnvironmentContext.configure.tenant_schemas`, so that
+    their steps are written to the same report."""
+
+    def __init__(self, context, report=None):
+        self.context = context
+        self.report = report
+        self.entries = []
+        self.current = None
+        self._started = self._schema = self._impl = None
+        self._step_started = self._transaction_started = None
+
+    def begin_run(self, context):
+        """Start recording the statements of the given
+        :class:`.MigrationContext`."""
+
+        if self._started is None:
+            self._started = time.time()
+        self._schema = context.version_table_schema
+        self._impl = context.impl
+        if context.as_sql:
+            context.impl._statement_hook = self._offline_statement
+        else:
+            context.impl._lock_retry_hook = self._lock_retry
+            event.listen(
+                context.connection,
+                "after_cursor_execute",
+                self._after_cursor_execute,
+            )
+
+    def end_run(self, context):
+        """Stop recording the statements of the given
+        :class:`.MigrationContext`."""
+
+        if context.as_sql:
+            context.impl._statement_hook = None
+        else:
+            context.impl._lock_retry_hook = None
+            event.remove(
+                context.connection,
+                "after_cursor_execute",
+                self._after_cursor_execute,
+            )
+
+    def begin_step(self, step, info):
+        """Begin recording a step, before its transaction, if any."""
+
+        self.current = info.metrics = StepMetrics(self.context.as_sql)
+        self.entries.append((step, info.metrics, self._schema))
+        self._transaction_started = time.time()
+
+    def begin_migration(self):
+        """Note the start of the migration function of the step."""
+
+        self._step_started = time.time()
+
+    def statements_not_counted(self):
+        """Note that the statements of the step can't be counted, as it
+        was rendered ahead of the run by the pool of
+        :paramref:`.EnvironmentContext.configure.offline_workers`."""
+
+        self.current.statements = None
+        self.current.ddl_statements = None
+        self.current.dml_statements = None
+
+    def end_migration(self):
+        """Note the end of the migration function of the step and its
+        version table update."""
+
+        self.current.elapsed = time.time() - self._step_started
+
+    def end_step(self, own_transaction):
+        """Complete the step, after its transaction, if any, is
+        committed."""
+
+        if own_transaction:
+            self.current.transaction_time = (
+                time.time() - self._transaction_started
+            )
+        self.current = None
+
+    def close(self, complete=True):
+        """Write the report, if any."""
+
+        if self.report is not None:
+            with open(self.report, "w") as file_:
+                json.dump(self._report(complete), file_, indent=2)
+                file_.write("\n")
+
+    def _report(self, complete):
+        steps = []
+        for step, metrics, schema in self.entries:
+            entry = {
+                "direction": step.name,
+                "from": list(step.from_revisions_no_deps),
+                "to": list(step.to_revisions_no_deps),
+                "description": step.short_log,
+                "version_table_schema": schema,
+            }
+            entry.update(metrics.to_dict())
+            steps.append(entry)
+        return {
+            "dialect": self.context.dialect.name,
+            "as_sql": self.context.as_sql,
+            "version_table_schema": self.context.version_table_schema,
+            "complete": complete,
+            "elapsed": time.time() - (self._started or time.time()),
+            "steps": steps,
+        }
+
+    def _count(self, statement):
+        metrics = self.current
+        if metrics is None or metrics.statements is None:
+            return None
+        metrics.statements += 1
+        if _ddl_re.match(statement):
+            metrics.ddl_statements += 1
+        elif _dml_re.match(statement):
+            metrics.dml_statements += 1
+            return metrics
+        return None
+
+    def _offline_statement(self, statement):
+        self._count(statement)
+
+    def _lock_retry(self, attempt, delay):
+        if self.current is not None:
+            self.current.lock_retries += 1
+            self.current.lock_retry_delay += delay
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if self._impl._recording_suspended:
+            return
+        metrics = self._count(statement)
+        if metrics is not None and cursor.rowcount > 0:
+            metrics.rows_affected += cursor.rowcount
+
+
+class StatementStats(object):
+    """Totals of the statements recorded by a :class:`.StatementProfiler`
+    for one revision or one table.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    statements = 0
+    """The number of statements."""
+
+    compile_time = 0
+    """Total time in seconds spent compiling the statements."""
+
+    execute_time = 0
+    """Total time in seconds spent executing the statements in the
+    database; always zero in "offline" mode."""
+
+    slowest = None
+    """The text of the slowest statement."""
+
+    slowest_time = 0
+    """The time in seconds taken by the slowest statement."""
+
+    @property
+    def total_time(self):
+        """The total of :attr:`.compile_time` and :attr:`.execute_time`."""
+
+        return self.compile_time + self.execute_time
+
+    def add(self, statement, compile_time, execute_time):
+        """Add a statement to the totals."""
+
+        compile_time = compile_time or 0
+        execute_time = execute_time or 0
+        self.statements += 1
+        self.compile_time += compile_time
+        self.execute_time += execute_time
+        if self.slowest is None or compile_time + execute_time > (
+            self.slowest_time
+        ):
+            self.slowest = statement
+            self.slowest_time = compile_time + execute_time
+
+    def to_dict(self):
+        """Return a dictionary of the totals, suitable for JSON."""
+
+        return {
+            "statements": self.statements,
+            "compile_time": self.compile_time,
+            "execute_time": self.execute_time,
+            "slowest": self.slowest,
+            "slowest_time": self.slowest_time,
+        }
+
+
+class StatementProfiler(object):
+    """Records the time taken to compile and to execute each statement
+    run by :meth:`.MigrationContext.run_migrations`, as configured by
+    :paramref:`.EnvironmentContext.configure.statement_profiler`.
+
+    The time taken by each statement is split into the time spent
+    compiling it to SQL, which for online migrations includes the time
+    spent within SQLAlchemy up until the statement is handed to the
+    DBAPI cursor, and the time spent executing it in the database.
+    Statements taking at least :attr:`.threshold` seconds in total are
+    logged as warnings to the ``alembic.runtime.metrics`` logger, and
+    all statements are added up for the revision whose step emitted
+    them, within :attr:`.revisions`, and for the table they act upon,
+    within :attr:`.tables`.
+
+    Statements are attributed to tables from the construct emitted by an
+    ``op`` directive where possible, and otherwise from the text of the
+    statement; statements whose table can't be determined are counted
+    under None.  Steps rendered by
+    :paramref:`.EnvironmentContext.configure.offline_workers` are not
+    profiled.
+
+    Custom profilers, e.g. ones which send timings to a metrics service,
+    may subclass :class:`.StatementProfiler` and override
+    :meth:`.StatementProfiler.record`.  A profiler keeps track of the step
+    currently running, so a single instance should not be shared by
+    migrations running concurrently.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    max_statement_length = 500
+    """Statements logged as slow are truncated to this many characters."""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+        """Statements taking at least this many seconds are logged; if
+        None, no statements are logged."""
+
+        self.revisions = collections.OrderedDict()
+        """A dictionary of the revision of each step run, or of the
+        revisions joined by an underscore for a merge, to the
+        :class:`.StatementStats` of its statements, in the order run."""
+
+        self.tables = {}
+        """A dictionary of table names, qualified by schema where
+        given, to the :class:`.StatementStats` of their statements."""
+
+        self.revision = None
+        self._table = self._started = self._cursor_started = None
+        self._impl = None
+
+    def begin_run(self, context):
+        """Start profiling the statements of the given
+        :class:`.MigrationContext`."""
+
+        context.impl._statement_profiler = self
+        self._impl = context.impl
+        if not context.as_sql:
+            event.listen(
+                context.connection,
+                "before_cursor_execute",
+                self._before_cursor_execute,
+            )
+            event.listen(
+                context.connection,
+                "after_cursor_execute",
+                self._after_cursor_execute,
+            )
+
+    def end_run(self, context):
+        """Stop profiling the statements of the given
+        :class:`.MigrationContext`, and log the tables whose statements
+        took the longest."""
+
+        context.impl._statement_profiler = None
+        if not context.as_sql:
+            event.remove(
+                context.connection,
+                "before_cursor_execute",
+                self._before_cursor_execute,
+            )
+            event.remove(
+                context.connection,
+                "after_cursor_execute",
+                self._after_cursor_execute,
+            )
+        slowest = sorted(
+            self.tables.items(),
+            key=lambda item: item[1].total_time,
+            reverse=True,
+        )[:5]
+        if slowest:
+            log.info(
+                "Slowest tables: %s",
+                ", ".join(
+                    "%s %.3fs (%d statements)"
+                    % (table, stats.total_time, stats.statements)
+                    for table, stats in slowest
+                ),
+            )
+
+    def begin_step(self, step):
+        """Attribute subsequent statements to the revision of the given
+        :class:`.MigrationStep`."""
+
+        if step.is_upgrade:
+            revisions = step.to_revisions_no_deps
+        else:
+            revisions = step.from_revisions_no_deps
+        self.revision = "_".join(revisions) or "base"
+
+    def end_step(self, step):
+        """Log the totals of the given :class:`.MigrationStep`."""
+
+        stats = self.revisions.get(self.revision)
+        if stats is not None:
+            log.info(
+                "%d statements in %.3fs (%.3fs compiling) for %s",
+                stats.statements,
+                stats.total_time,
+                stats.compile_time,
+                step.short_log,
+            )
+        self.revision = None
+
+    def record(self, statement, table, compile_time, execute_time):
+        """Record a statement.
+
+        :param statement: the SQL text of the statement.
+
+        :param table: the name of the table the statement acts upon,
+         qualified by schema where given, or None.
+
+        :param compile_time: seconds spent compiling the statement, or
+         None if the statement was executed on the connection directly,
+         rather than by an ``op`` directive.
+
+        :param execute_time: seconds spent executing the statement, or
+         None in "offline" mode.
+
+        """
+        if self.revision is not None:
+            stats = self.revisions.get(self.revision)
+            if stats is None:
+                stats = self.revisions[self.revision] = StatementStats()
+            stats.add(statement, compile_time, execute_time)
+        stats = self.tables.get(table)
+        if stats is None:
+            stats = self.tables[table] = StatementStats()
+        stats.add(statement, compile_time, execute_time)
+
+        elapsed = (compile_time or 0) + (execute_time or 0)
+        if self.threshold is not None and elapsed >= self.threshold:
+            if len(statement) > self.max_statement_length:
+                statement = statement[: self.max_statement_length] + "..."
+            log.warning(
+                "Slow statement in %s: %.3fs (%.3fs compiling): %s",
+                self.revision or "migrations",
+                elapsed,
+                compile_time or 0,
+                statement,
+            )
+
+    def to_dict(self):
+        """Return a dictionary of the totals per revision and per table,
+        suitable for JSON."""
+
+        return {
+            "revisions": [
+                dict(stats.to_dict(), revision=revision)
+                for revision, stats in self.revisions.items()
+            ],
+            "tables": [
+                dict(stats.to_dict(), table=table)
+                for table, stats in sorted(
+                    self.tables.items(),
+                    key=lambda item: item[1].total_time,
+                    reverse=True,
+                )
+            ],
+        }
+
+    def _rendered(self, construct, statement, compile_time):
+        # called by DefaultImpl._exec for each statement in "offline" mode
+        self.record(
+            statement,
+            _construct_table(construct) or _statement_table(statement),
+            compile_time,
+            None,
+        )
+
+    def _executing(self, construct):
+        # called by DefaultImpl._exec before executing a construct; the
+        # time until the cursor is invoked is counted as compiling it
+        self._table = _construct_table(construct)
+        self._started = time.time()
+
+    def _executed(self):
+        self._table = self._started = None
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        self._cursor_started = time.time()
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if self._impl._recording_suspended:
+            return
+        now = time.time()
+        if self._started is not None:
+            compile_time = self._cursor_started - self._started
+            # later statements from the same construct, if any, have no
+            # compilation of their own
+            self._started = None
+        else:
+            compile_time = None
+        self.record(
+            statement,
+            self._table or _statement_table(statement),
+            compile_time,
+            now - self._cursor_started,
+        )
+
+
+def _qualified(schema, name):
+    return "%s.%s" % (schema, name) if schema else name
+
+
+def _construct_table(construct):
+    if isinstance(construct, AlterTable):
+        return _qualified(construct.schema, construct.table_name)
+    # CreateTable, CreateIndex, AddConstraint etc. and their drops
+    element = getattr(construct, "element", None)
+    if isinstance(element, Constraint):
+        element = sqla_compat._table_for_constraint(element)
+    elif isinstance(element, Index):
+        element = element.table
+    if element is None:
+        # INSERT, UPDATE, DELETE
+        element = getattr(construct, "table", None)
+    if isinstance(element, TableClause):
+        return _qualified(getattr(element, "schema", None), element.name)
+    return None
+
+
+def _statement_table(statement):
+    match = _table_re.match(statement)
+    if match is None:
+        return None
+    return re.sub(r"[\"`\[\]]", "", match.group(1))
+
+
+def _profiler_for(option, threshold):
+    # the StatementProfiler for the statement_profiler option, which is
+    # True, a StatementProfiler instance or class, or as given within
+    # alembic.ini, "true" or the "module:Class" path of a class
+    if isinstance(option, string_types):
+        if option.lower() in ("true", "false"):
+            option = util.asbool(option)
+        else:
+            option = _import_profiler(option)
+    if not option:
+        if threshold is None:
+            return None
+        option = True
+    if option is True:
+        return StatementProfiler(threshold)
+    elif isinstance(option, type):
+        return option(threshold=threshold)
+    else:
+        return option
+
+
+def _import_profiler(path):
+    module_name, _, name = path.partition(":")
+    if not name:
+        raise util.CommandError(
+            "statement_profiler should be 'true' or the 'module:Class' "
+            "path of a profiler class; got %r" % path
+        )
+    module = __import__(module_name, fromlist=[name])
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise util.CommandError(
+            "Module %s has no profiler %r" % (module_name, name)
+        )
@@ -2,16 +2,24 @@ from contextlib import contextmanager
 import logging
 import sys
 
+from sqlalchemy import bindparam
 from sqlalchemy import Column
-from sqlalchemy import literal_column
+from sqlalchemy import literal
 from sqlalchemy import MetaData
 from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy import select
 from sqlalchemy import String
 from sqlalchemy import Table
+from sqlalchemy import union_all
 from sqlalchemy.engine import Connection
 from sqlalchemy.engine import url as sqla_url
 from sqlalchemy.engine.strategies import MockEngineStrategy
 
+from .metrics import _profiler_for
+from .metrics import StepMetricsRecorder
+from .offline import render_steps_in_pool
+from .offline import RevisionFileWriter
+from .retry import _retry_policy_for
 from .. import ddl
 from .. import util
 from ..util.compat import callable
@@ -67,6 +75,21 @@ class MigrationContext(object):
 
     """
 
+    # called with each MigrateOperation invoked by Operations against
+    # this context; see alembic.plan
+    _operation_hook = None
+
+    # the transaction begun by begin_transaction(), which
+    # autocommit_block() may replace with a new one
+    _transaction = None
+    _in_offline_transaction = False
+
+    # the context a tenant schema's context was made from; see _for_schema
+    _parent_context = None
+
+    # the HeadMaintainer of run_migrations(), while it runs
+    _head_maintainer = None
+
     def __init__(self, dialect, connection, opts, environment_context=None):
         self.environment_context = environment_context
         self.opts = opts
@@ -77,7 +100,30 @@ class MigrationContext(object):
         self._transaction_per_migration = opts.get(
             "transaction_per_migration", False
         )
+        self._coalesce_version_writes = opts.get(
+            "coalesce_version_writes", False
+        )
         self.on_version_apply_callbacks = opts.get("on_version_apply", ())
+        self._offline_workers = opts.get("offline_workers")
+        self._step_metrics_report = opts.get("step_metrics_report")
+        self._step_metrics = (
+            opts.get("step_metrics", False)
+            or self._step_metrics_report is not None
+        )
+        self._step_metrics_recorder = None
+        if self._step_metrics:
+            self._step_metrics_recorder = StepMetricsRecorder(
+                self, self._step_metrics_report
+            )
+        self.statement_profiler = _profiler_for(
+            opts.get("statement_profiler"),
+            opts.get("slow_statement_threshold"),
+        )
+        self.lock_retry_policy = _retry_policy_for(
+            opts.get("lock_timeout"),
+            opts.get("lock_retries"),
+            opts.get("lock_retry_backoff"),
+        )
 
         if as_sql:
             self.connection = self._stdout_connection(connection)
@@ -87,7 +133,19 @@ class MigrationContext(object):
         self._migrations_fn = opts.get("fn")
         self.as_sql = as_sql
 
-        if "output_encoding" in opts:
+        self._revision_file_writer = None
+        if opts.get("output_directory"):
+            if not as_sql:
+                raise util.CommandError(
+                    "output_directory may only be used in offline mode"
+                )
+            self._revision_file_writer = RevisionFileWriter(
+                opts["output_directory"],
+                encoding=opts.get("output_encoding") or "utf-8",
+                compression=opts.get("output_compression"),
+            )
+            self.output_buffer = self._revision_file_writer
+        elif "output_encoding" in opts:
             self.output_buffer = EncodedIO(
                 opts.get("output_buffer") or sys.stdout,
                 opts["output_encoding"],
@@ -119,6 +177,7 @@ class MigrationContext(object):
             )
 
         self._start_from_rev = opts.get("starting_rev")
+        self._known_heads = None
         self.impl = ddl.DefaultImpl.get_by_dialect(dialect)(
             dialect,
             self.connection,
@@ -127,6 +186,8 @@ class MigrationContext(object):
             self.output_buffer,
             opts,
         )
+        self.impl._lock_retry_policy = self.lock_retry_policy
+        self.impl._autocommit_block = self.autocommit_block
         log.info("Context impl %s.", self.impl.__class__.__name__)
         if self.as_sql:
             log.info("Generating static SQL")
@@ -212,12 +273,129 @@ class MigrationContext(object):
             @contextmanager
             def begin_commit():
                 self.impl.emit_begin()
+                self._mark_transaction("begin")
+                self._in_offline_transaction = True
                 yield
+                self._in_offline_transaction = False
                 self.impl.emit_commit()
+                self._mark_transaction("commit")
 
             return begin_commit()
         else:
-            return self.bind.begin()
+            self._transaction = self.bind.begin()
+            return _ProxyTransaction(self)
+
+    def autocommit_block(self):
+        """Return a context manager within which statements run outside
+        of the transaction begun by :meth:`.begin_transaction`, with the
+        connection in "autocommit" mode.
+
+        Some statements, such as PostgreSQL's ``CREATE INDEX
+        CONCURRENTLY``, can't run within a transaction block.  The
+        transaction in progress, if any, is committed at the start of the
+        block, and a new one is begun at the end of it, to be committed
+        or rolled back as the original one would have been.  In "offline"
+        mode, ``COMMIT`` and ``BEGIN`` are emitted instead.  E.g.::
+
+            def upgrade():
+                with op.get_context().autocommit_block():
+                    op.execute("ALTER TYPE mood ADD VALUE 'soso'")
+
+        The PostgreSQL implementation uses this for indexes created or
+        dropped with ``postgresql_concurrently=True``.
+
+        Version table writes deferred by
+        :paramref:`.EnvironmentContext.configure.coalesce_version_writes`
+        are written before the transaction is committed.  A transaction
+        begun directly upon the connection, rather than by
+        :meth:`.begin_transaction`, can't be committed this way, and
+        raises :class:`.CommandError`, as does a dialect without the
+        ``AUTOCOMMIT`` isolation level, before anything is committed.
+
+        .. versionadded:: 1.0.8
+
+        """
+        if (
+            self._head_maintainer is not None
+            and self._head_maintainer.coalesce
+        ):
+            # the version table writes deferred by coalesce_version_writes
+            # are committed along with the steps which preceded the block
+            self._head_maintainer.flush()
+        if (
+            self._parent_context is not None
+            and self._transaction is None
+            and not self._in_offline_transaction
+        ):
+            # a tenant schema's migrations run within the transaction of
+            # the context they were made from
+            return self._parent_context.autocommit_block()
+        return self._autocommit_block()
+
+    @contextmanager
+    def _autocommit_block(self):
+        if self.as_sql:
+            in_transaction = self._in_offline_transaction
+            if in_transaction:
+                self.impl.emit_commit()
+                self._mark_transaction("commit")
+                self._in_offline_transaction = False
+            try:
+                yield
+            finally:
+                if in_transaction:
+                    self.impl.emit_begin()
+                    self._mark_transaction("begin")
+                    self._in_offline_transaction = True
+        else:
+            if not self.impl.supports_autocommit():
+                raise util.CommandError(
+                    "The %s dialect doesn't support the AUTOCOMMIT "
+                    "isolation level" % self.dialect.name
+                )
+            transaction = self._transaction
+            if transaction is not None:
+                transaction.commit()
+                self._transaction = None
+            if self._in_connection_transaction():
+                raise util.CommandError(
+                    "Can't run statements outside of a transaction which "
+                    "wasn't begun by MigrationContext.begin_transaction()"
+                )
+            isolation_level = self.connection.get_isolation_level()
+            self.connection.execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                yield
+            finally:
+                self.connection.execution_options(
+                    isolation_level=isolation_level
+                )
+                if transaction is not None:
+                    self._transaction = self.bind.begin()
+
+    def _mark_transaction(self, boundary):
+        if self._revision_file_writer is not None:
+            self._revision_file_writer.mark_transaction(boundary)
+
+    def close_output(self, complete=True):
+        """Complete the output of an "offline" migration run which
+        writes a file per migration step, as established using the
+        :paramref:`.EnvironmentContext.configure.output_directory`
+        parameter, writing the manifest of those files.
+
+        This is called automatically at the end of an
+        :class:`.EnvironmentContext`; it need only be called when using a
+        :class:`.MigrationContext` directly.  Has no effect otherwise.
+
+        :param complete: if False, the file currently being written is
+         closed but no manifest is written, as when the run has failed.
+
+        .. versionadded:: 1.0.8
+
+        """
+        if self._revision_file_writer is not None:
+            self._revision_file_writer.close(complete=complete)
+            self._revision_file_writer = None
 
     def get_current_revision(self):
         """Return the current revision, usually that which is present
@@ -288,6 +466,115 @@ class MigrationContext(object):
             row[0] for row in self.connection.execute(self._version.select())
         )
 
+    def get_current_heads_for_schemas(self, schemas):
+        """Return a dictionary of each of the given schema names to a tuple
+        of the 'head versions' present in the version table within that
+        schema, as :meth:`.MigrationContext.get_current_heads` returns for
+        a context configured with that schema as its
+        :paramref:`.EnvironmentContext.configure.version_table_schema`.
+
+        The heads of all the schemas are queried together: those schemas
+        which have a version table are found using one query against the
+        catalog, where the dialect supports it, and their versions are
+        selected using one ``UNION ALL`` query for every 500 schemas.
+
+        If this :class:`.MigrationContext` was configured in "offline"
+        mode, the ``starting_rev`` parameter is returned for every schema.
+
+        .. versionadded:: 1.0.8
+
+        """
+        schemas = list(schemas)
+        if self.as_sql:
+            heads = self.get_current_heads()
+            return dict((schema, heads) for schema in schemas)
+
+        result = dict((schema, ()) for schema in schemas)
+        present = self.impl.version_table_schemas(self.version_table, schemas)
+        for idx in range(0, len(present), 500):
+            selects = [
+                select(
+                    [
+                        literal(schema).label("schema_name"),
+                        version.c.version_num,
+                    ]
+                )
+                for schema, version in (
+                    (
+                        schema,
+                        Table(
+                            self.version_table,
+                            MetaData(),
+                            Column("version_num", String(32)),
+                            schema=schema,
+                        ),
+                    )
+                    for schema in present[idx : idx + 500]
+                )
+            ]
+            query = union_all(*selects) if len(selects) > 1 else selects[0]
+            for schema, version_num in self.connection.execute(query):
+                result[schema] += (version_num,)
+        return result
+
+    def _for_schema(self, schema):
+        # a context which migrates the given schema using the same
+        # connection and output as this one; see
+        # EnvironmentContext.configure.tenant_schemas
+        opts = dict(
+            self.opts,
+            version_table_schema=schema,
+            output_buffer=self.output_buffer,
+        )
+        opts.pop("output_directory", None)
+        opts.pop("output_encoding", None)
+        context = MigrationContext(
+            self.dialect,
+            None if self.as_sql else self.connection,
+            opts,
+            self.environment_context,
+        )
+        context._revision_file_writer = self._revision_file_writer
+        context.statement_profiler = self.statement_profiler
+        context._step_metrics_recorder = self._step_metrics_recorder
+        context._parent_context = self
+        return context
+
+    @util.memoized_property
+    def _version_statements(self):
+        """The INSERT, UPDATE and DELETE statements against the version
+        table, with bound parameters ``from_version`` and ``to_version``.
+
+        In online mode these are compiled once against the dialect in use;
+        in offline mode the impl renders them with the version numbers
+        inline, compiling each only once as well.
+
+        """
+        version = self._version
+        if self.as_sql:
+            # offline, the values are placeholders replaced when rendered
+            from_version = bindparam(
+                "from_version", "__alembic_from_version__"
+            )
+            to_version = bindparam("to_version", "__alembic_to_version__")
+        else:
+            from_version = bindparam("from_version")
+            to_version = bindparam("to_version")
+        from_version = version.c.version_num == from_version
+        statements = {
+            "insert": version.insert().values(version_num=to_version),
+            "update": version.update()
+            .values(version_num=to_version)
+            .where(from_version),
+            "delete": version.delete().where(from_version),
+        }
+        if self.as_sql:
+            return statements
+        return dict(
+            (kind, statement.compile(dialect=self.dialect))
+            for kind, statement in statements.items()
+        )
+
     def _ensure_version_table(self):
         self._version.create(self.connection, checkfirst=True)
 
@@ -336,55 +623,134 @@ class MigrationContext(object):
 
         """
         self.impl.start_migrations()
+        policy = self.lock_retry_policy
+        if policy is not None and policy.lock_timeout is not None:
+            self.impl.set_lock_timeout(policy.lock_timeout)
 
-        heads = self.get_current_heads()
+        if self._known_heads is not None:
+            heads = self._known_heads
+        else:
+            heads = self.get_current_heads()
         if not self.as_sql and not heads:
             self._ensure_version_table()
 
-        head_maintainer = HeadMaintainer(self, heads)
-
         starting_in_transaction = (
             not self.as_sql and self._in_connection_transaction()
         )
 
-        for step in self._migrations_fn(heads, self):
-            with self.begin_transaction(_per_migration=True):
-                if self.as_sql and not head_maintainer.heads:
-                    # for offline mode, include a CREATE TABLE from
-                    # the base
-                    self._version.create(self.connection)
-                log.info("Running %s", step)
-                if self.as_sql:
-                    self.impl.static_output(
-                        "-- Running %s" % (step.short_log,)
-                    )
-                step.migration_fn(**kw)
-
-                # previously, we wouldn't stamp per migration
-                # if we were in a transaction, however given the more
-                # complex model that involves any number of inserts
-                # and row-targeted updates and deletes, it's simpler for now
-                # just to run the operations on every version
-                head_maintainer.update_to_step(step)
-                for callback in self.on_version_apply_callbacks:
-                    callback(
-                        ctx=self,
-                        step=step.info,
-                        heads=set(head_maintainer.heads),
-                        run_args=kw,
+        # the net change to the version table is written once at the end,
+        # only if all steps run within a single transaction which also
+        # includes their DDL; otherwise it's written for each step
+        coalesce_run = (
+            self._coalesce_version_writes
+            and not self._transaction_per_migration
+            and self.impl.transactional_ddl
+            and (
+                self._in_offline_transaction
+                if self.as_sql
+                else starting_in_transaction
+            )
+        )
+        head_maintainer = HeadMaintainer(
+            self, heads, coalesce=self._coalesce_version_writes
+        )
+
+        steps = self._migrations_fn(heads, self)
+        rendered = None
+        if self.as_sql and self._offline_workers:
+            steps = list(steps)
+            rendered = render_steps_in_pool(
+                self, steps, self._offline_workers, kw
+            )
+
+        recorder = self._step_metrics_recorder
+        if recorder is not None:
+            recorder.begin_run(self)
+        profiler = self.statement_profiler
+        if profiler is not None:
+            profiler.begin_run(self)
+        own_transaction = (
+            self._transaction_per_migration and self.impl.transactional_ddl
+        )
+        complete = False
+        self._head_maintainer = head_maintainer
+        try:
+            for idx, step in enumerate(steps):
+                info = None
+                if recorder is not None or self.on_version_apply_callbacks:
+                    info = step.info
+                if recorder is not None:
+                    recorder.begin_step(step, info)
+                if profiler is not None:
+                    profiler.begin_step(step)
+                if self._revision_file_writer is not None:
+                    self._revision_file_writer.begin_step(step)
+                with self.begin_transaction(_per_migration=True):
+                    if recorder is not None:
+                        recorder.begin_migration()
+                    if self.as_sql and not head_maintainer.heads:
+                        # for offline mode, include a CREATE TABLE from
+                        # the base
+                        self._version.create(self.connection)
+                    log.info("Running %s", step)
+                    if self.as_sql:
+                        self.impl.static_output(
+                            "-- Running %s" % (step.short_log,)
+                        )
+                    if rendered is not None and idx in rendered:
+                        self.output_buffer.write(rendered[idx])
+                        self.output_buffer.flush()
+                        if recorder is not None:
+                            recorder.statements_not_counted()
+                    else:
+                        step.migration_fn(**kw)
+
+                    # previously, we wouldn't stamp per migration
+                    # if we were in a transaction, however given the more
+                    # complex model that involves any number of inserts
+                    # and row-targeted updates and deletes, it's simpler
+                    # for now just to run the operations on every version
+                    head_maintainer.update_to_step(step)
+                    if head_maintainer.coalesce and not coalesce_run:
+                        head_maintainer.flush()
+                    if recorder is not None:
+                        recorder.end_migration()
+                    for callback in self.on_version_apply_callbacks:
+                        callback(
+                            ctx=self,
+                            step=info,
+                            heads=set(head_maintainer.heads),
+                            run_args=kw,
+                        )
+                if recorder is not None:
+                    recorder.end_step(own_transaction)
+                if profiler is not None:
+                    profiler.end_step(step)
+
+                if (
+                    not starting_in_transaction
+                    and not self.as_sql
+                    and not self.impl.transactional_ddl
+                    and self._in_connection_transaction()
+                ):
+                    raise util.CommandError(
+                        'Migration "%s" has left an uncommitted '
+                        "transaction opened; transactional_ddl is False so "
+                        "Alembic is not committing transactions" % step
                     )
 
-            if (
-                not starting_in_transaction
-                and not self.as_sql
-                and not self.impl.transactional_ddl
-                and self._in_connection_transaction()
-            ):
-                raise util.CommandError(
-                    'Migration "%s" has left an uncommitted '
-                    "transaction opened; transactional_ddl is False so "
-                    "Alembic is not committing transactions" % step
-                )
+            if coalesce_run:
+                head_maintainer.flush()
+            complete = True
+        finally:
+            self._head_maintainer = None
+            if recorder is not None:
+                recorder.end_run(self)
+                if self._parent_context is None:
+                    # that of tenant schemas is written once they're done
+                    recorder.close(complete=complete)
+            if profiler is not None:
+                profiler.end_run(self)
 
         if self.as_sql and not head_maintainer.heads:
             self._version.drop(self.connection)
@@ -495,30 +861,75 @@ class MigrationContext(object):
         )
 
 
+class _ProxyTransaction(object):
+    # returned by MigrationContext.begin_transaction(); completes whichever
+    # transaction is current at the end of the block, as autocommit_block()
+    # replaces the one first begun
+
+    def __init__(self, migration_context):
+        self.migration_context = migration_context
+
+    @property
+    def _proxied_transaction(self):
+        return self.migration_context._transaction
+
+    def rollback(self):
+        self._proxied_transaction.rollback()
+        self.migration_context._transaction = None
+
+    def commit(self):
+        self._proxied_transaction.commit()
+        self.migration_context._transaction = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if self._proxied_transaction is not None:
+            self._proxied_transaction.__exit__(type_, value, traceback)
+            self.migration_context._transaction = None
+
+
 class HeadMaintainer(object):
-    def __init__(self, context, heads):
+    def __init__(self, context, heads, coalesce=False):
         self.context = context
         self.heads = set(heads)
+        self.coalesce = coalesce
+        self._written_heads = set(heads)
+
+    def flush(self):
+        """Write the difference between the heads last written to the
+        version table and the current heads, when coalescing.
+
+        """
+        removed = sorted(self._written_heads.difference(self.heads))
+        added = sorted(self.heads.difference(self._written_heads))
+        for from_, to_ in zip(removed, added):
+            self._write_update(from_, to_)
+        for version in removed[len(added) :]:
+            self._write_delete(version)
+        for version in added[len(removed) :]:
+            self._write_insert(version)
+        self._written_heads = set(self.heads)
 
     def _insert_version(self, version):
         assert version not in self.heads
         self.heads.add(version)
+        if not self.coalesce:
+            self._write_insert(version)
+            self._written_heads.add(version)
 
-        self.context.impl._exec(
-            self.context._version.insert().values(
-                version_num=literal_column("'%s'" % version)
-            )
-        )
+    def _write_insert(self, version):
+        self._exec_version("insert", to_version=version)
 
     def _delete_version(self, version):
         self.heads.remove(version)
+        if not self.coalesce:
+            self._write_delete(version)
+            self._written_heads.remove(version)
 
-        ret = self.context.impl._exec(
-            self.context._version.delete().where(
-                self.context._version.c.version_num
-                == literal_column("'%s'" % version)
-            )
-        )
+    def _write_delete(self, version):
+        ret = self._exec_version("delete", from_version=version)
         if not self.context.as_sql and ret.rowcount != 1:
             raise util.CommandError(
                 "Online migration expected to match one "
@@ -531,15 +942,13 @@ class HeadMaintainer(object):
         assert to_ not in self.heads
         self.heads.remove(from_)
         self.heads.add(to_)
+        if not self.coalesce:
+            self._write_update(from_, to_)
+            self._written_heads.remove(from_)
+            self._written_heads.add(to_)
 
-        ret = self.context.impl._exec(
-            self.context._version.update()
-            .values(version_num=literal_column("'%s'" % to_))
-            .where(
-                self.context._version.c.version_num
-                == literal_column("'%s'" % from_)
-            )
-        )
+    def _write_update(self, from_, to_):
+        ret = self._exec_version("update", from_version=from_, to_version=to_)
         if not self.context.as_sql and ret.rowcount != 1:
             raise util.CommandError(
                 "Online migration expected to match one "
@@ -548,6 +957,13 @@ class HeadMaintainer(object):
                 % (from_, to_, self.context.version_table, ret.rowcount)
             )
 
+    def _exec_version(self, kind, **params):
+        impl = self.context.impl
+        statement = self.context._version_statements[kind]
+        if impl.as_sql:
+            return impl._exec(statement, inline_params=params)
+        return impl._exec(statement, params=params)
+
     def update_to_step(self, step):
         if step.should_delete_branch(self.heads):
             vers = step.delete_version_num
@@ -651,6 +1067,16 @@ class MigrationInfo(object):
     revision_map = None
     """The revision map inside of which this operation occurs."""
 
+    metrics = None
+    """A :class:`.StepMetrics` object recording the time taken and the
+    statements executed by this step, when
+    :paramref:`.EnvironmentContext.configure.step_metrics` is set;
+    otherwise None.
+
+    .. versionadded:: 1.0.8
+
+    """
+
     def __init__(
         self, revision_map, is_upgrade, is_stamp, up_revisions, down_revisions
     ):
@@ -769,10 +1195,15 @@ class RevisionStep(MigrationStep):
         self.revision_map = revision_map
         self.revision = revision
         self.is_upgrade = is_upgrade
-        if is_upgrade:
-            self.migration_fn = revision.module.upgrade
+
+    @property
+    def migration_fn(self):
+        # the revision's module may not have been imported yet; defer
+        # to when the step is actually run
+        if self.is_upgrade:
+            return self.revision.module.upgrade
         else:
-            self.migration_fn = revision.module.downgrade
+            return self.revision.module.downgrade
 
     def __repr__(self):
         return "RevisionStep(%r, is_upgrade=%r)" % (
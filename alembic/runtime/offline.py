@@ -0,0 +1,348 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+
+from .. import util
+from ..operations import Operations
+from ..util.compat import string_types
+from ..util.compat import text_type
+
+log = logging.getLogger(__name__)
+
+
+class RevisionFileWriter(object):
+    """A file-like target for "offline" SQL output which writes the SQL
+    for each migration step to its own file within a directory.
+
+    Output is written through a buffered file, which is flushed only when
+    the file for a step is complete, rather than for each statement.
+    SQL emitted before the first step, such as a ``BEGIN`` enclosing all
+    the migrations, is written into the file of the first step; SQL emitted
+    after the last step is appended to the file of the last step.
+
+    When closed, a ``manifest.json`` file is written to the directory
+    listing each file in the order it is to be applied, along with the
+    revisions it represents, a SHA-256 checksum of its SQL, and whether
+    it begins and/or ends a transaction.
+
+    """
+
+    manifest_name = "manifest.json"
+    buffer_size = 256 * 1024
+    compressions = {"gzip": ".gz"}
+
+    def __init__(self, directory, encoding="utf-8", compression=None):
+        if compression is not None and compression not in self.compressions:
+            raise util.CommandError(
+                "Unknown output_compression %r; expected one of %s"
+                % (compression, ", ".join(sorted(self.compressions)))
+            )
+        self.directory = directory
+        self.encoding = encoding
+        self.compression = compression
+        self.entries = []
+        self._pending = []
+        self._pending_boundaries = set()
+        self._file = None
+        self._entry = None
+        self._checksum = None
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def write(self, text):
+        if self._file is None:
+            self._pending.append(text)
+            return
+        data = text_type(text).encode(self.encoding)
+        self._checksum.update(data)
+        self._entry["size"] += len(data)
+        self._file.write(data)
+
+    def flush(self):
+        # output is flushed when the file for each step is complete
+        pass
+
+    def begin_step(self, step):
+        """Direct subsequent output to a new file for the given
+        :class:`.MigrationStep`.
+
+        """
+        if step.is_upgrade:
+            revisions = step.to_revisions_no_deps
+        else:
+            revisions = step.from_revisions_no_deps
+        self._open(
+            "_".join(revisions) or "base",
+            {
+                "direction": step.name,
+                "from": list(step.from_revisions_no_deps),
+                "to": list(step.to_revisions_no_deps),
+                "description": step.short_log,
+            },
+        )
+
+    def mark_transaction(self, boundary):
+        """Note that a transaction boundary, either ``"begin"`` or
+        ``"commit"``, was emitted into the current file.
+
+        """
+        if self._file is None:
+            self._pending_boundaries.add(boundary)
+        else:
+            self._entry["transaction"][boundary] = True
+
+    def close(self, complete=True):
+        """Complete the current file and, if ``complete`` is True, write
+        the manifest.
+
+        SQL which was emitted without any step having begun, as when
+        there are no migrations to run, is written to a file of its own.
+
+        """
+        if self._file is None and self._pending:
+            self._open("no_migrations", {"direction": None})
+        self._close_file()
+        if not complete:
+            return
+        manifest = {
+            "encoding": self.encoding,
+            "compression": self.compression,
+            "files": self.entries,
+        }
+        with open(
+            os.path.join(self.directory, self.manifest_name), "w"
+        ) as file_:
+            json.dump(manifest, file_, indent=2, sort_keys=True)
+            file_.write("\n")
+
+    def _open(self, label, info):
+        self._close_file()
+        sequence = len(self.entries) + 1
+        filename = "%04d_%s.sql" % (sequence, label)
+        if self.compression:
+            filename += self.compressions[self.compression]
+        path = os.path.join(self.directory, filename)
+
+        self._file = io.open(path, "wb", buffering=self.buffer_size)
+        if self.compression == "gzip":
+            self._raw_file = self._file
+            self._file = gzip.GzipFile(
+                filename="", mode="wb", fileobj=self._raw_file
+            )
+        else:
+            self._raw_file = None
+        self._checksum = hashlib.sha256()
+        self._entry = dict(
+            info,
+            sequence=sequence,
+            file=filename,
+            size=0,
+            transaction={
+                "begin": "begin" in self._pending_boundaries,
+                "commit": "commit" in self._pending_boundaries,
+            },
+        )
+        self._pending_boundaries.clear()
+        self.entries.append(self._entry)
+
+        pending, self._pending = self._pending, []
+        for text in pending:
+            self.write(text)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.close()
+        if self._raw_file is not None:
+            self._raw_file.close()
+        self._entry["sha256"] = self._checksum.hexdigest()
+        self._file = self._raw_file = self._entry = self._checksum = None
+
+
+# context options which only concern the output or the run as a whole,
+# and are handled by the context running the migrations, or which are
+# used only by autogenerate; these aren't passed on to the workers
+_parent_opts = set(
+    [
+        "output_buffer",
+        "output_directory",
+        "output_compression",
+        "output_encoding",
+        "offline_workers",
+        "fn",
+        "script",
+        "on_version_apply",
+        "starting_rev",
+        "destination_rev",
+        "tag",
+        "transaction_per_migration",
+        "coalesce_version_writes",
+        "tenant_schemas",
+        "step_metrics",
+        "step_metrics_report",
+        "statement_profiler",
+        "slow_statement_threshold",
+        "target_metadata",
+        "include_symbol",
+        "include_object",
+        "include_schemas",
+        "render_as_batch",
+        "render_item",
+        "compare_type",
+        "compare_server_default",
+        "process_revision_directives",
+        "upgrade_token",
+        "downgrade_token",
+        "sqlalchemy_module_prefix",
+        "alembic_module_prefix",
+        "user_module_prefix",
+        "template_args",
+        "revision_context",
+    ]
+)
+
+
+def render_steps_in_pool(context, steps, workers, kw):
+    """Render the SQL of the given migration steps across a pool of
+    worker processes, for a :class:`.MigrationContext` in "offline" mode.
+
+    Steps are grouped into chains of revisions which follow directly
+    from one another with no branching or merging in between; each chain
+    is rendered in order within a single worker, so that independent
+    branches are rendered in parallel.  Returns a dictionary of the index
+    of each :class:`.RevisionStep` within ``steps`` to the SQL it renders,
+    or None if the steps are to be rendered serially instead; that is, if
+    there's nothing to be gained from rendering in a pool, or if the
+    context has options, or the migration functions are given arguments,
+    which can't be passed on to the workers.
+
+    """
+    chains = _independent_chains(steps)
+    if workers is None or workers < 2 or len(chains) < 2:
+        return None
+
+    dialect = context.dialect
+    dialect_name = "%s+%s" % (dialect.name, dialect.driver)
+    opts = dict(
+        (key, value)
+        for key, value in context.opts.items()
+        if key not in _parent_opts
+    )
+    for key, value in list(opts.items()) + list(kw.items()):
+        if not _is_plain_value(value):
+            log.info(
+                "Option %r can't be passed on to offline workers; "
+                "rendering serially",
+                key,
+            )
+            return None
+
+    processes = min(workers, len(chains))
+    pool = multiprocessing.Pool(processes)
+    try:
+        rendered = pool.map(
+            _render_chain,
+            [
+                (
+                    dialect_name,
+                    opts,
+                    kw,
+                    [
+                        (steps[idx].revision.path, steps[idx].is_upgrade)
+                        for idx in chain
+                    ],
+                )
+                for chain in chains
+            ],
+        )
+    finally:
+        pool.terminate()
+        pool.join()
+
+    result = {}
+    for chain, texts in zip(chains, rendered):
+        result.update(zip(chain, texts))
+    return result
+
+
+def _is_plain_value(value):
+    if value is None or isinstance(value, string_types + (bool, int, float)):
+        return True
+    elif isinstance(value, (tuple, list)):
+        return all(_is_plain_value(elem) for elem in value)
+    elif isinstance(value, dict):
+        return all(
+            isinstance(key, string_types) and _is_plain_value(elem)
+            for key, elem in value.items()
+        )
+    else:
+        return False
+
+
+def _independent_chains(steps):
+    # group the indexes of RevisionSteps into chains, where each step
+    # is the only one to follow directly from the previous step, and
+    # follows directly only from that step
+    from .migration import RevisionStep
+
+    positions = {}
+    for idx, step in enumerate(steps):
+        if isinstance(step, RevisionStep):
+            positions[step.revision.revision] = idx
+
+    previous = {}
+    following = dict((idx, 0) for idx in positions.values())
+    for rev_id, idx in positions.items():
+        revision = steps[idx].revision
+        before = [
+            positions[related]
+            for related in revision._all_down_revisions
+            + tuple(revision._all_nextrev)
+            if related in positions and positions[related] < idx
+        ]
+        previous[idx] = before
+        for prev in before:
+            following[prev] += 1
+
+    chains = []
+    chain_of = {}
+    for idx in sorted(positions.values()):
+        before = previous[idx]
+        if len(before) == 1 and following[before[0]] == 1:
+            chain = chain_of[before[0]]
+        else:
+            chain = []
+            chains.append(chain)
+        chain.append(idx)
+        chain_of[idx] = chain
+    return chains
+
+
+def _render_chain(args):
+    # runs within a worker process of render_steps_in_pool; renders the
+    # upgrade() or downgrade() of each revision file in turn, returning
+    # the SQL of each
+    from .migration import MigrationContext
+
+    dialect_name, opts, kw, revisions = args
+    buf = io.StringIO()
+    opts = dict(opts, as_sql=True, output_buffer=buf)
+    context = MigrationContext.configure(dialect_name=dialect_name, opts=opts)
+
+    rendered = []
+    with Operations.context(context):
+        for path, is_upgrade in revisions:
+            module = util.load_python_file(*os.path.split(path))
+            if is_upgrade:
+                module.upgrade(**kw)
+            else:
+                module.downgrade(**kw)
+            rendered.append(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+    return rendered
@@ -0,0 +1,85 @@
+import random
+import time
+
+from .. import util
+
+
+class LockRetryPolicy(object):
+    """Limits how long each statement run by the migrations waits for a
+    lock, and retries statements which time out waiting for one.
+
+    On a busy database, DDL such as ``ALTER TABLE`` may queue behind a
+    long running transaction while holding up all other queries against
+    the table.  With a ``lock_timeout`` the statement instead fails
+    quickly, and is retried after a delay which doubles with each
+    attempt, up to ``max_backoff`` seconds, and is shortened at random by
+    up to ``jitter`` of itself, so that the migration proceeds once the
+    lock can be taken.
+
+    The lock timeout is set using the ``set_lock_timeout()`` method of
+    the dialect implementation when :meth:`.MigrationContext.run_migrations`
+    begins, and applies for the remainder of the connection's session;
+    errors are recognized as lock timeouts by its ``is_lock_timeout()``
+    method.  PostgreSQL and MySQL are supported.
+
+    Where the statement runs within a transaction, and the database
+    supports transactional DDL, each attempt runs within a SAVEPOINT so
+    that it may be rolled back on its own; these statements aren't
+    counted by :class:`.StepMetrics` nor profiled.  Locks taken by earlier
+    statements of the transaction are held while waiting to retry, so
+    :paramref:`.EnvironmentContext.configure.transaction_per_migration`
+    is recommended along with this policy.
+
+    A policy is set up using the
+    :paramref:`.EnvironmentContext.configure.lock_timeout` and
+    :paramref:`.EnvironmentContext.configure.lock_retries` parameters,
+    and is available as the ``lock_retry_policy`` attribute of the
+    :class:`.MigrationContext`.  The number of retries of each step is
+    recorded in :attr:`.StepMetrics.lock_retries`.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    def __init__(
+        self,
+        lock_timeout=None,
+        retries=3,
+        backoff=1.0,
+        max_backoff=60.0,
+        jitter=0.5,
+    ):
+        if retries < 0:
+            raise util.CommandError("lock_retries may not be negative")
+        if not 0 <= jitter <= 1:
+            raise util.CommandError("jitter should be between 0 and 1")
+        self.lock_timeout = lock_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """Return the number of seconds to wait before the given retry of
+        a statement, counting from 1."""
+
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+    def sleep(self, seconds):
+        """Wait for the given number of seconds before a retry."""
+
+        time.sleep(seconds)
+
+
+def _retry_policy_for(lock_timeout, retries, backoff):
+    if isinstance(retries, LockRetryPolicy):
+        return retries
+    if lock_timeout is None and not retries:
+        return None
+    kw = {}
+    if backoff is not None:
+        kw["backoff"] = backoff
+    return LockRetryPolicy(
+        lock_timeout=lock_timeout, retries=retries or 0, **kw
+    )
@@ -1,12 +1,15 @@
 from contextlib import contextmanager
 import datetime
+import multiprocessing
 import os
 import re
 import shutil
+import threading
 
 from dateutil import tz
 
 from . import revision
+from .index import ScriptIndex
 from .. import util
 from ..runtime import migration
 from ..util import compat
@@ -18,6 +21,8 @@ _mod_def_re = re.compile(r"(upgrade|downgrade)_([a-z0-9]+)")
 _slug_re = re.compile(r"\w+")
 _default_file_template = "%(rev)s_%(slug)s"
 _split_on_space_comma = re.compile(r",|(?: +)")
+_revision_index_file = ".alembic_revision_index"
+_module_load_lock = threading.Lock()
 
 
 class ScriptDirectory(object):
@@ -50,6 +55,10 @@ class ScriptDirectory(object):
         sourceless=False,
         output_encoding="utf-8",
         timezone=None,
+        revision_index=False,
+        lazy_revisions=False,
+        revision_load_workers=None,
+        lineage_index=False,
     ):
         self.dir = dir
         self.file_template = file_template
@@ -57,8 +66,13 @@ class ScriptDirectory(object):
         self.truncate_slug_length = truncate_slug_length or 40
         self.sourceless = sourceless
         self.output_encoding = output_encoding
-        self.revision_map = revision.RevisionMap(self._load_revisions)
+        self.revision_map = revision.RevisionMap(
+            self._load_revisions, lineage_index=lineage_index
+        )
         self.timezone = timezone
+        self.revision_index = revision_index
+        self.lazy_revisions = lazy_revisions
+        self.revision_load_workers = revision_load_workers
 
         if not os.access(dir, os.F_OK):
             raise util.CommandError(
@@ -95,7 +109,13 @@ class ScriptDirectory(object):
         else:
             paths = [self.versions]
 
+        if self.revision_index:
+            index = ScriptIndex(self._revision_index_path, self.sourceless)
+        else:
+            index = None
+
         dupes = set()
+        files = []
         for vers in paths:
             for file_ in Script._list_py_dir(self, vers):
                 path = os.path.realpath(os.path.join(vers, file_))
@@ -106,10 +126,80 @@ class ScriptDirectory(object):
                     )
                     continue
                 dupes.add(path)
-                script = Script._from_filename(self, vers, file_)
-                if script is None:
-                    continue
-                yield script
+                files.append((vers, file_))
+
+        if self.revision_load_workers and self.revision_load_workers > 1:
+            scripts = self._load_scripts_in_pool(files, index)
+        else:
+            scripts = (
+                Script._from_filename(self, vers, file_, index)
+                for vers, file_ in files
+            )
+
+        for script in scripts:
+            if script is None:
+                continue
+            yield script
+
+        if index is not None:
+            index.save()
+
+    def _load_scripts_in_pool(self, files, index):
+        """Produce a list of :class:`.Script` objects for the given
+        revision files, importing or parsing those files that aren't
+        present in the index across a pool of worker processes.
+
+        Only the header of each script is passed back from the workers;
+        the modules themselves are loaded on demand within this process.
+        The resulting list is in the same order as ``files``.
+
+        """
+        scripts = [None] * len(files)
+        pending = []
+        for idx, (dir_, filename) in enumerate(files):
+            if not Script._is_revision_file(self, dir_, filename):
+                continue
+            path = os.path.join(dir_, filename)
+            header = index.get(path) if index is not None else None
+            if header is not None:
+                scripts[idx] = Script(
+                    None, header["revision"], path, header=header
+                )
+            else:
+                pending.append(idx)
+
+        if len(pending) < 2:
+            for idx in pending:
+                dir_, filename = files[idx]
+                scripts[idx] = Script._from_filename(
+                    self, dir_, filename, index
+                )
+            return scripts
+
+        processes = min(self.revision_load_workers, len(pending))
+        pool = multiprocessing.Pool(processes)
+        try:
+            headers = pool.map(
+                _load_header_from_file,
+                [files[idx] + (self.lazy_revisions,) for idx in pending],
+                chunksize=max(1, len(pending) // (processes * 4)),
+            )
+        finally:
+            pool.terminate()
+            pool.join()
+
+        for idx, header in zip(pending, headers):
+            path = os.path.join(*files[idx])
+            if index is not None:
+                index.set(path, header)
+            scripts[idx] = Script(
+                None, header["revision"], path, header=header
+            )
+        return scripts
+
+    @property
+    def _revision_index_path(self):
+        return os.path.join(os.path.abspath(self.dir), _revision_index_file)
 
     @classmethod
     def from_config(cls, config):
@@ -120,6 +210,11 @@ class ScriptDirectory(object):
         present.
 
         """
+        if config._script_directory is not None:
+            # an existing ScriptDirectory kept by a long running process,
+            # e.g. "alembic serve"
+            return config._script_directory
+
         script_location = config.get_main_option("script_location")
         if script_location is None:
             raise util.CommandError(
@@ -129,6 +224,10 @@ class ScriptDirectory(object):
         if truncate_slug_length is not None:
             truncate_slug_length = int(truncate_slug_length)
 
+        revision_load_workers = config.get_main_option("revision_load_workers")
+        if revision_load_workers is not None:
+            revision_load_workers = int(revision_load_workers)
+
         version_locations = config.get_main_option("version_locations")
         if version_locations:
             version_locations = _split_on_space_comma.split(version_locations)
@@ -143,6 +242,10 @@ class ScriptDirectory(object):
             output_encoding=config.get_main_option("output_encoding", "utf-8"),
             version_locations=version_locations,
             timezone=config.get_main_option("timezone"),
+            revision_index=config.get_main_option("revision_index") == "true",
+            lazy_revisions=config.get_main_option("lazy_revisions") == "true",
+            revision_load_workers=revision_load_workers,
+            lineage_index=config.get_main_option("lineage_index") == "true",
         )
 
     @contextmanager
@@ -682,29 +785,68 @@ class Script(revision.Revision):
 
     """
 
-    def __init__(self, module, rev_id, path):
-        self.module = module
+    __slots__ = {
+        "path": """Filesystem path of the script.""",
+        "_db_current_indicator": """Utility variable which when set will
+        cause string output to indicate this is a "current" version in some
+        database""",
+        "_module": None,
+        "_longdoc": None,
+    }
+
+    def __init__(self, module, rev_id, path, header=None):
         self.path = path
+        self._module = module
+        self._db_current_indicator = None
+        if header is None:
+            header = _header_from_module(module, rev_id)
+        self._longdoc = header["doc"]
         super(Script, self).__init__(
             rev_id,
-            module.down_revision,
-            branch_labels=util.to_tuple(
-                getattr(module, "branch_labels", None), default=()
-            ),
-            dependencies=util.to_tuple(
-                getattr(module, "depends_on", None), default=()
-            ),
+            header["down_revision"],
+            branch_labels=util.to_tuple(header["branch_labels"], default=()),
+            dependencies=util.to_tuple(header["depends_on"], default=()),
         )
 
-    module = None
-    """The Python module representing the actual script itself."""
+    @property
+    def module(self):
+        """The Python module representing the actual script itself.
+
+        When the :class:`.Script` was produced without importing the
+        module, such as from a revision index, the module is imported on
+        first access.
+
+        .. seealso::
+
+            :meth:`.Script.release_module`
 
-    path = None
-    """Filesystem path of the script."""
+        """
+        if self._module is None:
+            # migrations may be run within several threads at once
+            with _module_load_lock:
+                if self._module is None:
+                    dir_, filename = os.path.split(self.path)
+                    self._module = util.load_python_file(dir_, filename)
+        return self._module
+
+    @module.setter
+    def module(self, module):
+        self._module = module
+
+    def release_module(self):
+        """Release the Python module for this :class:`.Script`, if it has
+        been imported.
+
+        The header information of the script remains available; the
+        module is imported again if :attr:`.Script.module` is subsequently
+        accessed.   This allows a long-running process which holds onto
+        a :class:`.ScriptDirectory` to free the modules of scripts it has
+        finished running.
+
+        .. versionadded:: 1.0.8
 
-    _db_current_indicator = None
-    """Utility variable which when set will cause string output to indicate
-    this is a "current" version in some database"""
+        """
+        self._module = None
 
     @property
     def doc(self):
@@ -716,13 +858,7 @@ class Script(revision.Revision):
     def longdoc(self):
         """Return the docstring given in the script."""
 
-        doc = self.module.__doc__
-        if doc:
-            if hasattr(self.module, "_alembic_source_encoding"):
-                doc = doc.decode(self.module._alembic_source_encoding)
-            return doc.strip()
-        else:
-            return ""
+        return self._longdoc
 
     @property
     def log_entry(self):
@@ -857,14 +993,32 @@ class Script(revision.Revision):
             return os.listdir(path)
 
     @classmethod
-    def _from_filename(cls, scriptdir, dir_, filename):
+    def _from_filename(cls, scriptdir, dir_, filename, index=None):
+        if not cls._is_revision_file(scriptdir, dir_, filename):
+            return None
+
+        path = os.path.join(dir_, filename)
+        if index is not None:
+            header = index.get(path)
+            if header is not None:
+                return Script(None, header["revision"], path, header=header)
+
+        module, header = cls._load_header(
+            dir_, filename, scriptdir.lazy_revisions
+        )
+        if index is not None:
+            index.set(path, header)
+        return Script(module, header["revision"], path, header=header)
+
+    @classmethod
+    def _is_revision_file(cls, scriptdir, dir_, filename):
         if scriptdir.sourceless:
             py_match = _sourceless_rev_file.match(filename)
         else:
             py_match = _only_source_rev_file.match(filename)
 
         if not py_match:
-            return None
+            return False
 
         py_filename = py_match.group(1)
 
@@ -882,7 +1036,23 @@ class Script(revision.Revision):
             # source encoding; prefer .pyc over .pyo because we'd like to
             # have the docstrings which a -OO file would not have
             if py_exists or is_o and pyc_exists:
-                return None
+                return False
+
+        return True
+
+    @classmethod
+    def _load_header(cls, dir_, filename, lazy=False):
+        """Return a tuple of the module and the header for a revision file.
+
+        When ``lazy`` is set and the header can be determined by parsing
+        the file's source, the module is not imported and is returned
+        as None.
+
+        """
+        if lazy:
+            header = cls._header_from_source(dir_, filename)
+            if header is not None:
+                return None, header
 
         module = util.load_python_file(dir_, filename)
 
@@ -902,4 +1072,64 @@ class Script(revision.Revision):
                 revision = m.group(1)
         else:
             revision = module.revision
-        return Script(module, revision, os.path.join(dir_, filename))
+
+        return module, _header_from_module(module, revision)
+
+    @classmethod
+    def _header_from_source(cls, dir_, filename):
+        """Produce the header of a revision file by parsing its source,
+        or return None if the header values can't be determined without
+        running the module.
+
+        """
+        literals = util.parse_module_literals(
+            dir_,
+            filename,
+            ("revision", "down_revision", "branch_labels", "depends_on"),
+        )
+        if literals is None or "down_revision" not in literals:
+            return None
+
+        if "revision" in literals:
+            revision = literals["revision"]
+        else:
+            m = _legacy_rev.match(filename)
+            if not m:
+                return None
+            revision = m.group(1)
+
+        doc = literals["__doc__"]
+        return {
+            "revision": revision,
+            "down_revision": literals["down_revision"],
+            "branch_labels": literals.get("branch_labels"),
+            "depends_on": literals.get("depends_on"),
+            "doc": doc.strip() if doc else "",
+        }
+
+
+def _load_header_from_file(args):
+    # runs within a worker process of ScriptDirectory._load_scripts_in_pool;
+    # only the header, which is picklable, is returned to the parent
+    dir_, filename, lazy = args
+    return Script._load_header(dir_, filename, lazy)[1]
+
+
+def _header_from_module(module, revision):
+    return {
+        "revision": revision,
+        "down_revision": module.down_revision,
+        "branch_labels": getattr(module, "branch_labels", None),
+        "depends_on": getattr(module, "depends_on", None),
+        "doc": _longdoc_from_module(module),
+    }
+
+
+def _longdoc_from_module(module):
+    doc = module.__doc__
+    if doc:
+        if hasattr(module, "_alembic_source_encoding"):
+            doc = doc.decode(module._alembic_source_encoding)
+        return doc.strip()
+    else:
+        return ""
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from .. import util
+
+log = logging.getLogger(__name__)
+
+_index_format_version = 1
+
+
+class ScriptIndex(object):
+    """Maintains an on-disk record of the header information present
+    in each revision file.
+
+    The :class:`.ScriptIndex` stores, for each revision file, the
+    ``revision``, ``down_revision``, ``branch_labels``, ``depends_on``
+    and docstring of the script, along with the ``mtime``, size and
+    SHA1 digest of the file.   When the file's stat information is
+    unchanged, or the file's digest matches that of the stored entry, a
+    :class:`.Script` is produced directly from the stored entry without
+    the module being imported.   Files which are new or have changed are
+    imported as usual and their entries refreshed.
+
+    The index is consulted by :class:`.ScriptDirectory` when the
+    ``revision_index`` configuration option is enabled.  An index file that
+    can't be read, or that was written by an incompatible version of the
+    format, is ignored and regenerated in full.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    def __init__(self, path, sourceless=False):
+        self.path = path
+        self.sourceless = sourceless
+        self._entries = self._read()
+        self._loaded = {}
+        self._modified = False
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as file_:
+                data = json.load(file_)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != _index_format_version
+            or data.get("sourceless") != self.sourceless
+            or not isinstance(data.get("entries"), dict)
+        ):
+            log.info("Discarding incompatible revision index %s", self.path)
+            return {}
+        return data["entries"]
+
+    def get(self, path):
+        """Return the header entry for the given revision file path,
+        if a current one is present; else return None.
+
+        """
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        if entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            # stat is different; compare the contents before
+            # giving up on the entry, as tools such as VCS checkouts
+            # often touch files without changing them
+            if entry["sha1"] != _file_digest(path):
+                return None
+            entry = dict(entry, mtime=stat.st_mtime, size=stat.st_size)
+            self._modified = True
+
+        self._loaded[path] = entry
+        return _header_from_entry(entry)
+
+    def set(self, path, header):
+        """Establish a new header entry for the given revision file path."""
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self._loaded[path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha1": _file_digest(path),
+            "revision": header["revision"],
+            "down_revision": _list_or_none(header["down_revision"]),
+            "branch_labels": _list_or_none(header["branch_labels"]),
+            "depends_on": _list_or_none(header["depends_on"]),
+            "doc": header["doc"],
+        }
+        self._modified = True
+
+    def save(self):
+        """Write the entries that were consulted or established since this
+        :class:`.ScriptIndex` was loaded.
+
+        Entries for files that are no longer present are dropped.  The file
+        is written atomically; failure to write the index, such as within a
+        read-only filesystem, is logged and otherwise ignored.
+
+        """
+        if not self._modified and set(self._loaded) == set(self._entries):
+            return
+
+        data = {
+            "version": _index_format_version,
+            "sourceless": self.sourceless,
+            "entries": self._loaded,
+        }
+        dir_ = os.path.dirname(self.path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=dir_, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file_:
+                    json.dump(data, file_, sort_keys=True)
+                _rename(tmp_path, self.path)
+            except:
+                os.unlink(tmp_path)
+                raise
+        except (IOError, OSError) as err:
+            log.info("Could not write revision index %s: %s", self.path, err)
+        else:
+            self._entries = self._loaded
+            self._loaded = {}
+            self._modified = False
+
+
+def _rename(src, dest):
+    try:
+        os.rename(src, dest)
+    except OSError:
+        # win32 won't rename over an existing file
+        if not os.path.exists(dest):
+            raise
+        os.unlink(dest)
+        os.rename(src, dest)
+
+
+def _file_digest(path):
+    with open(path, "rb") as file_:
+        return hashlib.sha1(file_.read()).hexdigest()
+
+
+def _list_or_none(value):
+    value = util.to_tuple(value)
+    return list(value) if value is not None else None
+
+
+def _header_from_entry(entry):
+    return {
+        "revision": entry["revision"],
+        "down_revision": util.to_tuple(entry["down_revision"]),
+        "branch_labels": util.to_tuple(entry["branch_labels"]),
+        "depends_on": util.to_tuple(entry["depends_on"]),
+        "doc": entry["doc"],
+    }
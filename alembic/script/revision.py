@@ -1,3 +1,4 @@
+import bisect
 import collections
 import re
 
@@ -49,15 +50,25 @@ class RevisionMap(object):
 
     """
 
-    def __init__(self, generator):
+    def __init__(self, generator, lineage_index=False):
         """Construct a new :class:`.RevisionMap`.
 
         :param generator: a zero-arg callable that will generate an iterable
          of :class:`.Revision` instances to be used.   These are typically
          :class:`.Script` subclasses within regular Alembic use.
 
+        :param lineage_index: when True, the ancestors and descendants of
+         every revision are computed up front, the first time they're
+         needed, so that lineage queries against the map don't need to
+         traverse it.  This uses memory proportional to the square of the
+         number of revisions, and is of benefit to maps containing many
+         thousands of revisions.
+
+         .. versionadded:: 1.0.8
+
         """
         self._generator = generator
+        self.lineage_index = lineage_index
 
     @util.memoized_property
     def heads(self):
@@ -165,8 +176,20 @@ class RevisionMap(object):
 
         for revision in has_branch_labels:
             self._add_branches(revision, map_, map_branch_labels=False)
+
+        self._prefix_index = _PrefixIndex(key for key in map_ if key)
         return map_
 
+    @util.memoized_property
+    def _lineage_index(self):
+        """memoized attribute, the :class:`._LineageIndex` for the map,
+        if one is enabled and the map can be indexed.
+
+        """
+        if not self.lineage_index:
+            return None
+        return _LineageIndex.from_revision_map(self._revision_map)
+
     def _map_branch_labels(self, revision, map_):
         if revision.branch_labels:
             for branch_label in revision._orig_branch_labels:
@@ -187,11 +210,11 @@ class RevisionMap(object):
             self._map_branch_labels(revision, map_)
 
         if revision.branch_labels:
-            revision.branch_labels.update(revision.branch_labels)
+            branch_labels = revision.branch_labels
             for node in self._get_descendant_nodes(
                 [revision], map_, include_dependencies=False
             ):
-                node.branch_labels.update(revision.branch_labels)
+                node.branch_labels.update(branch_labels)
 
             parent = node
             while (
@@ -200,7 +223,7 @@ class RevisionMap(object):
                 and not parent.is_merge_point
             ):
 
-                parent.branch_labels.update(revision.branch_labels)
+                parent.branch_labels.update(branch_labels)
                 if parent.down_revision:
                     parent = map_[parent.down_revision]
                 else:
@@ -214,8 +237,9 @@ class RevisionMap(object):
     def add_revision(self, revision, _replace=False):
         """add a single revision to an existing map.
 
-        This method is for single-revision use cases, it's not
-        appropriate for fully populating an entire revision map.
+        The heads, bases, branch labels and dependencies of the map,
+        along with any indexes, are updated in place, in time proportional
+        to the portion of the revision graph affected by the new revision.
 
         """
         map_ = self._revision_map
@@ -226,21 +250,94 @@ class RevisionMap(object):
         elif _replace and revision.revision not in map_:
             raise Exception("revision %s not in map" % revision.revision)
 
-        map_[revision.revision] = revision
-        self._add_branches(revision, map_)
+        if revision.revision in map_:
+            self._replace_revision(map_[revision.revision], revision)
+        else:
+            self._insert_revision(revision)
+
+    def remove_revision(self, id_):
+        """remove a single revision from an existing map.
+
+        The revision must not have any other revisions which refer to it,
+        either as their ``down_revision`` or as a dependency.
+
+        .. versionadded:: 1.0.8
+
+        """
+        map_ = self._revision_map
+        revision = map_.get(id_)
+        if revision is None or revision.revision != id_:
+            raise ResolutionError("No such revision '%s'" % id_, id_)
+        if revision._all_nextrev:
+            raise RevisionError(
+                "Revision %s can't be removed as it's referenced by "
+                "revision(s) %s"
+                % (id_, ", ".join(sorted(revision._all_nextrev)))
+            )
+
+        parents = [map_[downrev] for downrev in revision._all_down_revisions]
+        old_tops = self._tail_tops(parents)
+
+        for branch_label in revision._orig_branch_labels:
+            del map_[branch_label]
+            self._prefix_index.remove(branch_label)
+        del map_[id_]
+        self._prefix_index.remove(id_)
+
+        for parent in parents:
+            parent.remove_nextrev(revision)
+
+        self.heads = tuple(head for head in self.heads if head != id_) + tuple(
+            parent.revision
+            for parent in parents
+            if parent.revision in revision._versioned_down_revisions
+            and parent.is_head
+        )
+        self._real_heads = tuple(
+            head for head in self._real_heads if head != id_
+        ) + tuple(
+            parent.revision for parent in parents if parent._is_real_head
+        )
+        self.bases = tuple(base for base in self.bases if base != id_)
+        self._real_bases = tuple(
+            base for base in self._real_bases if base != id_
+        )
+
+        self._relabel([], parents, old_tops)
+
+        index = self.__dict__.get("_lineage_index")
+        if index is not None:
+            index.remove(revision)
+        else:
+            self.__dict__.pop("_lineage_index", None)
+
+    def _insert_revision(self, revision):
+        map_ = self._revision_map
+
+        self._map_branch_labels(revision, map_)
         self._add_depends_on(revision, map_)
 
-        if revision.is_base:
-            self.bases += (revision.revision,)
-        if revision._is_real_base:
-            self._real_bases += (revision.revision,)
         for downrev in revision._all_down_revisions:
             if downrev not in map_:
                 util.warn(
                     "Revision %s referenced from %s is not present"
                     % (downrev, revision)
                 )
-            map_[downrev].add_nextrev(revision)
+        parents = [map_[downrev] for downrev in revision._all_down_revisions]
+        old_tops = self._tail_tops(parents)
+
+        map_[revision.revision] = revision
+        for parent in parents:
+            parent.add_nextrev(revision)
+
+        self._prefix_index.add(revision.revision)
+        for branch_label in revision._orig_branch_labels:
+            self._prefix_index.add(branch_label)
+
+        if revision.is_base:
+            self.bases += (revision.revision,)
+        if revision._is_real_base:
+            self._real_bases += (revision.revision,)
         if revision._is_real_head:
             self._real_heads = tuple(
                 head
@@ -260,6 +357,227 @@ class RevisionMap(object):
                 )
             ) + (revision.revision,)
 
+        self._relabel([revision], parents, old_tops)
+
+        index = self.__dict__.get("_lineage_index")
+        if index is not None:
+            index.add(revision)
+        else:
+            self.__dict__.pop("_lineage_index", None)
+
+    def _replace_revision(self, old, revision):
+        map_ = self._revision_map
+
+        if (
+            old._versioned_down_revisions == revision._versioned_down_revisions
+            and util.to_tuple(old.dependencies)
+            == util.to_tuple(revision.dependencies)
+            and old._orig_branch_labels == revision._orig_branch_labels
+        ):
+            # the usual case of a script being refreshed; the new object
+            # takes on the state of the old one
+            revision.nextrev = old.nextrev
+            revision._all_nextrev = old._all_nextrev
+            revision._resolved_dependencies = old._resolved_dependencies
+            revision.branch_labels = set(old.branch_labels)
+            map_[revision.revision] = revision
+            for branch_label in revision._orig_branch_labels:
+                map_[branch_label] = revision
+
+            index = self.__dict__.get("_lineage_index")
+            if index is not None:
+                index.replace(old, revision)
+            return
+
+        if not old._all_nextrev:
+            self.remove_revision(old.revision)
+            self._insert_revision(revision)
+            return
+
+        # the down revisions, dependencies or branch labels of a revision
+        # with descendants have changed
+        for branch_label in old._orig_branch_labels:
+            del map_[branch_label]
+            self._prefix_index.remove(branch_label)
+        self._map_branch_labels(revision, map_)
+        for branch_label in revision._orig_branch_labels:
+            self._prefix_index.add(branch_label)
+        self._add_depends_on(revision, map_)
+
+        old_parents = [map_[downrev] for downrev in old._all_down_revisions]
+        new_parents = [
+            map_[downrev] for downrev in revision._all_down_revisions
+        ]
+        parents = util.dedupe_tuple(old_parents + new_parents)
+        old_tops = self._tail_tops(parents)
+
+        map_[revision.revision] = revision
+        revision.nextrev = old.nextrev
+        revision._all_nextrev = old._all_nextrev
+        for parent in old_parents:
+            parent.remove_nextrev(old)
+        for parent in new_parents:
+            parent.add_nextrev(revision)
+
+        affected = set(parent.revision for parent in parents)
+        self.heads = tuple(
+            head
+            for head in self.heads
+            if head not in affected or map_[head].is_head
+        ) + tuple(
+            parent.revision
+            for parent in parents
+            if parent.is_head and parent.revision not in self.heads
+        )
+        self._real_heads = tuple(
+            head
+            for head in self._real_heads
+            if head not in affected or map_[head]._is_real_head
+        ) + tuple(
+            parent.revision
+            for parent in parents
+            if parent._is_real_head and parent.revision not in self._real_heads
+        )
+        self.bases = tuple(
+            base for base in self.bases if base != revision.revision
+        ) + ((revision.revision,) if revision.is_base else ())
+        self._real_bases = tuple(
+            base for base in self._real_bases if base != revision.revision
+        ) + ((revision.revision,) if revision._is_real_base else ())
+
+        self._relabel([revision], parents, old_tops)
+
+        # reachability changes for all ancestors and descendants
+        self.__dict__.pop("_lineage_index", None)
+
+    def _tail_tops(self, revisions):
+        return dict((rev.revision, self._tail_top(rev)) for rev in revisions)
+
+    def _tail_top(self, revision):
+        """Return the revision at the top of the linear "tail" of the graph
+        that the given revision is part of, or None.
+
+        A tail is a sequence of revisions extending downwards from a head,
+        none of which are branch points or merge points.  The branch
+        labels of each revision within a tail are those of its head; see
+        :meth:`._relabel`.
+
+        """
+        map_ = self._revision_map
+        while True:
+            if revision._is_real_branch_point or revision.is_merge_point:
+                return None
+            if not revision.nextrev:
+                return revision
+            (nextrev,) = revision.nextrev
+            revision = map_[nextrev]
+
+    def _relabel(self, changed, parents, old_tops):
+        """Update the ``branch_labels`` of the revisions affected by a
+        change to the map.
+
+        ``changed`` are the revisions whose own branch labels or down
+        revisions have changed, and ``parents`` are those revisions which
+        have gained or lost a revision that refers to them; ``old_tops``
+        is the result of :meth:`._tail_tops` for ``parents`` before the
+        change.
+
+        The labels produced are the same as those established by
+        :meth:`._add_branches` when the map is first loaded.  Each
+        revision carries the labels of itself and of all of its
+        ancestors, except within a tail, where each revision instead
+        carries the labels of the head of that tail.
+
+        """
+        map_ = self._revision_map
+
+        stale = set(
+            self._get_descendant_nodes(
+                changed, map_=map_, include_dependencies=False
+            )
+        )
+        dirty = set(stale).union(parents)
+
+        downward = {}
+        for parent in parents:
+            if old_tops[parent.revision] in (None, parent):
+                # the labels of the parent aren't those of a tail
+                # extending above it
+                downward[parent.revision] = frozenset(parent.branch_labels)
+
+        def get_downward(revision):
+            # labels of the revision and all of its ancestors
+            todo = [revision]
+            while todo:
+                rev = todo[-1]
+                if rev.revision in downward:
+                    todo.pop()
+                    continue
+                if rev not in dirty and (
+                    rev._is_real_branch_point
+                    or rev.is_merge_point
+                    or not rev.nextrev
+                    or map_[next(iter(rev.nextrev))].is_merge_point
+                ):
+                    # revision is not within a tail, or is the head
+                    # of one
+                    downward[rev.revision] = frozenset(rev.branch_labels)
+                    todo.pop()
+                    continue
+                pending = [
+                    map_[downrev]
+                    for downrev in rev._versioned_down_revisions
+                    if downrev not in downward
+                ]
+                if pending:
+                    todo.extend(pending)
+                    continue
+                todo.pop()
+                labels = set(rev._orig_branch_labels)
+                for downrev in rev._versioned_down_revisions:
+                    labels.update(downward[downrev])
+                downward[rev.revision] = frozenset(labels)
+            return downward[revision.revision]
+
+        tops = {}
+
+        def get_top(revision):
+            if revision.revision not in tops:
+                tops[revision.revision] = self._tail_top(revision)
+            return tops[revision.revision]
+
+        for rev in stale:
+            top = get_top(rev)
+            rev.branch_labels = set(get_downward(top if top else rev))
+
+        for parent in parents:
+            if parent in stale:
+                continue
+            old_top = old_tops[parent.revision]
+            top = get_top(parent)
+            if old_top is None and top is None:
+                continue
+            labels = get_downward(top if top else parent)
+            if (
+                old_top is not None
+                and top is not None
+                and labels == parent.branch_labels
+            ):
+                continue
+
+            # update the parent and the rest of its former or current
+            # tail below it
+            rev = parent
+            while True:
+                rev.branch_labels = set(
+                    labels if top is not None else get_downward(rev)
+                )
+                if rev.is_merge_point or not rev.down_revision:
+                    break
+                rev = map_[rev.down_revision]
+                if rev._is_real_branch_point or rev.is_merge_point:
+                    break
+
     def get_current_head(self, branch_label=None):
         """Return the current head revision.
 
@@ -372,12 +690,11 @@ class RevisionMap(object):
             # break out to avoid misleading py3k stack traces
             revision = False
         if revision is False:
-            # do a partial lookup
-            revs = [
-                x
-                for x in self._revision_map
-                if x and x.startswith(resolved_id)
-            ]
+            # do a partial lookup; without a branch to filter on, three
+            # matches are enough to report an ambiguous identifier
+            revs = self._prefix_index.startswith(
+                resolved_id, limit=None if branch_rev else 3
+            )
             if branch_rev:
                 revs = self.filter_for_lineage(revs, check_branch)
             if not revs:
@@ -409,6 +726,10 @@ class RevisionMap(object):
     def _filter_into_branch_heads(self, targets):
         targets = set(targets)
 
+        index = self._lineage_index
+        if index is not None:
+            return index.filter_into_branch_heads(targets)
+
         for rev in list(targets):
             if targets.intersection(
                 self._get_descendant_nodes([rev], include_dependencies=False)
@@ -452,6 +773,12 @@ class RevisionMap(object):
             )
         ]
 
+        index = self._lineage_index
+        if index is not None:
+            return index.shares_lineage(
+                target, test_against_revs, include_dependencies
+            )
+
         return bool(
             set(
                 self._get_descendant_nodes(
@@ -646,6 +973,18 @@ class RevisionMap(object):
         include_dependencies=True,
     ):
 
+        # omit_immediate_dependencies only produces a well defined
+        # result from the index when the targets don't overlap
+        if map_ is None and (check or not omit_immediate_dependencies):
+            index = self._lineage_index
+            if index is not None:
+                return index.descendants(
+                    targets,
+                    check=check,
+                    omit_immediate_dependencies=omit_immediate_dependencies,
+                    include_dependencies=include_dependencies,
+                )
+
         if omit_immediate_dependencies:
 
             def fn(rev):
@@ -672,6 +1011,15 @@ class RevisionMap(object):
         self, targets, map_=None, check=False, include_dependencies=True
     ):
 
+        if map_ is None:
+            index = self._lineage_index
+            if index is not None:
+                return index.ancestors(
+                    targets,
+                    check=check,
+                    include_dependencies=include_dependencies,
+                )
+
         if include_dependencies:
 
             def fn(rev):
@@ -735,6 +1083,61 @@ class RevisionMap(object):
         The traversal is depth-first within branches, and breadth-first
         across branches as a whole.
 
+        """
+        if upper == "heads" and lower in ("base", None):
+            # the entire map; revisions can be produced without first
+            # establishing the space to be iterated
+            for rev in self._iterate_all_revisions():
+                yield rev
+            return
+
+        space = self._iteration_space(
+            upper, lower, implicit_base, select_for_downgrade
+        )
+        if space is None:
+            return
+        uppers, requested_lowers, total_space = space
+
+        for rev in self._topological_iterate(uppers, total_space):
+            if not inclusive and rev in requested_lowers:
+                continue
+            yield rev
+
+    def _iterate_revisions_by_scan(
+        self,
+        upper,
+        lower,
+        inclusive=True,
+        implicit_base=False,
+        select_for_downgrade=False,
+    ):
+        """iterate revisions from upper to lower using the original
+        algorithm, which rescans the pending branch points each time the
+        current branch is exhausted.
+
+        This produces the same sequence as :meth:`._iterate_revisions`, in
+        quadratic time; it's retained in order to verify the latter.
+
+        """
+        space = self._iteration_space(
+            upper, lower, implicit_base, select_for_downgrade
+        )
+        if space is None:
+            return
+        uppers, requested_lowers, total_space = space
+
+        for rev in self._scan_iterate(uppers, total_space):
+            if not inclusive and rev in requested_lowers:
+                continue
+            yield rev
+
+    def _iteration_space(
+        self, upper, lower, implicit_base, select_for_downgrade
+    ):
+        """Return the upper revisions, the requested lower revisions and
+        the identifiers of all revisions to be produced when iterating
+        from upper to lower; or None if there are no revisions to produce.
+
         """
 
         requested_lowers = self.get_revisions(lower)
@@ -752,7 +1155,7 @@ class RevisionMap(object):
         uppers = util.dedupe_tuple(self.get_revisions(upper))
 
         if not uppers and not requested_lowers:
-            return
+            return None
 
         upper_ancestors = set(self._get_ancestor_nodes(uppers, check=True))
 
@@ -813,25 +1216,151 @@ class RevisionMap(object):
             # if the requested start is one of those branch points,
             # then just return empty set
             if start_from.intersection(upper_ancestors):
-                return
+                return None
             else:
                 # otherwise, they requested nodes out of
                 # order
                 raise RangeNotAncestorError(lower, upper)
 
+        return uppers, requested_lowers, total_space
+
+    def _branch_todo(self, total_space):
         # organize branch points to be consumed separately from
         # member nodes
-        branch_todo = set(
+        return set(
             rev
             for rev in (self._revision_map[rev] for rev in total_space)
             if rev._is_real_branch_point
             and len(total_space.intersection(rev._all_nextrev)) > 1
         )
 
+    def _iterate_all_revisions(self):
+        """Produce every revision in the map, starting from the heads,
+        in the same order as :meth:`._topological_iterate`.
+
+        Each branch point becomes ready once all of the revisions which
+        refer to it have been produced, which is established as the
+        traversal proceeds, so that an iteration which is stopped early
+        only visits the revisions it has produced.
+
+        """
+        map_ = self._revision_map
+        pending = {}
+        ready = []
+        todo = collections.deque(
+            util.dedupe_tuple(self.get_revisions("heads"))
+        )
+        produced = 0
+
+        while todo or ready:
+            if not todo:
+                todo.extendleft(self._ready_branch_points(ready))
+                ready = []
+
+            rev = todo.popleft()
+            downrevs = []
+            # a dependency may repeat one of the down revisions; each
+            # parent is counted once
+            for downrev in util.dedupe_tuple(
+                reversed(rev._all_down_revisions)
+            ):
+                downrev = map_[downrev]
+                if downrev._is_real_branch_point:
+                    count = pending.get(downrev, len(downrev._all_nextrev))
+                    pending[downrev] = count - 1
+                    if count == 1:
+                        ready.append(downrev)
+                else:
+                    downrevs.append(downrev)
+            todo.extendleft(downrevs)
+
+            produced += 1
+            yield rev
+
+        if produced != len(
+            set(rev for rev in map_.values() if rev is not None)
+        ):
+            raise RevisionError(
+                "Dependency resolution failed; iteration can't proceed"
+            )
+
+    def _ready_branch_points(self, revs):
+        return sorted(
+            revs,
+            # favor "revisioned" branch points before
+            # dependent ones; the revision identifier keeps the
+            # order deterministic among branch points which become
+            # ready at the same time
+            key=lambda rev: (0 if rev.is_branch_point else 1, rev.revision),
+        )
+
+    def _topological_iterate(self, uppers, total_space):
+        """Produce the revisions in total_space, starting from uppers.
+
+        This is a Kahn-style traversal; each branch point keeps a count of
+        its descendants which remain to be produced, and becomes ready
+        once that count reaches zero, so that each revision and each
+        edge is visited a fixed number of times.
+
+        """
+        branch_todo = self._branch_todo(total_space)
+
         # it's not possible for any "uppers" to be in branch_todo,
         # because the ._all_nextrev of those nodes is not in total_space
         # assert not branch_todo.intersection(uppers)
 
+        pending = {}
+        waiting = collections.defaultdict(list)
+        for rev in branch_todo:
+            nextrevs = total_space.intersection(rev._all_nextrev)
+            pending[rev] = len(nextrevs)
+            for nextrev in nextrevs:
+                waiting[nextrev].append(rev)
+
+        ready = []
+        todo = collections.deque(
+            r for r in uppers if r.revision in total_space
+        )
+
+        while total_space:
+            # when everything non-branch pending is consumed,
+            # add to the todo any branch nodes that have no
+            # descendants left in the queue
+            if not todo:
+                if not ready:
+                    raise RevisionError(
+                        "Dependency resolution failed; iteration can't "
+                        "proceed"
+                    )
+                todo.extendleft(self._ready_branch_points(ready))
+                branch_todo.difference_update(ready)
+                ready = []
+
+            rev = todo.popleft()
+            total_space.remove(rev.revision)
+            for branch_point in waiting.pop(rev.revision, ()):
+                pending[branch_point] -= 1
+                if not pending[branch_point]:
+                    ready.append(branch_point)
+
+            # do depth first for elements within branches,
+            # don't consume any actual branch nodes
+            todo.extendleft(
+                [
+                    self._revision_map[downrev]
+                    for downrev in reversed(rev._all_down_revisions)
+                    if self._revision_map[downrev] not in branch_todo
+                    and downrev in total_space
+                ]
+            )
+
+            yield rev
+
+        assert not branch_todo
+
+    def _scan_iterate(self, uppers, total_space):
+        branch_todo = self._branch_todo(total_space)
+
         todo = collections.deque(
             r for r in uppers if r.revision in total_space
         )
@@ -850,15 +1379,10 @@ class RevisionMap(object):
             # descendants left in the queue
             if not todo:
                 todo.extendleft(
-                    sorted(
-                        (
-                            rev
-                            for rev in branch_todo
-                            if not rev._all_nextrev.intersection(total_space)
-                        ),
-                        # favor "revisioned" branch points before
-                        # dependent ones
-                        key=lambda rev: 0 if rev.is_branch_point else 1,
+                    self._ready_branch_points(
+                        rev
+                        for rev in branch_todo
+                        if not rev._all_nextrev.intersection(total_space)
                     )
                 )
                 branch_todo.difference_update(todo)
@@ -879,53 +1403,354 @@ class RevisionMap(object):
                     ]
                 )
 
-                if not inclusive and rev in requested_lowers:
-                    continue
                 yield rev
 
         assert not branch_todo
 
 
-class Revision(object):
-    """Base class for revisioned objects.
-
-    The :class:`.Revision` class is the base of the more public-facing
-    :class:`.Script` object, which represents a migration script.
-    The mechanics of revision management and traversal are encapsulated
-    within :class:`.Revision`, while :class:`.Script` applies this logic
-    to Python files in a version directory.
+class _PrefixIndex(object):
+    """Sorted collection of the identifiers and branch labels within a
+    :class:`.RevisionMap`, used to resolve partial identifiers with a
+    binary search.
 
     """
 
-    nextrev = frozenset()
-    """following revisions, based on down_revision only."""
+    def __init__(self, keys):
+        self._keys = sorted(keys)
 
-    _all_nextrev = frozenset()
+    def add(self, key):
+        idx = bisect.bisect_left(self._keys, key)
+        if idx == len(self._keys) or self._keys[idx] != key:
+            self._keys.insert(idx, key)
 
-    revision = None
-    """The string revision number."""
+    def remove(self, key):
+        idx = bisect.bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            del self._keys[idx]
 
-    down_revision = None
-    """The ``down_revision`` identifier(s) within the migration script.
+    def startswith(self, prefix, limit=None):
+        """Return the keys which start with the given prefix, in sorted
+        order, up to an optional limit.
 
-    Note that the total set of "down" revisions is
-    down_revision + dependencies.
+        """
+        keys = self._keys
+        idx = bisect.bisect_left(keys, prefix)
+        result = []
+        while (
+            idx < len(keys)
+            and keys[idx].startswith(prefix)
+            and (limit is None or len(result) < limit)
+        ):
+            result.append(keys[idx])
+            idx += 1
+        return result
+
+
+class _LineageIndex(object):
+    """Precomputed ancestors and descendants of each revision within a
+    :class:`.RevisionMap`.
+
+    Revisions are numbered in topological order, and the ancestors and
+    descendants of each revision, including the revision itself, are
+    stored as an integer bitset over that numbering, so that lineage
+    queries are answered with bitwise operations rather than by
+    traversing the map.
 
     """
 
-    dependencies = None
-    """Additional revisions which this revision is dependent on.
+    def __init__(
+        self,
+        order,
+        ancestors,
+        descendants,
+        versioned_ancestors,
+        versioned_descendants,
+    ):
+        self._order = order
+        self._position = dict(
+            (rev.revision, idx) for idx, rev in enumerate(order)
+        )
+        self._ancestors = ancestors
+        self._descendants = descendants
+        self._versioned_ancestors = versioned_ancestors
+        self._versioned_descendants = versioned_descendants
+
+    @classmethod
+    def from_revision_map(cls, map_):
+        """Produce a :class:`._LineageIndex` for the given map of
+        revisions, or None if the map contains a cycle or revisions whose
+        ``nextrev`` collections are out of sync with their down revisions.
+
+        """
+        revisions = dict(
+            (rev.revision, rev) for rev in map_.values() if rev is not None
+        )
+
+        children = dict((rev_id, set()) for rev_id in revisions)
+        versioned_children = dict((rev_id, set()) for rev_id in revisions)
+        indegree = {}
+        has_dependencies = False
+        for rev in revisions.values():
+            down_revisions = set(rev._all_down_revisions)
+            if any(downrev not in revisions for downrev in down_revisions):
+                return None
+            indegree[rev.revision] = len(down_revisions)
+            for downrev in down_revisions:
+                children[downrev].add(rev.revision)
+            for downrev in rev._versioned_down_revisions:
+                versioned_children[downrev].add(rev.revision)
+            if rev._resolved_dependencies:
+                has_dependencies = True
+
+        for rev in revisions.values():
+            if (
+                rev._all_nextrev != children[rev.revision]
+                or rev.nextrev != versioned_children[rev.revision]
+            ):
+                return None
+
+        order = []
+        todo = [rev_id for rev_id, count in indegree.items() if not count]
+        while todo:
+            rev_id = todo.pop()
+            order.append(revisions[rev_id])
+            for child in children[rev_id]:
+                indegree[child] -= 1
+                if not indegree[child]:
+                    todo.append(child)
+        if len(order) != len(revisions):
+            return None
+
+        position = dict((rev.revision, idx) for idx, rev in enumerate(order))
+
+        def closure(nodes, related):
+            masks = [0] * len(order)
+            for idx in nodes:
+                mask = 1 << idx
+                for rev_id in related(order[idx]):
+                    mask |= masks[position[rev_id]]
+                masks[idx] = mask
+            return masks
+
+        forward = compat.range(len(order))
+        backward = compat.range(len(order) - 1, -1, -1)
+
+        ancestors = closure(forward, lambda rev: rev._all_down_revisions)
+        descendants = closure(backward, lambda rev: rev._all_nextrev)
+        if has_dependencies:
+            versioned_ancestors = closure(
+                forward, lambda rev: rev._versioned_down_revisions
+            )
+            versioned_descendants = closure(backward, lambda rev: rev.nextrev)
+        else:
+            versioned_ancestors = ancestors
+            versioned_descendants = descendants
+
+        return cls(
+            order,
+            ancestors,
+            descendants,
+            versioned_ancestors,
+            versioned_descendants,
+        )
 
-    From a migration standpoint, these dependencies are added to the
-    down_revision to form the full iteration.  However, the separation
-    of down_revision from "dependencies" is to assist in navigating
-    a history that contains many branches, typically a multi-root scenario.
+    def add(self, revision):
+        """Extend the index with a new revision, which must not have any
+        revisions referring to it.
+
+        """
+        if (
+            revision._resolved_dependencies
+            and self._versioned_ancestors is self._ancestors
+        ):
+            self._versioned_ancestors = list(self._ancestors)
+            self._versioned_descendants = list(self._descendants)
+
+        idx = len(self._order)
+        self._order.append(revision)
+        self._position[revision.revision] = idx
+        bit = 1 << idx
+
+        for ancestors, descendants, related in self._closures(revision):
+            mask = bit
+            for rev_id in related:
+                mask |= ancestors[self._position[rev_id]]
+            ancestors.append(mask)
+            descendants.append(bit)
+            for rev in self._revisions(mask & ~bit):
+                descendants[self._position[rev.revision]] |= bit
+
+    def remove(self, revision):
+        """Remove a revision, which must not have any revisions referring
+        to it, from the index.
+
+        """
+        idx = self._position.pop(revision.revision)
+        bit = 1 << idx
+        for ancestors, descendants, related in self._closures(revision):
+            for rev in self._revisions(ancestors[idx] & ~bit):
+                descendants[self._position[rev.revision]] &= ~bit
+            ancestors[idx] = descendants[idx] = 0
+        self._order[idx] = None
+
+    def replace(self, old, revision):
+        """Substitute a revision with another that has the same identifier
+        and lineage.
+
+        """
+        self._order[self._position[old.revision]] = revision
+
+    def _closures(self, revision):
+        yield self._ancestors, self._descendants, revision._all_down_revisions
+        if self._versioned_ancestors is not self._ancestors:
+            yield (
+                self._versioned_ancestors,
+                self._versioned_descendants,
+                revision._versioned_down_revisions,
+            )
+
+    def ancestors(self, targets, check=False, include_dependencies=True):
+        if include_dependencies:
+            masks = self._ancestors
+        else:
+            masks = self._versioned_ancestors
+        return self._related(
+            targets, lambda rev: masks[self._position[rev.revision]], check
+        )
+
+    def descendants(
+        self,
+        targets,
+        check=False,
+        omit_immediate_dependencies=False,
+        include_dependencies=True,
+    ):
+        if include_dependencies:
+            masks = self._descendants
+        else:
+            masks = self._versioned_descendants
+
+        if omit_immediate_dependencies:
+
+            def reach(rev):
+                mask = 1 << self._position[rev.revision]
+                for rev_id in rev.nextrev:
+                    mask |= self._descendants[self._position[rev_id]]
+                return mask
+
+        else:
+
+            def reach(rev):
+                return masks[self._position[rev.revision]]
+
+        return self._related(targets, reach, check)
+
+    def shares_lineage(self, target, test_against_revs, include_dependencies):
+        idx = self._position[target.revision]
+        if include_dependencies:
+            mask = self._ancestors[idx] | self._descendants[idx]
+        else:
+            mask = (
+                self._versioned_ancestors[idx]
+                | self._versioned_descendants[idx]
+            )
+        return bool(mask & self._mask(test_against_revs))
+
+    def filter_into_branch_heads(self, targets):
+        targets_mask = self._mask(targets)
+        return set(
+            rev
+            for rev in targets
+            if not self._versioned_descendants[self._position[rev.revision]]
+            & targets_mask
+            & ~(1 << self._position[rev.revision])
+        )
+
+    def _related(self, targets, reach, check):
+        targets = list(targets)
+        masks = [reach(rev) for rev in targets]
+
+        if check:
+            targets_mask = self._mask(targets)
+            for target, mask in zip(targets, masks):
+                overlaps = (
+                    mask
+                    & targets_mask
+                    & ~(1 << self._position[target.revision])
+                )
+                if overlaps:
+                    raise RevisionError(
+                        "Requested revision %s overlaps with "
+                        "other requested revisions %s"
+                        % (
+                            target.revision,
+                            ", ".join(
+                                r.revision for r in self._revisions(overlaps)
+                            ),
+                        )
+                    )
+
+        total = 0
+        for mask in masks:
+            total |= mask
+        for rev in self._revisions(total):
+            yield rev
+
+    def _mask(self, revisions):
+        mask = 0
+        for rev in revisions:
+            mask |= 1 << self._position[rev.revision]
+        return mask
+
+    def _revisions(self, mask):
+        # scanning the binary string representation is much faster than
+        # shifting through a large integer bit by bit
+        bits = bin(mask)[:1:-1]
+        idx = bits.find("1")
+        while idx != -1:
+            yield self._order[idx]
+            idx = bits.find("1", idx + 1)
+
+
+class Revision(object):
+    """Base class for revisioned objects.
+
+    The :class:`.Revision` class is the base of the more public-facing
+    :class:`.Script` object, which represents a migration script.
+    The mechanics of revision management and traversal are encapsulated
+    within :class:`.Revision`, while :class:`.Script` applies this logic
+    to Python files in a version directory.
 
     """
 
-    branch_labels = None
-    """Optional string/tuple of symbolic names to apply to this
-    revision's branch"""
+    __slots__ = {
+        "revision": """The string revision number.""",
+        "down_revision": """The ``down_revision`` identifier(s) within
+        the migration script.
+
+        Note that the total set of "down" revisions is
+        down_revision + dependencies.
+
+        """,
+        "dependencies": """Additional revisions which this revision is
+        dependent on.
+
+        From a migration standpoint, these dependencies are added to the
+        down_revision to form the full iteration.  However, the separation
+        of down_revision from "dependencies" is to assist in navigating
+        a history that contains many branches, typically a multi-root
+        scenario.
+
+        """,
+        "branch_labels": """Optional set of symbolic names applying
+        to this revision's branch.""",
+        "nextrev": """following revisions, based on down_revision only.""",
+        "_all_nextrev": None,
+        "_orig_branch_labels": None,
+        "_resolved_dependencies": None,
+        "__dict__": None,
+        "__weakref__": None,
+    }
 
     @classmethod
     def verify_rev_id(cls, revision):
@@ -940,12 +1765,15 @@ class Revision(object):
         self, revision, down_revision, dependencies=None, branch_labels=None
     ):
         self.verify_rev_id(revision)
-        self.revision = revision
-        self.down_revision = tuple_rev_as_scalar(down_revision)
-        self.dependencies = tuple_rev_as_scalar(dependencies)
+        self.revision = compat.intern(revision)
+        self.down_revision = _intern_revs(tuple_rev_as_scalar(down_revision))
+        self.dependencies = _intern_revs(tuple_rev_as_scalar(dependencies))
         self._resolved_dependencies = ()
-        self._orig_branch_labels = util.to_tuple(branch_labels, default=())
+        self._orig_branch_labels = _intern_revs(
+            util.to_tuple(branch_labels, default=())
+        )
         self.branch_labels = set(self._orig_branch_labels)
+        self.nextrev = self._all_nextrev = frozenset()
 
     def __repr__(self):
         args = [repr(self.revision), repr(self.down_revision)]
@@ -958,7 +1786,18 @@ class Revision(object):
     def add_nextrev(self, revision):
         self._all_nextrev = self._all_nextrev.union([revision.revision])
         if self.revision in revision._versioned_down_revisions:
-            self.nextrev = self.nextrev.union([revision.revision])
+            self._set_nextrev(self.nextrev.union([revision.revision]))
+
+    def remove_nextrev(self, revision):
+        self._all_nextrev = self._all_nextrev.difference([revision.revision])
+        self._set_nextrev(self.nextrev.difference([revision.revision]))
+
+    def _set_nextrev(self, nextrev):
+        # without dependencies the two collections are the same; share
+        # a single copy
+        if nextrev == self._all_nextrev:
+            nextrev = self._all_nextrev
+        self.nextrev = nextrev
 
     @property
     def _all_down_revisions(self):
@@ -1029,6 +1868,17 @@ class Revision(object):
         return len(self._versioned_down_revisions) > 1
 
 
+def _intern_revs(rev):
+    # revision identifiers and branch labels are repeated throughout the
+    # map; interning keeps a single copy of each string
+    if rev is None:
+        return None
+    elif isinstance(rev, compat.string_types):
+        return compat.intern(rev)
+    else:
+        return type(rev)(compat.intern(r) for r in rev)
+
+
 def tuple_rev_as_scalar(rev):
     if not rev:
         return None
@@ -0,0 +1,356 @@
+"""Run Alembic commands within a long-lived process, received over a
+local Unix socket.
+
+.. versionadded:: 1.0.8
+
+"""
+from argparse import ArgumentParser
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import traceback
+
+from sqlalchemy import engine_from_config
+
+from . import util
+from .config import CommandLine
+from .config import Config
+from .script import ScriptDirectory
+from .util import compat
+
+log = logging.getLogger(__name__)
+
+
+class MigrationServer(object):
+    """Accept commands in the form of ``alembic`` command line arguments
+    over a Unix socket, and run them against a configuration that remains
+    loaded between commands.
+
+    The :class:`.MigrationServer` keeps the :class:`.Config`, the
+    :class:`.ScriptDirectory` along with its :class:`.RevisionMap`, and an
+    :class:`~sqlalchemy.engine.Engine` created from the ``sqlalchemy.url``
+    of the configuration, if present.   Before each command, the version
+    directories and the configuration file are checked for changes, and
+    the revisions or the configuration are reloaded if so.
+
+    The engine is passed to ``env.py`` as the ``"connection"`` key of
+    :attr:`.Config.attributes`, which the ``generic`` template's
+    ``env.py`` will use in place of creating its own engine, so that
+    connections are drawn from the same pool across commands.
+
+    Commands are run one at a time, in the working directory of the
+    server, and only against the configuration file and section the
+    server was started with.   The output of each command, including
+    the SQL of an ``--sql`` command, is sent back to the client by way of
+    the ``stdout`` and ``output_buffer`` of its :class:`.Config`;
+    ``sys.stdout`` and ``sys.stderr`` of the server process are left
+    as they are, so messages written there directly, such as those of
+    ``alembic revision`` as it generates files, as well as log output,
+    appear in the output of the server rather than that of the command.
+    The socket is created with permissions allowing only the user
+    running the server to connect.
+
+    The server is normally run using the ``alembic serve`` command, and
+    commands sent to it using ``alembic --socket <path> <command>``, or
+    :func:`.send_command`.
+
+    .. versionadded:: 1.0.8
+
+    """
+
+    def __init__(self, config, socket_path):
+        self.config = config
+        self.socket_path = socket_path
+        self.command_line = _CommandLine()
+        self.engine = None
+        self._load_config()
+
+        if os.path.exists(socket_path):
+            if _socket_in_use(socket_path):
+                raise util.CommandError(
+                    "Socket %s is already in use" % socket_path
+                )
+            os.unlink(socket_path)
+        self._server = _UnixStreamServer(socket_path, self)
+
+    def _load_config(self):
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+
+        self._config_signature = _file_signature(self.config.config_file_name)
+        if self.config.get_main_option("sqlalchemy.url"):
+            self.engine = engine_from_config(
+                self.config.get_section(self.config.config_ini_section),
+                prefix="sqlalchemy.",
+            )
+        self._load_revisions()
+
+    def _load_revisions(self):
+        self.script = ScriptDirectory.from_config(self.config)
+        self.script.revision_map.heads
+        self._versions_signature = self._versions_state()
+
+    def _versions_state(self):
+        state = set()
+        for location in self.script._version_locations:
+            try:
+                names = os.listdir(location)
+            except OSError:
+                continue
+            for name in names:
+                state.add(
+                    (
+                        location,
+                        name,
+                        _file_signature(os.path.join(location, name)),
+                    )
+                )
+        return state
+
+    def refresh(self):
+        """Reload the configuration if the configuration file has changed,
+        or the revisions if any version directory has changed.
+
+        """
+        if (
+            _file_signature(self.config.config_file_name)
+            != self._config_signature
+        ):
+            log.info(
+                "Configuration %s changed; reloading",
+                self.config.config_file_name,
+            )
+            self.config = Config(
+                file_=self.config.config_file_name,
+                ini_section=self.config.config_ini_section,
+                cmd_opts=self.config.cmd_opts,
+                config_args=self.config.config_args,
+            )
+            self._load_config()
+        elif self._versions_state() != self._versions_signature:
+            log.info("Version files changed; reloading revisions")
+            self._load_revisions()
+
+    def run_command(self, argv, cwd=None):
+        """Run the command given as ``alembic`` command line arguments,
+        returning a tuple of the exit status and the output of the command.
+
+        :param argv: list of command line arguments.
+        :param cwd: working directory of the client, against which the
+         ``-c/--config`` option is resolved.
+
+        """
+        buf = io.BytesIO()
+        out = _Output(buf, encoding="utf-8", line_buffering=True)
+        self.command_line.output = out
+        try:
+            status = self._run_command(argv, cwd, out)
+        except SystemExit as exit_:
+            if exit_.code is None or isinstance(exit_.code, int):
+                status = exit_.code or 0
+            else:
+                out.write("%s\n" % (exit_.code,))
+                status = 1
+        except Exception:
+            out.write(traceback.format_exc())
+            status = 1
+        finally:
+            self.command_line.output = None
+        out.flush()
+        return status, buf.getvalue().decode("utf-8")
+
+    def _run_command(self, argv, cwd, out):
+        options = self.command_line.parser.parse_args(argv)
+        if not hasattr(options, "cmd"):
+            self.command_line.parser.error("too few arguments")
+
+        try:
+            self._run_options(options, cwd, out)
+        except util.CommandError as err:
+            if options.raiseerr:
+                raise
+            log.error(err)
+            out.write("FAILED: %s\n" % (err,))
+            return -1
+        else:
+            return 0
+
+    def _run_options(self, options, cwd, out):
+        if options.cmd[0].__name__ == "serve":
+            raise util.CommandError(
+                "Can't run 'serve' from within 'alembic serve'"
+            )
+
+        config_file = os.path.abspath(
+            os.path.join(cwd or os.getcwd(), options.config)
+        )
+        if (
+            config_file != os.path.abspath(self.config.config_file_name)
+            or options.name != self.config.config_ini_section
+        ):
+            raise util.CommandError(
+                "This server runs commands for section [%s] of %s only"
+                % (
+                    self.config.config_ini_section,
+                    os.path.abspath(self.config.config_file_name),
+                )
+            )
+
+        self.refresh()
+
+        config = Config(
+            file_=self.config.config_file_name,
+            ini_section=self.config.config_ini_section,
+            stdout=out,
+            output_buffer=out,
+            cmd_opts=options,
+            config_args=self.config.config_args,
+        )
+        # share the parsed configuration file and the loaded revisions
+        config.__dict__["file_config"] = self.config.file_config
+        config._script_directory = self.script
+        if self.engine is not None:
+            config.attributes["connection"] = self.engine
+
+        # errors are reported to the client by run_command()
+        raiseerr, options.raiseerr = options.raiseerr, True
+        try:
+            self.command_line.run_cmd(config, options)
+        finally:
+            options.raiseerr = raiseerr
+
+    def serve_forever(self):
+        """Handle requests until :meth:`.shutdown` is called."""
+
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop :meth:`.serve_forever`, from another thread."""
+
+        self._server.shutdown()
+
+    def close(self):
+        """Close the socket and dispose of the engine."""
+
+        self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+
+
+def send_command(socket_path, argv, stdout=None):
+    """Send a command to a :class:`.MigrationServer`, given as ``alembic``
+    command line arguments, write its output to the given stream and
+    return its exit status.
+
+    .. versionadded:: 1.0.8
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as err:
+            raise util.CommandError(
+                "Can't connect to %s: %s" % (socket_path, err)
+            )
+        request = json.dumps({"argv": list(argv), "cwd": os.getcwd()})
+        sock.sendall(request.encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        sock.close()
+
+    response = json.loads(b"".join(chunks).decode("utf-8"))
+    util.write_outstream(stdout or sys.stdout, response["output"])
+    return response["status"]
+
+
+class _RequestHandler(compat.socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            argv = [compat.text_type(arg) for arg in request["argv"]]
+        except (ValueError, KeyError, TypeError):
+            status, output = 1, "Invalid request\n"
+        else:
+            status, output = self.server.migration_server.run_command(
+                argv, request.get("cwd")
+            )
+        response = json.dumps({"status": status, "output": output})
+        self.wfile.write(response.encode("utf-8") + b"\n")
+
+
+class _UnixStreamServer(compat.socketserver.UnixStreamServer):
+    def __init__(self, socket_path, migration_server):
+        self.migration_server = migration_server
+        compat.socketserver.UnixStreamServer.__init__(
+            self, socket_path, _RequestHandler
+        )
+
+    def server_bind(self):
+        compat.socketserver.UnixStreamServer.server_bind(self)
+        # only the user running the server may connect; the socket
+        # doesn't accept connections until server_activate()
+        os.chmod(self.server_address, 0o600)
+
+
+class _CommandLine(CommandLine):
+    # argument parsers write usage and help to the output of the command
+    # being run, rather than to sys.stdout and sys.stderr
+    output = None
+
+    def __init__(self):
+        CommandLine.__init__(self, prog="alembic")
+
+    def _argument_parser(self, **kw):
+        return _ArgumentParser(self, **kw)
+
+
+class _ArgumentParser(ArgumentParser):
+    def __init__(self, command_line, **kw):
+        self.command_line = command_line
+        ArgumentParser.__init__(self, **kw)
+
+    def _print_message(self, message, file=None):
+        if message:
+            self.command_line.output.write(message)
+
+
+class _Output(io.TextIOWrapper):
+    # accepts the byte strings written by some Python 2 code such as
+    # argparse
+    def write(self, text):
+        if isinstance(text, compat.binary_type):
+            text = text.decode(self.encoding, "replace")
+        return super(_Output, self).write(text)
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _socket_in_use(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        return False
+    else:
+        return True
+    finally:
+        sock.close()
@@ -26,6 +26,40 @@ script_location = ${script_location}
 # versions/ directory
 # sourceless = false
 
+# set to 'true' to maintain an index of revision file
+# headers in ${script_location}/.alembic_revision_index, so that
+# revision files are only imported when they change or are run
+# revision_index = false
+
+# set to 'true' to read the revision, down_revision, branch_labels
+# and depends_on of each revision file by parsing its source, so that
+# revision files are only imported when they are run
+# lazy_revisions = false
+
+# number of worker processes used to import or parse revision
+# files which aren't otherwise present in the revision index;
+# leave unset to load revision files within the current process
+# revision_load_workers =
+
+# set to 'true' to precompute the ancestors and descendants of
+# every revision, speeding up commands against very large numbers
+# of revisions at the expense of memory
+# lineage_index = false
+
+# set to 'true' to log the time taken by the statements of each
+# migration, or to the module:ClassName of a StatementProfiler
+# subclass; statements taking at least slow_statement_threshold
+# seconds are logged as warnings
+# statement_profiler = false
+# slow_statement_threshold =
+
+# seconds each statement may wait for a lock, on PostgreSQL and MySQL,
+# and the number of times to retry a statement which times out, waiting
+# lock_retry_backoff seconds before the first retry and doubling after
+# lock_timeout =
+# lock_retries = 0
+# lock_retry_backoff = 1
+
 # version location specification; this defaults
 # to ${script_location}/versions.  When using multiple version
 # directories, initial revisions must be specified with --version-path
@@ -54,20 +54,33 @@ def run_migrations_online():
     In this scenario we need to create an Engine
     and associate a connection with the context.
 
+    An Engine or Connection may also be passed in via
+    config.attributes, such as by "alembic serve", along with
+    the name of a schema to migrate, such as by "alembic fleet".
+
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    connectable = config.attributes.get("connection", None)
+    schema = config.attributes.get("schema", None)
+    if connectable is None:
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            version_table_schema=schema,
         )
 
         with context.begin_transaction():
+            if schema is not None:
+                context.get_context().impl.use_schema(schema)
             context.run_migrations()
+            if schema is not None:
+                context.get_context().impl.use_schema(None)
 
 
 if context.is_offline_mode():
@@ -57,14 +57,15 @@ def run_migrations_offline():
 
     """
     # for the --sql use case, run migrations for each URL into
-    # individual files.
+    # individual files, one database per thread.
 
     engines = {}
     for name in re.split(r",\s*", db_names):
         engines[name] = rec = {}
         rec["url"] = context.config.get_section_option(name, "sqlalchemy.url")
 
-    for name, rec in engines.items():
+    def migrate(name):
+        rec = engines[name]
         logger.info("Migrating database %s" % name)
         file_ = "%s.sql" % name
         logger.info("Writing output to %s" % file_)
@@ -78,6 +79,8 @@ def run_migrations_offline():
             with context.begin_transaction():
                 context.run_migrations(engine_name=name)
 
+    context.run_concurrently(migrate, engines)
+
 
 def run_migrations_online():
     """Run migrations in 'online' mode.
@@ -87,8 +90,10 @@ def run_migrations_online():
 
     """
 
-    # for the direct-to-DB use case, start a transaction on all
-    # engines, then run all migrations, then commit all transactions.
+    # for the direct-to-DB use case, run migrations for each database
+    # in its own thread with its own connection and transaction; commit
+    # all transactions only once migrations for every database have
+    # succeeded.
 
     engines = {}
     for name in re.split(r",\s*", db_names):
@@ -99,39 +104,39 @@ def run_migrations_online():
             poolclass=pool.NullPool,
         )
 
-    for name, rec in engines.items():
-        engine = rec["engine"]
-        rec["connection"] = conn = engine.connect()
+    def migrate(name):
+        rec = engines[name]
+        connection = rec["engine"].connect()
+        try:
+            if USE_TWOPHASE:
+                transaction = connection.begin_twophase()
+            else:
+                transaction = connection.begin()
+
+            try:
+                logger.info("Migrating database %s" % name)
+                context.configure(
+                    connection=connection,
+                    upgrade_token="%s_upgrades" % name,
+                    downgrade_token="%s_downgrades" % name,
+                    target_metadata=target_metadata.get(name),
+                )
+                context.run_migrations(engine_name=name)
 
-        if USE_TWOPHASE:
-            rec["transaction"] = conn.begin_twophase()
-        else:
-            rec["transaction"] = conn.begin()
+                if USE_TWOPHASE:
+                    transaction.prepare()
 
-    try:
-        for name, rec in engines.items():
-            logger.info("Migrating database %s" % name)
-            context.configure(
-                connection=rec["connection"],
-                upgrade_token="%s_upgrades" % name,
-                downgrade_token="%s_downgrades" % name,
-                target_metadata=target_metadata.get(name),
-            )
-            context.run_migrations(engine_name=name)
-
-        if USE_TWOPHASE:
-            for rec in engines.values():
-                rec["transaction"].prepare()
-
-        for rec in engines.values():
-            rec["transaction"].commit()
-    except:
-        for rec in engines.values():
-            rec["transaction"].rollback()
-        raise
-    finally:
-        for rec in engines.values():
-            rec["connection"].close()
+                # wait for the other databases to be migrated
+                yield
+
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            connection.close()
+
+    context.run_concurrently(migrate, engines)
 
 
 if context.is_offline_mode():
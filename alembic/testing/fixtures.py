@@ -168,7 +168,9 @@ def op_fixture(
 
             buf.write(sql)
 
-        connection = mock.Mock(dialect=ctx_dialect, execute=execute)
+        connection = mock.Mock(
+            dialect=ctx_dialect, execute=execute, in_transaction=lambda: False
+        )
     else:
         opts["output_buffer"] = buf
         connection = None
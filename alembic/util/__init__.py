@@ -19,6 +19,7 @@ from .messaging import write_outstream  # noqa
 from .pyfiles import coerce_resource_to_filename  # noqa
 from .pyfiles import edit  # noqa
 from .pyfiles import load_python_file  # noqa
+from .pyfiles import parse_module_literals  # noqa
 from .pyfiles import pyc_file_from_path  # noqa
 from .pyfiles import template_to_file  # noqa
 from .sqla_compat import sqla_09  # noqa
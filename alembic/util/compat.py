@@ -17,6 +17,11 @@ else:
     # accepts strings
     from StringIO import StringIO  # noqa
 
+if py3k:
+    import socketserver
+else:
+    import SocketServer as socketserver  # noqa
+
 if py3k:
     import builtins as compat_builtins
 
@@ -34,6 +39,8 @@ if py3k:
         return s
 
     range = range  # noqa
+
+    from sys import intern  # noqa
 else:
     import __builtin__ as compat_builtins
 
@@ -50,6 +57,13 @@ else:
 
     range = xrange  # noqa
 
+    def intern(s):  # noqa
+        # the builtin accepts only byte strings
+        if isinstance(s, str):
+            return compat_builtins.intern(s)
+        return s
+
+
 if py33:
     import collections.abc as collections_abc
 else:
@@ -1,5 +1,7 @@
 import collections
+from contextlib import contextmanager
 import textwrap
+import threading
 import uuid
 import warnings
 
@@ -18,6 +20,44 @@ class _ModuleClsMeta(type):
         cls._update_module_proxies(key)
 
 
+class _ThreadLocalProxy(object):
+    """Stands in for the object proxied by a module, dispatching to
+    the object installed within the current thread, if any, else to
+    the object installed before it."""
+
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = stack = []
+            return stack
+
+    def __getattr__(self, name):
+        stack = self._stack
+        return getattr(stack[-1] if stack else self._default, name)
+
+
+class _ThreadLocalAttribute(object):
+    """Stands in for a non-method attribute of the object proxied by a
+    module, such as ``context.config``, dispatching to that attribute of
+    the object installed within the current thread."""
+
+    def __init__(self, proxy, name):
+        self._proxy = proxy
+        self._name = name
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._proxy, self._name), name)
+
+    def __repr__(self):
+        return repr(getattr(self._proxy, self._name))
+
+
 class ModuleClsProxy(with_metaclass(_ModuleClsMeta)):
     """Create module level proxy functions for the
     methods on a given class.
@@ -38,6 +78,10 @@ class ModuleClsProxy(with_metaclass(_ModuleClsMeta)):
     def _install_proxy(self):
         attr_names, modules = self._setups[self.__class__]
         for globals_, locals_ in modules:
+            current = globals_.get("_proxy")
+            if isinstance(current, _ThreadLocalProxy):
+                current._stack.append(self)
+                continue
             globals_["_proxy"] = self
             for attr_name in attr_names:
                 globals_[attr_name] = getattr(self, attr_name)
@@ -45,10 +89,49 @@ class ModuleClsProxy(with_metaclass(_ModuleClsMeta)):
     def _remove_proxy(self):
         attr_names, modules = self._setups[self.__class__]
         for globals_, locals_ in modules:
+            current = globals_.get("_proxy")
+            if isinstance(current, _ThreadLocalProxy):
+                current._stack.remove(self)
+                continue
             globals_["_proxy"] = None
             for attr_name in attr_names:
                 del globals_[attr_name]
 
+    @classmethod
+    @contextmanager
+    def _thread_local_proxies(cls):
+        """Within the block, objects installed as the proxy for this
+        class are local to the thread which installs them.
+
+        Module-level attributes other than methods, such as
+        ``context.config``, are replaced by stand-ins which forward
+        attribute access to those of the thread's object.
+
+        """
+        attr_names, modules = cls._setups[cls]
+        names = ["_proxy"] + sorted(attr_names)
+        previous = [
+            dict((name, globals_[name]) for name in names if name in globals_)
+            for globals_, locals_ in modules
+        ]
+        for globals_, locals_ in modules:
+            proxy = globals_["_proxy"] = _ThreadLocalProxy(
+                globals_.get("_proxy")
+            )
+            for attr_name in attr_names:
+                globals_[attr_name] = _ThreadLocalAttribute(proxy, attr_name)
+        try:
+            yield
+        finally:
+            for (globals_, locals_), values in zip(modules, previous):
+                for name in names:
+                    if name in values:
+                        globals_[name] = values[name]
+                    elif name != "_proxy":
+                        del globals_[name]
+                    else:
+                        globals_[name] = None
+
     @classmethod
     def create_module_class_proxy(cls, globals_, locals_):
         attr_names, modules = cls._setups[cls]
@@ -1,3 +1,4 @@
+import ast
 import os
 import re
 import tempfile
@@ -9,6 +10,8 @@ from .compat import get_current_bytecode_suffixes
 from .compat import has_pep3147
 from .compat import load_module_py
 from .compat import load_module_pyc
+from .compat import py2k
+from .compat import string_types
 from .exc import CommandError
 
 
@@ -79,10 +82,15 @@ def edit(path):
         raise CommandError("Error executing editor (%s)" % (exc,))
 
 
-def load_python_file(dir_, filename):
-    """Load a file from the given path as a Python module."""
+def load_python_file(dir_, filename, module_id=None):
+    """Load a file from the given path as a Python module.
 
-    module_id = re.sub(r"\W", "_", filename)
+    The module is named after the file unless a ``module_id`` is given.
+
+    """
+
+    if module_id is None:
+        module_id = re.sub(r"\W", "_", filename)
     path = os.path.join(dir_, filename)
     _, ext = os.path.splitext(filename)
     if ext == ".py":
@@ -97,3 +105,101 @@ def load_python_file(dir_, filename):
     elif ext in (".pyc", ".pyo"):
         module = load_module_pyc(module_id, path)
     return module
+
+
+def parse_module_literals(dir_, filename, names):
+    """Statically read module-level literal assignments from a Python
+    source file, without executing it.
+
+    Returns a dictionary of those of the given names which are assigned
+    plain literal values at the module level, e.g. strings, tuples or
+    ``None``, along with the module docstring under the key ``__doc__``.
+    Names which aren't assigned are omitted.  Returns None if any of the
+    given names is bound in some other way, such as to the result of an
+    expression, within a conditional block or via an import, or if the
+    file isn't a ``.py`` file or can't be parsed.
+
+    """
+    if os.path.splitext(filename)[1] != ".py":
+        return None
+    path = os.path.join(dir_, filename)
+    try:
+        with open(path, "rb") as fp:
+            source = fp.read()
+        tree = ast.parse(source, path)
+    except (IOError, OSError, SyntaxError, ValueError, TypeError):
+        return None
+
+    literals = {}
+    dynamic = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif _ast_annassign is not None and isinstance(node, _ast_annassign):
+            targets = [node.target]
+        else:
+            dynamic.update(_bound_names(node))
+            continue
+
+        try:
+            value = ast.literal_eval(node.value)
+        except (ValueError, TypeError):
+            dynamic.update(_bound_names(node))
+            continue
+
+        for target in targets:
+            if isinstance(target, ast.Name):
+                literals[target.id] = value
+            else:
+                dynamic.update(_bound_names(target))
+
+    if dynamic.intersection(names):
+        return None
+    literals = dict(
+        (name, value) for name, value in literals.items() if name in names
+    )
+
+    doc = ast.get_docstring(tree, clean=False)
+    if py2k and isinstance(doc, str):
+        from mako.util import parse_encoding
+
+        with open(path, "rb") as fp:
+            source_encoding = parse_encoding(fp)
+        if source_encoding:
+            doc = doc.decode(source_encoding)
+    literals["__doc__"] = doc
+    return literals
+
+
+_ast_annassign = getattr(ast, "AnnAssign", None)
+_ast_scopes = tuple(
+    getattr(ast, name)
+    for name in ("FunctionDef", "AsyncFunctionDef", "ClassDef")
+    if hasattr(ast, name)
+)
+
+
+def _bound_names(node):
+    """Yield the names which the given statement may bind within the
+    scope in which it is present."""
+
+    if isinstance(node, ast.Name):
+        if not isinstance(node.ctx, ast.Load):
+            yield node.id
+    elif isinstance(node, ast.alias):
+        yield (node.asname or node.name).split(".")[0]
+    elif isinstance(node, ast.ExceptHandler) and isinstance(
+        node.name, string_types
+    ):
+        yield node.name
+    elif isinstance(node, _ast_scopes):
+        yield node.name
+        for sub in ast.walk(node):
+            if isinstance(sub, ast.Global):
+                for name in sub.names:
+                    yield name
+        return
+
+    for child in ast.iter_child_nodes(node):
+        for name in _bound_names(child):
+            yield name
@@ -0,0 +1,105 @@
+"""Compare lineage queries against a :class:`.RevisionMap` with and without
+the ``lineage_index`` option.
+
+Run as::
+
+    python -m tests.perf.lineage_index --revisions 10000
+
+"""
+import argparse
+import random
+import sys
+import time
+
+from alembic.script.revision import Revision
+from alembic.script.revision import RevisionMap
+
+
+def branchy_revisions(count, seed=10):
+    """Produce a graph of ``count`` revisions with many branches, which
+    regularly merge back together.
+
+    """
+    rnd = random.Random(seed)
+    revisions = [Revision("r0", None)]
+    heads = ["r0"]
+    for idx in range(1, count):
+        rev_id = "r%d" % idx
+        roll = rnd.random()
+        if roll < 0.05 and len(heads) > 1:
+            down = tuple(rnd.sample(heads, 2))
+            heads = [h for h in heads if h not in down]
+        elif roll < 0.15 or not heads:
+            down = rnd.choice(revisions).revision
+        else:
+            down = heads.pop(rnd.randrange(len(heads)))
+        revisions.append(Revision(rev_id, down))
+        heads.append(rev_id)
+    return revisions
+
+
+def run(revisions, lineage_index, queries):
+    # Revision objects keep their nextrev collections, so each map
+    # gets its own copies
+    map_ = RevisionMap(
+        lambda: [
+            Revision(rev.revision, rev.down_revision) for rev in revisions
+        ],
+        lineage_index=lineage_index,
+    )
+    timings = {}
+
+    now = time.time()
+    map_._revision_map
+    map_._lineage_index
+    timings["build"] = time.time() - now
+
+    rnd = random.Random(5)
+    sample = [
+        map_.get_revision(rnd.choice(revisions).revision)
+        for _ in range(queries)
+    ]
+
+    now = time.time()
+    for rev in sample:
+        set(map_._get_ancestor_nodes([rev]))
+        set(map_._get_descendant_nodes([rev]))
+    timings["ancestors/descendants"] = time.time() - now
+
+    now = time.time()
+    for rev in sample:
+        for head in map_.heads[0:10]:
+            map_._shares_lineage(rev, head)
+    timings["shares_lineage"] = time.time() - now
+
+    now = time.time()
+    map_._filter_into_branch_heads(sample)
+    timings["filter_into_branch_heads"] = time.time() - now
+
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--revisions", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    options = parser.parse_args(argv)
+
+    revisions = branchy_revisions(options.revisions)
+    results = [
+        (lineage_index, run(revisions, lineage_index, options.queries))
+        for lineage_index in (False, True)
+    ]
+
+    sys.stdout.write(
+        "%d revisions, %d queries\n" % (options.revisions, options.queries)
+    )
+    for name in sorted(results[0][1]):
+        sys.stdout.write(
+            "%-28s traversal %8.3fs   lineage_index %8.3fs\n"
+            % (name, results[0][1][name], results[1][1][name])
+        )
+
+
+if __name__ == "__main__":
+    main()
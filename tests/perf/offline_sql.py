@@ -0,0 +1,222 @@
+"""Benchmark the generation of SQL scripts in "offline" mode, as takes place
+for ``alembic upgrade --sql``.
+
+Run as::
+
+    python -m tests.perf.offline_sql --migrations 1000 --json results.json
+
+and compare a later run against those results with::
+
+    python -m tests.perf.offline_sql --migrations 1000 --compare results.json
+
+Each scenario renders a synthetic linear history of ``--migrations``
+migrations through :class:`.Operations` against a :class:`.MigrationContext`
+in "offline" mode, advancing the version table after each migration.  Every
+migration applies the same handful of operations for each of ``--tenants``
+schemas, as a history maintained across per-tenant schemas would.  Timings
+are the best of ``--repeat`` runs, reported both in total, in seconds, and
+per statement, in microseconds.
+
+"""
+import argparse
+import gc
+import io
+import json
+import platform
+import sys
+import time
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from alembic import __version__
+from alembic import migration
+from alembic.operations import Operations
+
+
+def _text_migration(op, schema, idx):
+    op.execute(
+        "UPDATE %s.account SET status = 'active' WHERE status IS NULL" % schema
+    )
+    op.execute("DELETE FROM %s.audit_log WHERE archived = 1" % schema)
+
+
+def _ddl_migration(op, schema, idx):
+    op.rename_table("account", "account_tmp", schema=schema)
+    op.rename_table("account_tmp", "account", schema=schema)
+    op.drop_column("account", "legacy", schema=schema)
+
+
+def _mixed_migration(op, schema, idx):
+    op.add_column(
+        "account", Column("c%d" % (idx % 10), String(50)), schema=schema
+    )
+    op.alter_column(
+        "account",
+        "c%d" % (idx % 10),
+        type_=Integer,
+        existing_type=String(50),
+        schema=schema,
+    )
+    _text_migration(op, schema, idx)
+
+
+scenarios = {
+    "text": _text_migration,
+    "ddl": _ddl_migration,
+    "mixed": _mixed_migration,
+}
+
+
+def _render(migration_fn, migrations, tenants, dialect):
+    schemas = ["tenant_%d" % idx for idx in range(tenants)]
+    buf = io.StringIO()
+
+    def run():
+        buf.seek(0)
+        buf.truncate()
+        context = migration.MigrationContext.configure(
+            dialect_name=dialect, opts={"as_sql": True, "output_buffer": buf},
+        )
+        op = Operations(context)
+        head_maintainer = migration.HeadMaintainer(context, ())
+        previous = None
+        for idx in range(migrations):
+            for schema in schemas:
+                migration_fn(op, schema, idx)
+            revision = "r%d" % idx
+            head_maintainer.update_to_step(
+                migration.StampStep(previous, revision, True, previous is None)
+            )
+            previous = revision
+
+    return run, buf
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        now = time.time()
+        fn()
+        elapsed = time.time() - now
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(migration_fn, migrations, tenants, dialect, repeat=3):
+    """Run the benchmark for one scenario, returning a dictionary
+    of measurement names to values.
+
+    """
+    fn, buf = _render(migration_fn, migrations, tenants, dialect)
+    elapsed = _best(fn, repeat)
+    statements = buf.getvalue().count(";\n")
+    return {
+        "render": elapsed,
+        "statements": statements,
+        "render_per_statement_us": elapsed * 1000000 / statements,
+    }
+
+
+def _print_results(results, baseline=None):
+    if baseline is not None:
+        baseline = dict(
+            ((entry["scenario"], entry["migrations"]), entry["results"])
+            for entry in baseline["benchmarks"]
+        )
+    for entry in results["benchmarks"]:
+        sys.stdout.write(
+            "\n%s, %d migrations\n" % (entry["scenario"], entry["migrations"])
+        )
+        previous = (
+            baseline.get((entry["scenario"], entry["migrations"]))
+            if baseline
+            else None
+        )
+        for name, value in sorted(entry["results"].items()):
+            if name == "statements":
+                line = "    %-28s %12d" % (name, value)
+            elif name.endswith("_us"):
+                line = "    %-28s %12.1fus" % (name, value)
+            else:
+                line = "    %-28s %12.4fs" % (name, value)
+            if previous and previous.get(name):
+                line += "   %+7.1f%%" % (
+                    (value - previous[name]) * 100.0 / previous[name]
+                )
+            sys.stdout.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(sorted(scenarios)),
+        help="comma separated scenarios to run, from %s"
+        % ", ".join(sorted(scenarios)),
+    )
+    parser.add_argument(
+        "--migrations",
+        default="100,1000",
+        help="comma separated migration counts",
+    )
+    parser.add_argument(
+        "--tenants",
+        type=int,
+        default=10,
+        help="number of schemas each migration is applied to",
+    )
+    parser.add_argument("--dialect", default="postgresql")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--json", help="write results as JSON to the given file, or '-'"
+    )
+    parser.add_argument(
+        "--compare", help="compare against the JSON results in the given file"
+    )
+    options = parser.parse_args(argv)
+
+    results = {
+        "alembic": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dialect": options.dialect,
+        "tenants": options.tenants,
+        "repeat": options.repeat,
+        "benchmarks": [],
+    }
+    for scenario in options.scenarios.split(","):
+        for count in options.migrations.split(","):
+            results["benchmarks"].append(
+                {
+                    "scenario": scenario,
+                    "migrations": int(count),
+                    "results": run(
+                        scenarios[scenario],
+                        int(count),
+                        options.tenants,
+                        options.dialect,
+                        repeat=options.repeat,
+                    ),
+                }
+            )
+
+    if options.json == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        if options.json:
+            with open(options.json, "w") as file_:
+                json.dump(results, file_, indent=2, sort_keys=True)
+        baseline = None
+        if options.compare:
+            with open(options.compare) as file_:
+                baseline = json.load(file_)
+        _print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
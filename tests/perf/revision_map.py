@@ -0,0 +1,364 @@
+"""Benchmark building, querying and traversing a :class:`.RevisionMap`
+over synthesized revision graphs of various shapes and sizes.
+
+Run as::
+
+    python -m tests.perf.revision_map --sizes 1000,10000 --json results.json
+
+and compare a later run against those results with::
+
+    python -m tests.perf.revision_map --sizes 1000,10000 \\
+        --compare results.json
+
+Each shape is generated from a fixed seed, so that results from different
+commits are measured against the same graphs.  Timings are the best of
+``--repeat`` runs, in seconds; memory is the size of the revision map as
+measured by ``tracemalloc``, where available, both for plain
+:class:`.Revision` objects and for :class:`.Script` objects as produced
+from a revision index.
+
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from alembic import __version__
+from alembic.script import Script
+from alembic.script import ScriptDirectory
+from alembic.script.revision import Revision
+from alembic.script.revision import RevisionMap
+
+
+def _ids(rnd):
+    seen = set()
+    while True:
+        rev_id = "%012x" % rnd.getrandbits(48)
+        if rev_id not in seen:
+            seen.add(rev_id)
+            yield rev_id
+
+
+def linear(count, seed=10):
+    """A single chain of revisions."""
+
+    ids = _ids(random.Random(seed))
+    specs = []
+    down = None
+    for _ in range(count):
+        rev_id = next(ids)
+        specs.append((rev_id, down, None, None))
+        down = rev_id
+    return specs
+
+
+def wide(count, seed=10, width=50):
+    """``width`` labeled branches extending from a single base, which
+    never merge.
+
+    """
+    rnd = random.Random(seed)
+    ids = _ids(rnd)
+    base = next(ids)
+    specs = [(base, None, None, None)]
+    heads = [base] * width
+    for idx in range(1, count):
+        branch = rnd.randrange(width)
+        rev_id = next(ids)
+        label = "branch%d" % branch if heads[branch] == base else None
+        specs.append((rev_id, heads[branch], label, None))
+        heads[branch] = rev_id
+    return specs
+
+
+def merges(count, seed=10):
+    """Short lived branches which are continually merged back together."""
+
+    rnd = random.Random(seed)
+    ids = _ids(rnd)
+    specs = [(next(ids), None, None, None)]
+    heads = [specs[0][0]]
+    for idx in range(1, count):
+        rev_id = next(ids)
+        roll = rnd.random()
+        if len(heads) > 1 and (roll < 0.2 or len(heads) > 8):
+            down = tuple(rnd.sample(heads, 2))
+            heads = [head for head in heads if head not in down]
+        elif roll < 0.35:
+            down = rnd.choice(specs[-20:])[0]
+        else:
+            down = heads.pop(rnd.randrange(len(heads)))
+        specs.append((rev_id, down, None, None))
+        heads.append(rev_id)
+    return specs
+
+
+def dependencies(count, seed=10, roots=10):
+    """``roots`` independent labeled branches, each with its own base,
+    whose revisions frequently depend on revisions of the other branches.
+
+    """
+    rnd = random.Random(seed)
+    ids = _ids(rnd)
+    specs = []
+    heads = [None] * roots
+    history = [[] for _ in range(roots)]
+    for idx in range(count):
+        branch = idx % roots if idx < roots else rnd.randrange(roots)
+        rev_id = next(ids)
+        label = "root%d" % branch if heads[branch] is None else None
+        depends_on = None
+        others = [
+            other
+            for other in range(roots)
+            if other != branch and history[other]
+        ]
+        if others and rnd.random() < 0.3:
+            depends_on = rnd.choice(history[rnd.choice(others)][-50:])
+        specs.append((rev_id, heads[branch], label, depends_on))
+        heads[branch] = rev_id
+        history[branch].append(rev_id)
+    return specs
+
+
+shapes = {
+    "linear": linear,
+    "wide": wide,
+    "merges": merges,
+    "dependencies": dependencies,
+}
+
+
+def _revisions(specs):
+    # Revision objects accumulate their nextrev collections within a map,
+    # so each map is built from new ones
+    return [
+        Revision(rev_id, down, branch_labels=label, dependencies=depends_on)
+        for rev_id, down, label, depends_on in specs
+    ]
+
+
+def _scripts(specs):
+    # scripts as produced from a revision index, without their modules
+    return [
+        Script(
+            None,
+            rev_id,
+            "/versions/%s_revision.py" % rev_id,
+            header={
+                "revision": rev_id,
+                "down_revision": down,
+                "branch_labels": label,
+                "depends_on": depends_on,
+                "doc": "revision %s" % rev_id,
+            },
+        )
+        for rev_id, down, label, depends_on in specs
+    ]
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        now = time.time()
+        fn()
+        elapsed = time.time() - now
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _memory(specs, lineage_index, factory=_revisions):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        revisions = factory(specs)
+        map_ = RevisionMap(lambda: revisions, lineage_index=lineage_index)
+        map_.heads
+        map_._lineage_index
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size
+
+
+def run(specs, script, lineage_index=False, repeat=3, lookups=1000):
+    """Run the benchmarks against a single graph, returning a dictionary
+    of measurement names to values.
+
+    """
+    results = {}
+
+    def build():
+        map_ = RevisionMap(
+            lambda: _revisions(specs), lineage_index=lineage_index
+        )
+        map_.heads
+        map_._lineage_index
+        return map_
+
+    results["build"] = _best(build, repeat)
+
+    script.revision_map = map_ = build()
+    rnd = random.Random(5)
+    sample = [rnd.choice(specs)[0] for _ in range(lookups)]
+    heads = map_.heads
+
+    results["get_revision"] = _best(
+        lambda: [map_.get_revision(rev_id) for rev_id in sample], repeat
+    )
+    results["get_revision_partial"] = _best(
+        lambda: [map_.get_revision(rev_id[0:8]) for rev_id in sample], repeat
+    )
+    results["get_revisions_heads"] = _best(
+        lambda: map_.get_revisions("heads"), repeat
+    )
+    results["iterate_revisions"] = _best(
+        lambda: list(map_.iterate_revisions("heads", "base")), repeat
+    )
+    results["upgrade_revs"] = _best(
+        lambda: script._upgrade_revs("heads", None), repeat
+    )
+    results["downgrade_revs"] = _best(
+        lambda: script._downgrade_revs("base", heads), repeat
+    )
+    results["stamp_revs"] = _best(
+        lambda: script._stamp_revs("heads", ()), repeat
+    )
+    results["stamp_revs_base"] = _best(
+        lambda: script._stamp_revs("base", heads), repeat
+    )
+
+    memory = _memory(specs, lineage_index)
+    results["memory"] = memory
+    results["memory_per_revision"] = (
+        memory / float(len(specs)) if memory is not None else None
+    )
+    memory = _memory(specs, lineage_index, _scripts)
+    results["script_memory"] = memory
+    results["script_memory_per_revision"] = (
+        memory / float(len(specs)) if memory is not None else None
+    )
+    results["heads"] = len(heads)
+    return results
+
+
+def _print_results(results, baseline=None):
+    if baseline is not None:
+        baseline = dict(
+            ((entry["shape"], entry["revisions"]), entry["results"])
+            for entry in baseline["benchmarks"]
+        )
+    for entry in results["benchmarks"]:
+        sys.stdout.write(
+            "\n%s, %d revisions, %d heads\n"
+            % (entry["shape"], entry["revisions"], entry["results"]["heads"])
+        )
+        previous = (
+            baseline.get((entry["shape"], entry["revisions"]))
+            if baseline
+            else None
+        )
+        for name, value in sorted(entry["results"].items()):
+            if name == "heads" or value is None:
+                continue
+            if "memory" in name:
+                line = "    %-24s %12d bytes" % (name, value)
+            else:
+                line = "    %-24s %12.4fs" % (name, value)
+            if previous and previous.get(name):
+                line += "   %+7.1f%%" % (
+                    (value - previous[name]) * 100.0 / previous[name]
+                )
+            sys.stdout.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--shapes",
+        default=",".join(sorted(shapes)),
+        help="comma separated shapes to run, from %s"
+        % ", ".join(sorted(shapes)),
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,50000",
+        help="comma separated revision counts",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument(
+        "--lineage-index",
+        action="store_true",
+        help="run with the lineage_index option enabled",
+    )
+    parser.add_argument(
+        "--json", help="write results as JSON to the given file, or '-'"
+    )
+    parser.add_argument(
+        "--compare", help="compare against the JSON results in the given file"
+    )
+    options = parser.parse_args(argv)
+
+    results = {
+        "alembic": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "lineage_index": options.lineage_index,
+        "repeat": options.repeat,
+        "lookups": options.lookups,
+        "benchmarks": [],
+    }
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        script = ScriptDirectory(tempdir)
+        for shape in options.shapes.split(","):
+            for size in options.sizes.split(","):
+                specs = shapes[shape](int(size))
+                results["benchmarks"].append(
+                    {
+                        "shape": shape,
+                        "revisions": len(specs),
+                        "results": run(
+                            specs,
+                            script,
+                            lineage_index=options.lineage_index,
+                            repeat=options.repeat,
+                            lookups=options.lookups,
+                        ),
+                    }
+                )
+    finally:
+        shutil.rmtree(tempdir)
+
+    if options.json == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        if options.json:
+            with open(options.json, "w") as file_:
+                json.dump(results, file_, indent=2, sort_keys=True)
+        baseline = None
+        if options.compare:
+            with open(options.compare) as file_:
+                baseline = json.load(file_)
+        _print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Benchmark the per-step overhead of maintaining the version table, as
+takes place for each migration step run by
+:meth:`.MigrationContext.run_migrations`.
+
+Run as::
+
+    python -m tests.perf.version_table --steps 1000 --json results.json
+
+and compare a later run against those results with::
+
+    python -m tests.perf.version_table --steps 1000 --compare results.json
+
+Each scenario applies ``--steps`` stamp steps through a
+:class:`.HeadMaintainer`, either against an in-memory SQLite database, or
+rendering SQL in "offline" mode.  Timings are the best of ``--repeat``
+runs, reported both in total, in seconds, and per step, in microseconds.
+
+"""
+import argparse
+import gc
+import io
+import json
+import platform
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+from alembic import __version__
+from alembic import migration
+
+
+def _linear_steps(count):
+    steps = [migration.StampStep(None, "r0", True, True)]
+    for idx in range(1, count):
+        steps.append(
+            migration.StampStep("r%d" % (idx - 1), "r%d" % idx, True, False)
+        )
+    return steps
+
+
+def _branch_steps(count):
+    # alternately create and delete a second branch alongside a main line
+    steps = [migration.StampStep(None, "r0", True, True)]
+    for idx in range(1, count):
+        if idx % 2:
+            steps.append(migration.StampStep(None, "b%d" % idx, True, True))
+        else:
+            steps.append(
+                migration.StampStep("b%d" % (idx - 1), None, False, True)
+            )
+    return steps
+
+
+scenarios = {"linear": _linear_steps, "branches": _branch_steps}
+
+
+def _online(steps):
+    engine = create_engine("sqlite://")
+    conn = engine.connect()
+    context = migration.MigrationContext.configure(connection=conn)
+
+    def run():
+        with conn.begin() as trans:
+            context._ensure_version_table()
+            head_maintainer = migration.HeadMaintainer(context, ())
+            for step in steps:
+                head_maintainer.update_to_step(step)
+            trans.rollback()
+
+    return run
+
+
+def _offline(steps):
+    def run():
+        context = migration.MigrationContext.configure(
+            dialect_name="postgresql",
+            opts={"as_sql": True, "output_buffer": io.StringIO()},
+        )
+        head_maintainer = migration.HeadMaintainer(context, ())
+        for step in steps:
+            head_maintainer.update_to_step(step)
+
+    return run
+
+
+modes = {"online": _online, "offline": _offline}
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        now = time.time()
+        fn()
+        elapsed = time.time() - now
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(steps, repeat=3):
+    """Run the benchmarks against a list of steps, returning a dictionary
+    of measurement names to values.
+
+    """
+    results = {}
+    for name, mode in sorted(modes.items()):
+        elapsed = _best(mode(steps), repeat)
+        results[name] = elapsed
+        results["%s_per_step_us" % name] = elapsed * 1000000 / len(steps)
+    return results
+
+
+def _print_results(results, baseline=None):
+    if baseline is not None:
+        baseline = dict(
+            ((entry["scenario"], entry["steps"]), entry["results"])
+            for entry in baseline["benchmarks"]
+        )
+    for entry in results["benchmarks"]:
+        sys.stdout.write(
+            "\n%s, %d steps\n" % (entry["scenario"], entry["steps"])
+        )
+        previous = (
+            baseline.get((entry["scenario"], entry["steps"]))
+            if baseline
+            else None
+        )
+        for name, value in sorted(entry["results"].items()):
+            if name.endswith("_us"):
+                line = "    %-24s %12.1fus" % (name, value)
+            else:
+                line = "    %-24s %12.4fs" % (name, value)
+            if previous and previous.get(name):
+                line += "   %+7.1f%%" % (
+                    (value - previous[name]) * 100.0 / previous[name]
+                )
+            sys.stdout.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(sorted(scenarios)),
+        help="comma separated scenarios to run, from %s"
+        % ", ".join(sorted(scenarios)),
+    )
+    parser.add_argument(
+        "--steps", default="200,2000", help="comma separated step counts"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--json", help="write results as JSON to the given file, or '-'"
+    )
+    parser.add_argument(
+        "--compare", help="compare against the JSON results in the given file"
+    )
+    options = parser.parse_args(argv)
+
+    results = {
+        "alembic": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": options.repeat,
+        "benchmarks": [],
+    }
+    for scenario in options.scenarios.split(","):
+        for count in options.steps.split(","):
+            steps = scenarios[scenario](int(count))
+            results["benchmarks"].append(
+                {
+                    "scenario": scenario,
+                    "steps": len(steps),
+                    "results": run(steps, repeat=options.repeat),
+                }
+            )
+
+    if options.json == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        if options.json:
+            with open(options.json, "w") as file_:
+                json.dump(results, file_, indent=2, sort_keys=True)
+        baseline = None
+        if options.compare:
+            with open(options.compare) as file_:
+                baseline = json.load(file_)
+        _print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
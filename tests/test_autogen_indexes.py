@@ -12,10 +12,12 @@ from sqlalchemy import String
 from sqlalchemy import Table
 from sqlalchemy import UniqueConstraint
 
+from alembic.ddl.impl import DefaultImpl
 from alembic.testing import assertions
 from alembic.testing import config
 from alembic.testing import engines
 from alembic.testing import eq_
+from alembic.testing import mock
 from alembic.testing import TestBase
 from alembic.testing.env import staging_env
 from ._autogen_fixtures import AutogenFixtureTest
@@ -1307,3 +1309,30 @@ class TruncatedIdxTest(AutogenFixtureTest, TestBase):
 
         diffs = self._fixture(m1, m1)
         eq_(diffs, [])
+
+
+class NewIndexOnExistingTableTest(AutogenFixtureTest, TestBase):
+    __only_on__ = "sqlite"
+
+    def setUp(self):
+        self.bind = engines.testing_engine()
+
+    def test_correct_for_autogen_new_index(self):
+        m1 = MetaData()
+        m2 = MetaData()
+        Table("t", m1, Column("x", Integer))
+        Table("t", m2, Column("x", Integer), Index("ix_t_x", "x"))
+        Table("extra", m2, Column("y", Integer), Index("ix_extra_y", "y"))
+
+        with mock.patch.object(
+            DefaultImpl, "correct_for_autogen_new_index", autospec=True
+        ) as correct:
+            diffs = self._fixture(m1, m2)
+
+        eq_(
+            sorted(diff[1].name for diff in diffs if diff[0] == "add_index"),
+            ["ix_extra_y", "ix_t_x"],
+        )
+        eq_(
+            [call[1][1].index_name for call in correct.mock_calls], ["ix_t_x"],
+        )
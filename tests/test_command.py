@@ -173,6 +173,53 @@ finally:
         command.history(self.cfg, verbose=True)
         self._eq_cmd_output(buf, [self.c, self.b, self.a], env_token=True)
 
+    def test_history_limit(self):
+        self.cfg.stdout = buf = self._buf_fixture()
+        command.history(self.cfg, verbose=True, limit=2)
+        self._eq_cmd_output(buf, [self.c, self.b])
+
+    def test_history_num_to_head_limit(self):
+        self.cfg.stdout = buf = self._buf_fixture()
+        command.history(self.cfg, "%s:" % (self.b), verbose=True, limit=1)
+        self._eq_cmd_output(buf, [self.c])
+
+    def test_history_limit_environment(self):
+        self.cfg.stdout = buf = self._buf_fixture()
+        self.cfg.set_main_option("revision_environment", "true")
+        command.history(self.cfg, verbose=True, limit=1)
+        self._eq_cmd_output(buf, [self.c], env_token=True)
+
+    def test_history_modules_not_loaded(self):
+        self.cfg.stdout = buf = self._buf_fixture()
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=util.load_python_file
+        ) as load:
+            command.history(self.cfg, verbose=True)
+        eq_(load.mock_calls, [])
+        self._eq_cmd_output(buf, [self.c, self.b, self.a])
+
+    def test_history_existing_script_directory(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        self.cfg._script_directory = script
+        try:
+            self.cfg.stdout = buf = self._buf_fixture()
+            command.history(self.cfg, verbose=True)
+        finally:
+            self.cfg._script_directory = None
+        eq_(script.lazy_revisions, False)
+        self._eq_cmd_output(buf, [self.c, self.b, self.a])
+
+    def test_history_stops_early(self):
+        self.cfg.stdout = self._buf_fixture()
+        with mock.patch(
+            "alembic.script.revision.RevisionMap._iteration_space"
+        ) as iteration_space, mock.patch(
+            "alembic.script.base.Script.cmd_format", return_value="x"
+        ) as cmd_format:
+            command.history(self.cfg, limit=1)
+        eq_(iteration_space.mock_calls, [])
+        eq_(cmd_format.call_count, 1)
+
     def test_history_indicate_current(self):
         command.stamp(self.cfg, (self.b,))
         self.cfg.stdout = buf = self._buf_fixture()
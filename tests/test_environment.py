@@ -1,20 +1,33 @@
 #!coding: utf-8
 
+import io
+import os
+import threading
+
+from alembic import command
+from alembic import util
+from alembic.ddl.impl import DefaultImpl
 from alembic.environment import EnvironmentContext
 from alembic.migration import MigrationContext
 from alembic.script import ScriptDirectory
+from alembic.testing import assert_raises_message
 from alembic.testing import eq_
 from alembic.testing import is_
 from alembic.testing.assertions import expect_warnings
+from alembic.testing.env import _get_staging_directory
 from alembic.testing.env import _no_sql_testing_config
 from alembic.testing.env import _sqlite_file_db
+from alembic.testing.env import _sqlite_testing_config
 from alembic.testing.env import clear_staging_env
+from alembic.testing.env import env_file_fixture
 from alembic.testing.env import staging_env
+from alembic.testing.env import three_rev_fixture
 from alembic.testing.env import write_script
 from alembic.testing.fixtures import TestBase
 from alembic.testing.mock import call
 from alembic.testing.mock import MagicMock
 from alembic.testing.mock import Mock
+from alembic.testing.mock import patch
 
 
 class EnvironmentTest(TestBase):
@@ -106,3 +119,279 @@ def downgrade():
         env.run_migrations()
 
         eq_(migration_fn.mock_calls, [call((), env._migration_context)])
+
+
+class RunConcurrentlyTest(TestBase):
+    def setUp(self):
+        staging_env()
+        self.cfg = _no_sql_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        self.names = ["db1", "db2", "db3"]
+        self.buffers = dict((name, io.StringIO()) for name in self.names)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _fixture(self):
+        script = ScriptDirectory.from_config(self.cfg)
+
+        def upgrade(rev, context):
+            return script._upgrade_revs(self.c, rev)
+
+        return EnvironmentContext(self.cfg, script, fn=upgrade, as_sql=True)
+
+    def _configure(self, env, name):
+        env.configure(
+            dialect_name="sqlite", output_buffer=self.buffers[name], tag=name,
+        )
+
+    def test_contexts_per_thread(self):
+        env = self._fixture()
+        configured = threading.Event()
+        lock = threading.Lock()
+        waiting = [len(self.names)]
+
+        def migrate(name):
+            self._configure(env, name)
+            with lock:
+                waiting[0] -= 1
+                if not waiting[0]:
+                    configured.set()
+            # run once every thread has configured its context
+            configured.wait()
+            with env.begin_transaction():
+                env.execute("-- database %s" % name)
+                env.run_migrations()
+            eq_(env.get_tag_argument(), "db1")
+
+        with env:
+            self._configure(env, "db1")
+            env.run_concurrently(migrate, self.names)
+            is_(env.get_context().output_buffer, self.buffers["db1"])
+
+        for name in self.names:
+            sql = self.buffers[name].getvalue()
+            eq_(
+                [line for line in sql.split("\n") if line.startswith("--")],
+                [
+                    "-- database %s;" % name,
+                    "-- Running upgrade  -> %s" % self.a,
+                    "-- Running upgrade %s -> %s" % (self.a, self.b),
+                    "-- Running upgrade %s -> %s" % (self.b, self.c),
+                ],
+            )
+            for step in range(1, 4):
+                assert "CREATE STEP %d;" % step in sql
+
+    def test_failure_aborts_others(self):
+        env = self._fixture()
+        completed = []
+
+        def migrate(name):
+            self._configure(env, name)
+            with env.begin_transaction():
+                env.run_migrations()
+            if name == "db2":
+                raise Exception("db2 failed")
+            try:
+                yield
+            except util.CommandError as err:
+                eq_(
+                    str(err),
+                    "Migrations for %s not completed as those of "
+                    "another failed" % name,
+                )
+                raise
+            completed.append(name)
+
+        with env:
+            assert_raises_message(
+                util.CommandError,
+                r"Migrations failed for db2 \(db2 failed\)",
+                env.run_concurrently,
+                migrate,
+                self.names,
+            )
+        eq_(completed, [])
+
+    def test_generators_resumed_on_success(self):
+        env = self._fixture()
+        completed = []
+
+        def migrate(name):
+            self._configure(env, name)
+            with env.begin_transaction():
+                env.run_migrations()
+            yield
+            completed.append(name)
+
+        with env:
+            env.run_concurrently(migrate, self.names)
+        eq_(sorted(completed), self.names)
+
+    def test_workers(self):
+        env = self._fixture()
+        threads = set()
+        completed = []
+
+        def migrate(name):
+            threads.add(threading.current_thread())
+            self._configure(env, name)
+            with env.begin_transaction():
+                env.run_migrations()
+            yield
+            eq_(threading.current_thread().name, name)
+            is_(env.get_context().output_buffer, self.buffers[name])
+            completed.append(name)
+
+        with env:
+            env.run_concurrently(migrate, self.names, workers=2)
+        assert len(threads) <= 2
+        eq_(sorted(completed), self.names)
+        for name in self.names:
+            sql = self.buffers[name].getvalue()
+            for step in range(1, 4):
+                assert "CREATE STEP %d;" % step in sql
+
+    def test_single_worker_failure_aborts_others(self):
+        env = self._fixture()
+        aborted = []
+
+        def migrate(name):
+            self._configure(env, name)
+            with env.begin_transaction():
+                env.run_migrations()
+            if name == "db3":
+                raise Exception("db3 failed")
+            try:
+                yield
+            except util.CommandError:
+                aborted.append(name)
+                raise
+
+        with env:
+            assert_raises_message(
+                util.CommandError,
+                r"Migrations failed for db3 \(db3 failed\)",
+                env.run_concurrently,
+                migrate,
+                self.names,
+                workers=1,
+            )
+        eq_(aborted, ["db1", "db2"])
+
+
+class TenantSchemasTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.schemas = ["t1", "t2", "t3"]
+        self.a = self._revision(None, "x")
+        self.b = self._revision(self.a, "y")
+
+        self._env_fixture(self.schemas)
+
+    def _env_fixture(self, schemas):
+        env_file_fixture(
+            """
+import os
+
+from sqlalchemy import engine_from_config
+
+engine = engine_from_config(
+    config.get_section(config.config_ini_section), prefix="sqlalchemy."
+)
+with engine.connect() as connection:
+    for schema in %r:
+        connection.execute(
+            "ATTACH DATABASE '%%s' AS %%s"
+            %% (os.path.join(%r, "%%s.db" %% schema), schema)
+        )
+    context.configure(connection=connection, tenant_schemas=%r)
+    with context.begin_transaction():
+        context.run_migrations()
+"""
+            % (
+                schemas,
+                os.path.join(_get_staging_directory(), "scripts"),
+                schemas,
+            )
+        )
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _revision(self, down_revision, table):
+        rev = util.rev_id()
+        self.env.generate_revision(rev, "create %s" % table, refresh=True)
+        write_script(
+            self.env,
+            rev,
+            """\
+revision = '%s'
+down_revision = %r
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        '%s',
+        sa.Column('id', sa.Integer, primary_key=True),
+        schema=op.get_context().version_table_schema,
+    )
+
+
+def downgrade():
+    op.drop_table('%s', schema=op.get_context().version_table_schema)
+
+"""
+            % (rev, down_revision, table, table),
+        )
+        return rev
+
+    def _tables(self, schema):
+        engine = _sqlite_file_db(tempname="%s.db" % schema)
+        with engine.connect() as conn:
+            return sorted(
+                row[0]
+                for row in conn.execute(
+                    "select name from sqlite_master where type='table'"
+                )
+            )
+
+    def test_upgrade_each_schema(self):
+        with patch.object(DefaultImpl, "use_schema") as use_schema:
+            command.upgrade(self.cfg, self.a)
+        eq_(
+            use_schema.mock_calls,
+            [call("t1"), call("t2"), call("t3"), call(None)],
+        )
+        for schema in self.schemas:
+            eq_(self._tables(schema), ["alembic_version", "x"])
+
+        with patch.object(DefaultImpl, "use_schema") as use_schema:
+            command.upgrade(self.cfg, self.b)
+        for schema in self.schemas:
+            eq_(self._tables(schema), ["alembic_version", "x", "y"])
+
+    def test_current_schemas_skipped(self):
+        with patch.object(DefaultImpl, "use_schema"):
+            command.upgrade(self.cfg, self.a)
+
+        self._env_fixture(["t2", "t4"])
+
+        with patch.object(DefaultImpl, "use_schema") as use_schema:
+            with patch.object(
+                MigrationContext,
+                "get_current_heads",
+                side_effect=AssertionError("queried per schema"),
+            ):
+                command.upgrade(self.cfg, self.a)
+        eq_(use_schema.mock_calls, [call("t4"), call(None)])
+        eq_(self._tables("t4"), ["alembic_version", "x"])
+
+        with patch.object(DefaultImpl, "use_schema") as use_schema:
+            command.upgrade(self.cfg, "heads")
+        eq_(use_schema.mock_calls, [call("t2"), call("t4"), call(None)])
@@ -0,0 +1,348 @@
+import io
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+
+from alembic import command
+from alembic import fleet
+from alembic import util
+from alembic.ddl.impl import DefaultImpl
+from alembic.fleet import TargetResult
+from alembic.fleet import upgrade_fleet
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from alembic.testing import assert_raises_message
+from alembic.testing import eq_
+from alembic.testing import mock
+from alembic.testing.env import _get_staging_directory
+from alembic.testing.env import _sqlite_file_db
+from alembic.testing.env import _sqlite_testing_config
+from alembic.testing.env import clear_staging_env
+from alembic.testing.env import env_file_fixture
+from alembic.testing.env import staging_env
+from alembic.testing.env import write_script
+from alembic.testing.fixtures import TestBase
+
+
+class FleetUpgradeTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = self._revisions()
+        self.names = ["tenant%d.db" % idx for idx in range(5)]
+        self.urls = [self._url(name) for name in self.names]
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _revisions(self):
+        revs = []
+        for name in ("a", "b", "c"):
+            rev = util.rev_id()
+            self.env.generate_revision(rev, "revision %s" % name, refresh=True)
+            write_script(
+                self.env,
+                rev,
+                """\
+revision = '%s'
+down_revision = %r
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('%s', sa.Column('id', sa.Integer, primary_key=True))
+
+
+def downgrade():
+    op.drop_table('%s')
+
+"""
+                % (rev, revs[-1] if revs else None, name, name),
+            )
+            revs.append(rev)
+        return revs
+
+    def _url(self, name):
+        return "sqlite:///%s" % os.path.join(
+            _get_staging_directory(), "scripts", name
+        )
+
+    def _versions(self, name):
+        engine = _sqlite_file_db(tempname=name)
+        with engine.connect() as conn:
+            return [
+                row[0]
+                for row in conn.execute(
+                    "select version_num from alembic_version"
+                )
+            ]
+
+    def test_upgrade_all(self):
+        results = upgrade_fleet(self.cfg, self.urls, "heads", workers=3)
+
+        eq_([result.target for result in results], self.urls)
+        for result, name in zip(results, self.names):
+            eq_(result.status, TargetResult.UPGRADED)
+            eq_(result.from_heads, ())
+            eq_(result.to_heads, (self.c,))
+            eq_(self._versions(name), [self.c])
+
+    def test_current_targets_skipped(self):
+        command.upgrade(self._config_for(self.urls[1]), self.c)
+        command.upgrade(self._config_for(self.urls[2]), self.a)
+
+        with mock.patch.object(
+            fleet, "_upgrade", side_effect=fleet._upgrade
+        ) as upgrade:
+            results = upgrade_fleet(self.cfg, self.urls, "heads")
+
+        eq_(
+            [result.status for result in results],
+            [
+                TargetResult.UPGRADED,
+                TargetResult.CURRENT,
+                TargetResult.UPGRADED,
+                TargetResult.UPGRADED,
+                TargetResult.UPGRADED,
+            ],
+        )
+        eq_(upgrade.call_count, 4)
+        eq_(results[2].from_heads, (self.a,))
+        eq_(results[2].to_heads, (self.c,))
+
+    def _config_for(self, url):
+        cfg = _sqlite_testing_config()
+        cfg.set_main_option("sqlalchemy.url", url)
+        return cfg
+
+    def test_scripts_loaded_once(self):
+        with mock.patch.object(
+            ScriptDirectory,
+            "from_config",
+            side_effect=ScriptDirectory.from_config,
+        ) as from_config:
+            upgrade_fleet(self.cfg, self.urls, "heads")
+
+        # one load for the fleet; the config of each target returns it
+        eq_(
+            len(
+                [
+                    call
+                    for call in from_config.mock_calls
+                    if call[1][0]._script_directory is None
+                ]
+            ),
+            1,
+        )
+
+    def test_env_named_per_thread(self):
+        loads = []
+
+        def load_python_file(dir_, filename, module_id=None):
+            if filename == "env.py":
+                loads.append((module_id, threading.current_thread().ident))
+            return load(dir_, filename, module_id)
+
+        load = util.load_python_file
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=load_python_file
+        ):
+            upgrade_fleet(self.cfg, self.urls, "heads", workers=3)
+
+        eq_(len(loads), 5)
+        for module_id, ident in loads:
+            eq_(module_id, "env_py_%d" % ident)
+
+        # outside of upgrade_fleet(), env.py is loaded as usual
+        del loads[:]
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=load_python_file
+        ):
+            command.upgrade(self.cfg, "heads")
+        eq_([module_id for module_id, ident in loads], [None])
+
+    def _custom_version_table_fixture(self):
+        env_file_fixture(
+            """
+from sqlalchemy import engine_from_config
+
+connectable = config.attributes.get("connection") or engine_from_config(
+    config.get_section(config.config_ini_section), prefix="sqlalchemy."
+)
+with connectable.connect() as connection:
+    context.configure(connection=connection, version_table="my_version")
+    with context.begin_transaction():
+        context.run_migrations()
+"""
+        )
+        for url in self.urls[0:2]:
+            command.upgrade(self._config_for(url), self.c)
+
+    def test_custom_version_table(self):
+        self._custom_version_table_fixture()
+
+        results = upgrade_fleet(
+            self.cfg, self.urls[0:3], "heads", version_table="my_version"
+        )
+        eq_(
+            [(result.status, result.to_heads) for result in results],
+            [(TargetResult.CURRENT, (self.c,))] * 2
+            + [(TargetResult.UPGRADED, (self.c,))],
+        )
+
+    def test_version_table_unknown(self):
+        self._custom_version_table_fixture()
+
+        with mock.patch.object(
+            fleet, "_upgrade", side_effect=fleet._upgrade
+        ) as upgrade:
+            results = upgrade_fleet(
+                self.cfg, self.urls[0:3], "heads", version_table=None
+            )
+        eq_(upgrade.call_count, 3)
+        eq_(
+            [
+                (result.status, result.from_heads, result.to_heads)
+                for result in results
+            ],
+            [(TargetResult.CURRENT, (self.c,), (self.c,))] * 2
+            + [(TargetResult.UPGRADED, (), (self.c,))],
+        )
+
+    def test_failure_isolated(self):
+        urls = list(self.urls)
+        urls[3] = self._url(os.path.join("nonexistent", "tenant.db"))
+        results = upgrade_fleet(self.cfg, urls, "heads", workers=2)
+
+        eq_(
+            [result.status for result in results],
+            [
+                TargetResult.UPGRADED,
+                TargetResult.UPGRADED,
+                TargetResult.UPGRADED,
+                TargetResult.FAILED,
+                TargetResult.UPGRADED,
+            ],
+        )
+        assert "unable to open database file" in str(results[3].error)
+        eq_(results[3].to_dict()["status"], "failed")
+
+    def test_command_report(self):
+        targets_file = os.path.join(_get_staging_directory(), "targets.txt")
+        with open(targets_file, "w") as file_:
+            file_.write("# tenants\n%s\n\n%s\n" % tuple(self.urls[1:3]))
+
+        buf = io.StringIO()
+        self.cfg.stdout = buf
+        command.upgrade(self._config_for(self.urls[0]), "heads")
+        command.fleet_upgrade(
+            self.cfg, "heads", [self.urls[0], "@%s" % targets_file]
+        )
+
+        lines = buf.getvalue().splitlines()
+        eq_(len(lines), 4)
+        assert lines[0].startswith(
+            "current  %s: %s -> %s (" % (self.urls[0], self.c, self.c)
+        )
+        assert lines[1].startswith(
+            "upgraded %s: base -> %s (" % (self.urls[1], self.c)
+        )
+        eq_(lines[3], "3 targets: 1 current, 2 upgraded")
+
+    def test_command_failure(self):
+        buf = io.StringIO()
+        self.cfg.stdout = buf
+        assert_raises_message(
+            util.CommandError,
+            "Upgrade failed for 1 of 2 targets",
+            command.fleet_upgrade,
+            self.cfg,
+            "heads",
+            [self.urls[0], self._url("nonexistent/tenant.db")],
+        )
+        eq_(
+            buf.getvalue().splitlines()[-1], "2 targets: 1 failed, 1 upgraded",
+        )
+
+    def _schema_engine(self):
+        # each "schema" is an attached SQLite database
+        engine = create_engine(self._url("main.db"))
+
+        @event.listens_for(engine, "connect")
+        def attach(dbapi_connection, connection_record):
+            for name in ("t1", "t2", "t3"):
+                dbapi_connection.execute(
+                    "ATTACH DATABASE '%s' AS %s"
+                    % (
+                        os.path.join(
+                            _get_staging_directory(), "scripts", name + ".db"
+                        ),
+                        name,
+                    )
+                )
+
+        return engine
+
+    def test_schema_targets_checked_together(self):
+        engine = self._schema_engine()
+
+        with engine.connect() as conn:
+            for name in ("t1", "t2"):
+                context = MigrationContext.configure(
+                    conn, opts={"version_table_schema": name}
+                )
+                context.stamp(ScriptDirectory.from_config(self.cfg), self.c)
+
+        self.cfg.attributes["connection"] = engine
+        with mock.patch.object(
+            MigrationContext,
+            "get_current_heads",
+            side_effect=AssertionError("queried per target"),
+        ):
+            results = upgrade_fleet(self.cfg, ["t1", "t2"], "heads")
+        eq_(
+            [(result.status, result.to_heads) for result in results],
+            [(TargetResult.CURRENT, (self.c,))] * 2,
+        )
+
+        with mock.patch.object(
+            fleet, "_upgrade", side_effect=Exception("t3 failed")
+        ):
+            results = upgrade_fleet(self.cfg, ["t1", "t2", "t3"], "heads")
+        eq_(
+            [result.status for result in results],
+            [TargetResult.CURRENT, TargetResult.CURRENT, TargetResult.FAILED],
+        )
+        eq_(results[2].from_heads, ())
+
+    def test_schema_target_generic_template(self):
+        engine = self._schema_engine()
+        self.cfg.attributes["connection"] = engine
+
+        # SQLite has no search path; the generic env.py switches to the
+        # schema of the target, and back again
+        with mock.patch.object(DefaultImpl, "use_schema") as use_schema:
+            results = upgrade_fleet(self.cfg, ["t3"], "heads")
+
+        eq_(results[0].status, TargetResult.UPGRADED)
+        eq_(use_schema.mock_calls, [mock.call("t3"), mock.call(None)])
+        with engine.connect() as conn:
+            eq_(
+                conn.scalar("select version_num from t3.alembic_version"),
+                self.c,
+            )
+
+    def test_schema_target_unsupported(self):
+        self.cfg.attributes["connection"] = self._schema_engine()
+
+        results = upgrade_fleet(self.cfg, ["t3"], "heads")
+        eq_(results[0].status, TargetResult.FAILED)
+        eq_(
+            str(results[0].error),
+            "Running migrations per schema is not supported for "
+            "dialect sqlite",
+        )
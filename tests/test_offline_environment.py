@@ -1,8 +1,19 @@
+import gzip
+import hashlib
+import io
+import json
+import os
 import re
 
 from alembic import command
+from alembic import migration
 from alembic import util
+from alembic.runtime.offline import _independent_chains
+from alembic.script import ScriptDirectory
 from alembic.testing import assert_raises_message
+from alembic.testing import eq_
+from alembic.testing import mock
+from alembic.testing.env import _get_staging_directory
 from alembic.testing.env import _no_sql_testing_config
 from alembic.testing.env import clear_staging_env
 from alembic.testing.env import env_file_fixture
@@ -317,3 +328,392 @@ context.run_migrations()
         command.upgrade(self.cfg, "%s:%s" % (a, b[0:4]), sql=True)
         command.stamp(self.cfg, b[0:4], sql=True)
         command.downgrade(self.cfg, "%s:%s" % (c, b[0:4]), sql=True)
+
+
+class RevisionFileOutputTest(TestBase):
+    def setUp(self):
+        staging_env()
+        self.cfg = _no_sql_testing_config()
+        self.dir_ = os.path.join(_get_staging_directory(), "sql")
+
+        global a, b, c
+        a, b, c = three_rev_fixture(self.cfg)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _env_fixture(self, **kw):
+        env_file_fixture(
+            """
+url = config.get_main_option('sqlalchemy.url')
+context.configure(url=url, output_directory=%r, **%r)
+with context.begin_transaction():
+    context.run_migrations()
+"""
+            % (self.dir_, kw)
+        )
+
+    def _manifest(self):
+        with open(os.path.join(self.dir_, "manifest.json")) as file_:
+            return json.load(file_)
+
+    def _read(self, entry, opener=io.open):
+        with opener(os.path.join(self.dir_, entry["file"]), "rb") as file_:
+            data = file_.read()
+        eq_(hashlib.sha256(data).hexdigest(), entry["sha256"])
+        eq_(len(data), entry["size"])
+        return data.decode("utf-8")
+
+    def test_file_per_revision(self):
+        self._env_fixture()
+        with capture_context_buffer() as buf:
+            command.upgrade(self.cfg, c, sql=True)
+
+        manifest = self._manifest()
+        eq_(
+            [
+                (
+                    entry["sequence"],
+                    entry["file"],
+                    entry["direction"],
+                    entry["from"],
+                    entry["to"],
+                )
+                for entry in manifest["files"]
+            ],
+            [
+                (1, "0001_%s.sql" % a, "upgrade", [], [a]),
+                (2, "0002_%s.sql" % b, "upgrade", [a], [b]),
+                (3, "0003_%s.sql" % c, "upgrade", [b], [c]),
+            ],
+        )
+        eq_(
+            [entry["transaction"] for entry in manifest["files"]],
+            [
+                {"begin": True, "commit": False},
+                {"begin": False, "commit": False},
+                {"begin": False, "commit": True},
+            ],
+        )
+        sql = [self._read(entry) for entry in manifest["files"]]
+        assert sql[0].startswith("BEGIN;")
+        assert "CREATE TABLE alembic_version" in sql[0]
+        assert "-- Running upgrade %s -> %s" % (a, b) in sql[1]
+        assert sql[2].endswith("COMMIT;\n\n")
+
+        # nothing written to the usual output buffer
+        eq_(buf.getvalue(), "")
+
+    def test_same_as_single_output(self):
+        self._env_fixture()
+        command.upgrade(self.cfg, c, sql=True)
+        command.downgrade(self.cfg, "%s:base" % c, sql=True)
+        downgrade = "".join(
+            self._read(entry) for entry in self._manifest()["files"]
+        )
+        eq_(
+            [entry["direction"] for entry in self._manifest()["files"]],
+            ["downgrade", "downgrade", "downgrade"],
+        )
+
+        env_file_fixture(
+            """
+url = config.get_main_option('sqlalchemy.url')
+context.configure(url=url)
+with context.begin_transaction():
+    context.run_migrations()
+"""
+        )
+        with capture_context_buffer() as buf:
+            command.downgrade(self.cfg, "%s:base" % c, sql=True)
+        eq_(downgrade, buf.getvalue())
+
+    def test_transaction_per_migration(self):
+        self._env_fixture(transaction_per_migration=True)
+        command.upgrade(self.cfg, c, sql=True)
+        manifest = self._manifest()
+        for entry in manifest["files"]:
+            eq_(entry["transaction"], {"begin": True, "commit": True})
+            sql = self._read(entry)
+            assert sql.startswith("BEGIN;")
+            assert sql.endswith("COMMIT;\n\n")
+
+    def test_gzip(self):
+        self._env_fixture(output_compression="gzip")
+        command.upgrade(self.cfg, b, sql=True)
+        manifest = self._manifest()
+        eq_(manifest["compression"], "gzip")
+        eq_(
+            [entry["file"] for entry in manifest["files"]],
+            ["0001_%s.sql.gz" % a, "0002_%s.sql.gz" % b],
+        )
+        assert "UPDATE alembic_version SET version_num='%s'" % b in self._read(
+            manifest["files"][1], opener=gzip.open
+        )
+
+    def test_unknown_compression(self):
+        self._env_fixture(output_compression="lz5")
+        assert_raises_message(
+            util.CommandError,
+            "Unknown output_compression 'lz5'; expected one of gzip",
+            command.upgrade,
+            self.cfg,
+            c,
+            sql=True,
+        )
+
+    def test_no_manifest_on_failure(self):
+        env_file_fixture(
+            """
+url = config.get_main_option('sqlalchemy.url')
+context.configure(url=url, output_directory=%r)
+with context.begin_transaction():
+    context.run_migrations()
+raise Exception("env failed")
+"""
+            % self.dir_
+        )
+        assert_raises_message(
+            Exception, "env failed", command.upgrade, self.cfg, c, sql=True
+        )
+        assert os.path.exists(os.path.join(self.dir_, "0003_%s.sql" % c))
+        assert not os.path.exists(os.path.join(self.dir_, "manifest.json"))
+
+    def test_requires_offline_mode(self):
+        assert_raises_message(
+            util.CommandError,
+            "output_directory may only be used in offline mode",
+            migration.MigrationContext.configure,
+            dialect_name="sqlite",
+            opts={"output_directory": self.dir_},
+        )
+
+
+class OfflineWorkersTest(TestBase):
+    def setUp(self):
+        staging_env()
+        self.cfg = _no_sql_testing_config()
+
+        global a, b, c
+        a, b, c = three_rev_fixture(self.cfg)
+        self.d, self.e, self.f = multi_heads_fixture(self.cfg, a, b, c)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _env_fixture(self, **kw):
+        env_file_fixture(
+            """
+url = config.get_main_option('sqlalchemy.url')
+context.configure(url=url, **%r)
+with context.begin_transaction():
+    context.run_migrations()
+"""
+            % kw
+        )
+
+    def _assert_same_as_serial(self, fn, *arg, **kw):
+        self._env_fixture()
+        with capture_context_buffer() as buf:
+            fn(self.cfg, *arg, **kw)
+        serial = buf.getvalue()
+
+        self._env_fixture(offline_workers=2)
+        with capture_context_buffer() as buf:
+            fn(self.cfg, *arg, **kw)
+        eq_(buf.getvalue(), serial)
+        return serial
+
+    def test_chains(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        steps = script._upgrade_revs("heads", ())
+        chains = _independent_chains(steps)
+        eq_(sorted(idx for chain in chains for idx in chain), list(range(6)))
+        eq_(
+            set(
+                tuple(steps[idx].revision.revision for idx in chain)
+                for chain in chains
+            ),
+            set([(a, b), (c,), (self.d, self.e), (self.f,)]),
+        )
+
+    def test_upgrade(self):
+        serial = self._assert_same_as_serial(
+            command.upgrade, "heads", sql=True
+        )
+        for step in range(1, 7):
+            assert "CREATE STEP %d;" % step in serial
+
+    def test_downgrade(self):
+        serial = self._assert_same_as_serial(
+            command.downgrade, "%s:base" % self.e, sql=True
+        )
+        for step in (5, 4, 2, 1):
+            assert "DROP STEP %d;" % step in serial
+
+    def test_transaction_per_migration(self):
+        self._env_fixture(transaction_per_migration=True)
+        with capture_context_buffer() as buf:
+            command.upgrade(self.cfg, "heads", sql=True)
+        serial = buf.getvalue()
+
+        self._env_fixture(transaction_per_migration=True, offline_workers=3)
+        with capture_context_buffer() as buf:
+            command.upgrade(self.cfg, "heads", sql=True)
+        eq_(buf.getvalue(), serial)
+
+    def test_step_metrics_not_counted(self):
+        report = os.path.join(_get_staging_directory(), "metrics.json")
+        self._env_fixture(offline_workers=2, step_metrics_report=report)
+        with capture_context_buffer():
+            command.upgrade(self.cfg, "heads", sql=True)
+
+        with open(report) as file_:
+            steps = json.load(file_)["steps"]
+        eq_(len(steps), 6)
+        for step in steps:
+            eq_(step["statements"], None)
+            eq_(step["ddl_statements"], None)
+
+    def test_rendered_in_pool(self):
+        self._env_fixture(offline_workers=2, some_option={"key": ["value"]})
+        with mock.patch(
+            "alembic.runtime.offline.multiprocessing.Pool"
+        ) as pool:
+            pool.return_value.map.side_effect = lambda fn, args: [
+                fn(arg) for arg in args
+            ]
+            with capture_context_buffer():
+                command.upgrade(self.cfg, "heads", sql=True)
+        eq_(pool.mock_calls[0], mock.call(2))
+
+    def test_non_plain_option_rendered_serially(self):
+        env_file_fixture(
+            """
+url = config.get_main_option('sqlalchemy.url')
+context.configure(
+    url=url, offline_workers=2, some_option=object(),
+)
+with context.begin_transaction():
+    context.run_migrations()
+"""
+        )
+        with mock.patch(
+            "alembic.runtime.offline.multiprocessing.Pool"
+        ) as pool:
+            with capture_context_buffer() as buf:
+                command.upgrade(self.cfg, "heads", sql=True)
+        eq_(pool.mock_calls, [])
+        for step in range(1, 7):
+            assert "CREATE STEP %d;" % step in buf.getvalue()
+
+    def test_linear_rendered_serially(self):
+        self._env_fixture(offline_workers=2)
+        with mock.patch(
+            "alembic.runtime.offline.multiprocessing.Pool"
+        ) as pool:
+            command.upgrade(self.cfg, c, sql=True)
+        eq_(pool.mock_calls, [])
+
+
+class TenantSchemasOfflineTest(TestBase):
+    def setUp(self):
+        staging_env()
+        self.cfg = _no_sql_testing_config()
+
+        global a, b, c
+        a, b, c = three_rev_fixture(self.cfg)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _env_fixture(self, schemas, dialect="postgresql", **kw):
+        env_file_fixture(
+            """
+context.configure(
+    dialect_name=%r, tenant_schemas=%r, transactional_ddl=True, **%r
+)
+with context.begin_transaction():
+    context.run_migrations()
+"""
+            % (dialect, schemas, kw)
+        )
+
+    def test_schema_per_tenant(self):
+        self._env_fixture(["tenant_1", "Tenant 2"])
+        buf = self.cfg.output_buffer = io.StringIO()
+        command.upgrade(self.cfg, b, sql=True)
+
+        eq_(
+            [
+                line
+                for line in buf.getvalue().splitlines()
+                if line
+                and not line.startswith("CREATE TABLE")
+                and not line.startswith("    ")
+                and not line.startswith(")")
+            ],
+            [
+                "BEGIN;",
+                "-- Schema tenant_1",
+                "SET search_path TO tenant_1;",
+                "-- Running upgrade  -> %s" % a,
+                "CREATE STEP 1;",
+                "INSERT INTO tenant_1.alembic_version (version_num) "
+                "VALUES ('%s');" % a,
+                "-- Running upgrade %s -> %s" % (a, b),
+                "CREATE STEP 2;",
+                "UPDATE tenant_1.alembic_version SET version_num='%s' "
+                "WHERE tenant_1.alembic_version.version_num = '%s';" % (b, a),
+                "-- Schema Tenant 2",
+                'SET search_path TO "Tenant 2";',
+                "-- Running upgrade  -> %s" % a,
+                "CREATE STEP 1;",
+                'INSERT INTO "Tenant 2".alembic_version (version_num) '
+                "VALUES ('%s');" % a,
+                "-- Running upgrade %s -> %s" % (a, b),
+                "CREATE STEP 2;",
+                "UPDATE \"Tenant 2\".alembic_version SET version_num='%s' "
+                "WHERE \"Tenant 2\".alembic_version.version_num = '%s';"
+                % (b, a),
+                "RESET search_path;",
+                "COMMIT;",
+            ],
+        )
+        assert "CREATE TABLE tenant_1.alembic_version" in buf.getvalue()
+        assert 'CREATE TABLE "Tenant 2".alembic_version' in buf.getvalue()
+
+    def test_step_metrics_report(self):
+        report = os.path.join(_get_staging_directory(), "metrics.json")
+        self._env_fixture(["tenant_1", "tenant_2"], step_metrics_report=report)
+        self.cfg.output_buffer = io.StringIO()
+        command.upgrade(self.cfg, b, sql=True)
+
+        with open(report) as file_:
+            data = json.load(file_)
+        eq_(data["complete"], True)
+        eq_(
+            [
+                (step["version_table_schema"], step["to"], step["statements"])
+                for step in data["steps"]
+            ],
+            [
+                # the version table is created along with the first step
+                ("tenant_1", [a], 3),
+                ("tenant_1", [b], 2),
+                ("tenant_2", [a], 3),
+                ("tenant_2", [b], 2),
+            ],
+        )
+
+    def test_dialect_not_supported(self):
+        self._env_fixture(["tenant_1"], dialect="sqlite")
+        assert_raises_message(
+            util.CommandError,
+            "Running migrations per schema is not supported for dialect "
+            "sqlite",
+            command.upgrade,
+            self.cfg,
+            a,
+            sql=True,
+        )
@@ -2,6 +2,7 @@
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Enum
 from sqlalchemy import event
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
@@ -948,6 +949,92 @@ class SQLModeOpTest(TestBase):
             "PRIMARY KEY (id), FOREIGN KEY(st_id) REFERENCES some_table (id))"
         )
 
+    def test_repeated_statements_compiled_once(self):
+        context = op_fixture(as_sql=True)
+
+        with mock.patch.object(
+            context.impl,
+            "_compile_offline",
+            wraps=context.impl._compile_offline,
+        ) as compile_:
+            for schema in ("t1", "t2", "t1", "t2"):
+                op.rename_table("account", "account_old", schema=schema)
+                op.execute("DELETE FROM account")
+
+        eq_(len(compile_.mock_calls), 3)
+        context.assert_(
+            "ALTER TABLE t1.account RENAME TO t1.account_old",
+            "DELETE FROM account",
+            "ALTER TABLE t2.account RENAME TO t2.account_old",
+            "DELETE FROM account",
+            "ALTER TABLE t1.account RENAME TO t1.account_old",
+            "DELETE FROM account",
+            "ALTER TABLE t2.account RENAME TO t2.account_old",
+            "DELETE FROM account",
+        )
+
+    def test_column_ddl_compiled_once(self):
+        context = op_fixture(as_sql=True)
+
+        with mock.patch.object(
+            context.impl,
+            "_compile_offline",
+            wraps=context.impl._compile_offline,
+        ) as compile_:
+            for length in (50, 60, 50, 60):
+                op.add_column("t1", Column("c1", String(length)))
+                op.alter_column(
+                    "t1",
+                    "c1",
+                    type_=String(length),
+                    existing_type=Integer,
+                )
+                op.drop_column("t1", "c1")
+
+        eq_(len(compile_.mock_calls), 5)
+        context.assert_(
+            *[
+                stmt
+                for length in (50, 60, 50, 60)
+                for stmt in (
+                    "ALTER TABLE t1 ADD COLUMN c1 VARCHAR(%d)" % length,
+                    "ALTER TABLE t1 ALTER COLUMN c1 TYPE VARCHAR(%d)" % length,
+                    "ALTER TABLE t1 DROP COLUMN c1",
+                )
+            ]
+        )
+
+    def test_statements_w_objects_not_cached(self):
+        context = op_fixture(as_sql=True)
+
+        op.add_column("t1", Column("c1", Integer, server_default="5"))
+        op.add_column("t1", Column("c1", Integer, ForeignKey("t2.id")))
+        op.add_column("t1", Column("c1", Enum("a", "b", name="e1")))
+        op.alter_column("t1", "c1", server_default=text("5"))
+        op.execute(text("update table set foo=:bar").bindparams(bar="bat"))
+
+        eq_(len(context.impl._compiled_cache), 0)
+        context.assert_(
+            "ALTER TABLE t1 ADD COLUMN c1 INTEGER DEFAULT '5'",
+            "ALTER TABLE t1 ADD COLUMN c1 INTEGER",
+            "ALTER TABLE t1 ADD FOREIGN KEY(c1) REFERENCES t2 (id)",
+            "ALTER TABLE t1 ADD COLUMN c1 VARCHAR(1)",
+            "ALTER TABLE t1 ADD CONSTRAINT e1 CHECK (c1 IN ('a', 'b'))",
+            "ALTER TABLE t1 ALTER COLUMN c1 SET DEFAULT 5",
+            "update table set foo=:bar",
+        )
+
+    def test_params_not_allowed(self):
+        context = op_fixture(as_sql=True)
+
+        assert_raises_message(
+            Exception,
+            "Execution arguments not allowed with as_sql",
+            context.impl._exec,
+            text("update table set foo=NULL where bar=:bar"),
+            params={"bar": None},
+        )
+
 
 class CustomOpTest(TestBase):
     def test_custom_op(self):
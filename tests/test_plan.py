@@ -0,0 +1,235 @@
+import io
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+
+from alembic import command
+from alembic.operations import ops
+from alembic.operations.estimate import estimate_operation
+from alembic.plan import plan_upgrade
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from alembic.testing import eq_
+from alembic.testing import mock
+from alembic.testing.env import _sqlite_file_db
+from alembic.testing.env import _sqlite_testing_config
+from alembic.testing.env import clear_staging_env
+from alembic.testing.env import staging_env
+from alembic.testing.env import write_script
+from alembic.testing.fixtures import TestBase
+from alembic.util import compat
+
+
+class PlanUpgradeTest(TestBase):
+    __only_on__ = "sqlite"
+
+    def setUp(self):
+        self.bind = _sqlite_file_db()
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+
+        self._write(
+            "a", None, "op.create_table('foo', sa.Column('id', sa.Integer))"
+        )
+        command.upgrade(self.cfg, "a")
+        self._write(
+            "b",
+            "a",
+            """\
+op.add_column('foo', sa.Column('x', sa.Integer, server_default='0'))
+    op.add_column('foo', sa.Column('y', sa.Integer))
+    op.create_index('ix_foo_x', 'foo', ['x'])
+    op.execute("UPDATE foo SET y = x")""",
+        )
+        self._write(
+            "c",
+            "b",
+            """\
+op.create_table('bar', sa.Column('id', sa.Integer))
+    op.create_index('ix_bar_id', 'bar', ['id'])
+    op.alter_column('foo', 'y', nullable=False, existing_type=sa.Integer)""",
+        )
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _write(self, rev, down_rev, upgrade):
+        self.env.generate_revision(rev, "revision %s" % rev, refresh=True)
+        write_script(
+            self.env,
+            rev,
+            """\
+revision = %r
+down_revision = %r
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    %s
+
+
+def downgrade():
+    pass
+
+"""
+            % (rev, down_rev, upgrade),
+        )
+
+    def _plan(self, revision="heads", estimates=None):
+        script = ScriptDirectory.from_config(self.cfg)
+        with self.bind.connect() as conn:
+            context = MigrationContext.configure(conn)
+            with mock.patch.object(
+                context.impl,
+                "table_row_estimates",
+                side_effect=lambda tables: dict(
+                    (table, (estimates or {}).get(table)) for table in tables
+                ),
+            ) as estimate:
+                planned = plan_upgrade(context, script, revision)
+        return planned, estimate
+
+    def test_plan(self):
+        planned, estimate = self._plan(estimates={(None, "foo"): 1000})
+
+        eq_(
+            [step.step.short_log for step in planned],
+            ["upgrade a -> b", "upgrade b -> c"],
+        )
+        eq_(
+            [
+                [
+                    (op.name, op.table, op.rows, op.effect)
+                    for op in step.operations
+                ]
+                for step in planned
+            ],
+            [
+                [
+                    ("add_column", "foo", 1000, "rewrite"),
+                    ("add_column", "foo", 1000, "metadata"),
+                    ("create_index", "foo", 1000, "scan"),
+                    ("execute_sql", "foo", 1000, "data"),
+                ],
+                [
+                    ("create_table", "bar", 0, "metadata"),
+                    ("create_index", "bar", 0, "scan"),
+                    ("alter_column", "foo", 1000, "scan"),
+                ],
+            ],
+        )
+        eq_([step.cost for step in planned], [2000, 1000])
+        eq_(estimate.mock_calls, [mock.call([(None, "foo")])])
+
+        # each operation has its own SQL; nothing was run
+        eq_(
+            planned[0].operations[2].sql.strip(),
+            "CREATE INDEX ix_foo_x ON foo (x);",
+        )
+        assert not self.bind.has_table("bar")
+        eq_(self.bind.scalar("select version_num from alembic_version"), "a")
+
+    def test_plan_to_revision(self):
+        planned, estimate = self._plan("b")
+        eq_([step.step.short_log for step in planned], ["upgrade a -> b"])
+        eq_(planned[0].operations[0].rows, None)
+        eq_(planned[0].operations[0].cost, None)
+
+    def test_plan_error(self):
+        self._write(
+            "d",
+            "c",
+            """\
+op.drop_column('foo', 'y')
+    raise Exception('needs data')""",
+        )
+        planned, estimate = self._plan()
+        eq_(len(planned), 3)
+        eq_([op.name for op in planned[2].operations], ["drop_column"])
+        eq_(str(planned[2].error), "needs data")
+        eq_(planned[2].to_dict()["operations"][0]["lock"], "exclusive")
+
+    def test_command(self):
+        buf = io.StringIO()
+        self.cfg.stdout = buf
+        command.plan(self.cfg, "heads", verbose=True)
+        lines = buf.getvalue().splitlines()
+
+        eq_(lines[0], "upgrade a -> b")
+        eq_(
+            lines[1].split(),
+            ["add_column", "foo", "?", "exclusive", "rewrite"],
+        )
+        assert "        ALTER TABLE foo ADD COLUMN y INTEGER;" in lines
+        eq_(
+            lines[-1],
+            "7 operations in 2 steps; ~0 rows scanned or rewritten; "
+            "4 operations of unknown cost",
+        )
+
+
+class EstimateOperationTest(TestBase):
+    def _pg(self, server_version_info=(11, 2)):
+        dialect = postgresql.dialect()
+        dialect.server_version_info = server_version_info
+        return dialect
+
+    def test_add_column_default(self):
+        op = ops.AddColumnOp("t", Column("x", Integer, server_default="0"))
+        eq_(estimate_operation(op, mysql.dialect()), ("exclusive", "rewrite"))
+        eq_(
+            estimate_operation(op, self._pg()),
+            ("ACCESS EXCLUSIVE", "metadata"),
+        )
+        eq_(
+            estimate_operation(op, self._pg((10, 5))),
+            ("ACCESS EXCLUSIVE", "rewrite"),
+        )
+
+    def test_alter_column_type(self):
+        widen = ops.AlterColumnOp(
+            "t", "x", existing_type=String(10), modify_type=String(20)
+        )
+        narrow = ops.AlterColumnOp(
+            "t", "x", existing_type=String(20), modify_type=String(10)
+        )
+        retype = ops.AlterColumnOp(
+            "t", "x", existing_type=String(20), modify_type=Integer()
+        )
+        eq_(estimate_operation(widen, self._pg())[1], "metadata")
+        eq_(estimate_operation(narrow, self._pg())[1], "rewrite")
+        eq_(estimate_operation(retype, self._pg())[1], "rewrite")
+
+    def test_create_index_concurrently(self):
+        op = ops.CreateIndexOp("ix", "t", ["x"])
+        eq_(estimate_operation(op, self._pg()), ("SHARE", "scan"))
+        op = ops.CreateIndexOp("ix", "t", ["x"], postgresql_concurrently=True)
+        eq_(
+            estimate_operation(op, self._pg()),
+            ("SHARE UPDATE EXCLUSIVE", "scan"),
+        )
+
+    def test_foreign_key(self):
+        op = ops.CreateForeignKeyOp("fk", "t", "r", ["rid"], ["id"])
+        eq_(
+            estimate_operation(op, self._pg()),
+            ("SHARE ROW EXCLUSIVE", "scan"),
+        )
+        eq_(estimate_operation(op, mysql.dialect()), ("exclusive", "scan"))
+
+    def test_execute(self):
+        eq_(
+            estimate_operation(ops.ExecuteSQLOp("DELETE FROM t"), self._pg()),
+            ("ROW EXCLUSIVE", "data"),
+        )
+        eq_(
+            estimate_operation(
+                ops.ExecuteSQLOp(compat.text_type("VACUUM t")), self._pg()
+            ),
+            (None, "unknown"),
+        )
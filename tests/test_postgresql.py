@@ -2,6 +2,7 @@ from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy import exc
 from sqlalchemy import Float
 from sqlalchemy import Index
 from sqlalchemy import Integer
@@ -17,6 +18,7 @@ from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.dialects.postgresql import BYTEA
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.engine.reflection import Inspector
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.sql import column
 from sqlalchemy.sql import false
 from sqlalchemy.sql import table
@@ -33,9 +35,12 @@ from alembic.migration import MigrationContext
 from alembic.operations import Operations
 from alembic.operations import ops
 from alembic.script import ScriptDirectory
+from alembic.testing import assert_raises_message
 from alembic.testing import config
 from alembic.testing import eq_
 from alembic.testing import eq_ignore_whitespace
+from alembic.testing import is_
+from alembic.testing import mock
 from alembic.testing import provide_metadata
 from alembic.testing.env import _no_sql_testing_config
 from alembic.testing.env import clear_staging_env
@@ -51,6 +56,39 @@ if util.sqla_09:
 
 
 class PostgresqlOpTest(TestBase):
+    def test_use_schema(self):
+        context = op_fixture("postgresql")
+        context.impl.use_schema("tenant_1")
+        context.impl.use_schema("Tenant 2")
+        context.impl.use_schema(None)
+        context.assert_(
+            "SET search_path TO tenant_1",
+            'SET search_path TO "Tenant 2"',
+            "RESET search_path",
+        )
+
+    def test_version_table_schemas(self):
+        context = op_fixture("postgresql")
+        with mock.patch.object(
+            context.impl.connection,
+            "execute",
+            return_value=[("t3",), ("t1",)],
+        ) as execute:
+            eq_(
+                context.impl.version_table_schemas(
+                    "alembic_version", ["t1", "t2", "t3"]
+                ),
+                ["t1", "t3"],
+            )
+        eq_ignore_whitespace(
+            str(execute.mock_calls[0][1][0]),
+            "SELECT information_schema.tables.table_schema "
+            "FROM information_schema.tables "
+            "WHERE information_schema.tables.table_name = :table_name_1 "
+            "AND information_schema.tables.table_schema IN "
+            "(:table_schema_1, :table_schema_2, :table_schema_3)",
+        )
+
     def test_rename_table_postgresql(self):
         context = op_fixture("postgresql")
         op.rename_table("t1", "t2")
@@ -106,6 +144,115 @@ class PostgresqlOpTest(TestBase):
         op.drop_index("geocoded", "locations", postgresql_concurrently=True)
         context.assert_("DROP INDEX CONCURRENTLY geocoded")
 
+    @config.requirements.fail_before_sqla_110
+    def test_concurrently_outside_transaction_offline(self):
+        context = op_fixture("postgresql", as_sql=True)
+        with context.begin_transaction():
+            op.create_index(
+                "geocoded",
+                "locations",
+                ["coordinates"],
+                postgresql_concurrently=True,
+            )
+            op.drop_index(
+                "geocoded", "locations", postgresql_concurrently=True
+            )
+        context.assert_(
+            "BEGIN",
+            "COMMIT",
+            "CREATE INDEX CONCURRENTLY geocoded ON locations (coordinates)",
+            "BEGIN",
+            "COMMIT",
+            "DROP INDEX CONCURRENTLY geocoded",
+            "BEGIN",
+            "COMMIT",
+        )
+
+    @config.requirements.fail_before_sqla_099
+    def test_create_index_concurrently_autocommit(self):
+        context = op_fixture("postgresql")
+        connection = context.connection
+        connection.get_isolation_level.return_value = "READ COMMITTED"
+        connection.scalar.return_value = None
+        transaction = context._transaction = mock.Mock()
+
+        op.create_index(
+            "geocoded",
+            "locations",
+            ["coordinates"],
+            postgresql_concurrently=True,
+        )
+        context.assert_(
+            "CREATE INDEX CONCURRENTLY geocoded ON locations (coordinates)"
+        )
+        eq_(transaction.mock_calls, [mock.call.commit()])
+        eq_(
+            connection.execution_options.mock_calls,
+            [
+                mock.call(isolation_level="AUTOCOMMIT"),
+                mock.call(isolation_level="READ COMMITTED"),
+            ],
+        )
+        is_(context._transaction, connection.begin.return_value)
+
+    @config.requirements.fail_before_sqla_110
+    def test_create_index_concurrently_drops_invalid(self):
+        context = op_fixture("postgresql")
+        context.connection.scalar.return_value = False
+        op.create_index(
+            "geocoded",
+            "locations",
+            ["coordinates"],
+            postgresql_concurrently=True,
+        )
+        context.assert_(
+            "DROP INDEX CONCURRENTLY geocoded",
+            "CREATE INDEX CONCURRENTLY geocoded ON locations (coordinates)",
+        )
+
+    @config.requirements.fail_before_sqla_110
+    def test_create_index_concurrently_failed(self):
+        context = op_fixture("postgresql")
+        execute = context.connection.execute
+
+        def fail_create(stmt, *arg, **kw):
+            execute(stmt, *arg, **kw)
+            if isinstance(stmt, CreateIndex):
+                raise exc.OperationalError(
+                    "CREATE INDEX", {}, Exception("deadlock detected")
+                )
+
+        context.connection.execute = fail_create
+        context.connection.scalar.side_effect = [None, False]
+        assert_raises_message(
+            exc.OperationalError,
+            "deadlock detected",
+            op.create_index,
+            "geocoded",
+            "locations",
+            ["coordinates"],
+            postgresql_concurrently=True,
+        )
+        context.assert_(
+            "CREATE INDEX CONCURRENTLY geocoded ON locations (coordinates)",
+            "DROP INDEX CONCURRENTLY geocoded",
+        )
+
+    @config.requirements.fail_before_sqla_099
+    def test_create_index_concurrently_external_transaction(self):
+        context = op_fixture("postgresql")
+        context.connection.in_transaction = lambda: True
+        assert_raises_message(
+            util.CommandError,
+            "Can't run statements outside of a transaction which wasn't "
+            "begun by MigrationContext.begin_transaction()",
+            op.create_index,
+            "geocoded",
+            "locations",
+            ["coordinates"],
+            postgresql_concurrently=True,
+        )
+
     def test_alter_column_type_using(self):
         context = op_fixture("postgresql")
         op.alter_column("t", "c", type_=Integer, postgresql_using="c::integer")
@@ -757,6 +904,30 @@ class PostgresqlAutogenRenderTest(TestBase):
             """postgresql_where=sa.text(!U"y = 'something'"))""",
         )
 
+    def test_render_add_index_concurrently_existing_table(self):
+        autogen_context = self.autogen_context
+        impl = autogen_context.migration_context.impl
+
+        m = MetaData()
+        t = Table("t", m, Column("x", String))
+        idx = Index("foo_idx", t.c.x)
+
+        op_obj = ops.CreateIndexOp.from_index(idx)
+        impl.correct_for_autogen_new_index(op_obj)
+        eq_ignore_whitespace(
+            autogenerate.render_op_text(autogen_context, op_obj),
+            "op.create_index('foo_idx', 't', ['x'], unique=False)",
+        )
+
+        impl.context_opts["postgresql_concurrent_indexes"] = True
+        impl.correct_for_autogen_new_index(op_obj)
+        eq_ignore_whitespace(
+            autogenerate.render_op_text(autogen_context, op_obj),
+            "op.create_index('foo_idx', 't', ['x'], unique=False, "
+            "postgresql_concurrently=True)",
+        )
+        eq_(idx.kwargs, {})
+
     def test_render_server_default_native_boolean(self):
         c = Column(
             "updated_at", Boolean(), server_default=false(), nullable=False
@@ -0,0 +1,127 @@
+import io
+import os
+import pstats
+import sys
+
+from alembic import config
+from alembic.profiling import CommandProfiler
+from alembic.script.revision import RevisionMap
+from alembic.testing import eq_
+from alembic.testing import mock
+from alembic.testing.env import _get_staging_directory
+from alembic.testing.env import _sqlite_testing_config
+from alembic.testing.env import clear_staging_env
+from alembic.testing.env import staging_env
+from alembic.testing.env import write_script
+from alembic.testing.fixtures import TestBase
+
+
+class CommandProfilerTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.rev = "a1"
+        self.env.generate_revision(self.rev, "revision a", refresh=True)
+        write_script(
+            self.env,
+            self.rev,
+            """\
+revision = 'a1'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    import alembic_profile_helper
+
+    op.create_table('foo', sa.Column('id', sa.Integer, primary_key=True))
+
+
+def downgrade():
+    op.drop_table('foo')
+
+""",
+        )
+        self.helper_dir = os.path.join(_get_staging_directory(), "helpers")
+        os.mkdir(self.helper_dir)
+        with open(
+            os.path.join(self.helper_dir, "alembic_profile_helper.py"), "w"
+        ) as file_:
+            file_.write("import time\ntime.sleep(0.01)\n")
+        sys.path.insert(0, self.helper_dir)
+
+    def tearDown(self):
+        sys.path.remove(self.helper_dir)
+        sys.modules.pop("alembic_profile_helper", None)
+        clear_staging_env()
+
+    def _run(self, *argv):
+        buf = io.StringIO()
+        with mock.patch("sys.stderr", buf):
+            config.CommandLine().main(
+                ["-c", self.cfg.config_file_name] + list(argv)
+            )
+        return buf.getvalue().splitlines()
+
+    def test_profile(self):
+        stats_file = os.path.join(_get_staging_directory(), "upgrade.prof")
+        get_revisions = RevisionMap.__dict__["get_revisions"]
+
+        lines = self._run("--profile", stats_file, "upgrade", "heads")
+
+        eq_(lines[0], "Profile written to %s" % stats_file)
+        eq_(
+            [line.split()[0] for line in lines[2:]],
+            ["config", "script", "revision", "env", "migration", "other"]
+            + ["total"],
+        )
+        times = dict(
+            (" ".join(line.split()[:-2]), float(line.split()[-2]))
+            for line in lines[2:-1]
+        )
+        assert times["migration run"] >= 0.01
+        assert times["env load"] > 0
+
+        stats = pstats.Stats(stats_file)
+        assert any(
+            func[2] == "run_migrations" for func in stats.stats
+        ), "run_migrations not profiled"
+
+        # the timed methods are restored
+        assert RevisionMap.__dict__["get_revisions"] is get_revisions
+
+    def test_profile_imports(self):
+        lines = self._run("--profile-imports", "upgrade", "heads")
+
+        assert not lines[0].startswith("Profile written")
+        imports = dict(
+            (line.split()[0], (float(line.split()[1]), float(line.split()[2])))
+            for line in lines[lines.index("") + 2 :]
+        )
+        cumulative, self_time = imports["alembic_profile_helper"]
+        assert cumulative >= 0.01
+        assert self_time >= 0.01
+
+    def test_nested_phases(self):
+        profiler = CommandProfiler()
+        with mock.patch("time.time", side_effect=[0, 1, 3, 6, 10, 15]):
+            profiler.start()
+            with profiler.phase("env load"):
+                with profiler.phase("migration run"):
+                    pass
+            profiler.stop()
+
+        eq_(profiler.total, 15)
+        eq_(
+            profiler.times,
+            {
+                "config parse": 0,
+                "script load": 0,
+                "revision resolution": 0,
+                "env load": 2 + 4,
+                "migration run": 3,
+                "other": 1 + 5,
+            },
+        )
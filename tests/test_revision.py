@@ -1,4 +1,7 @@
+from random import Random
+
 from alembic.script.revision import MultipleHeads
+from alembic.script.revision import ResolutionError
 from alembic.script.revision import Revision
 from alembic.script.revision import RevisionError
 from alembic.script.revision import RevisionMap
@@ -9,6 +12,28 @@ from . import _large_map
 
 
 class APITest(TestBase):
+    def test_compact_revision(self):
+        map_ = RevisionMap(
+            lambda: [
+                Revision("a", ()),
+                Revision("b", ("a",), branch_labels="bbranch"),
+                Revision("c", ("b",)),
+                Revision("d", ("c",)),
+            ]
+        )
+        b, c, d = map_.get_revisions(("b", "c", "d"))
+        assert b.nextrev is b._all_nextrev
+        eq_(c.branch_labels, set(["bbranch"]))
+        assert c.branch_labels is not d.branch_labels
+
+        # revisions accept additional attributes, as before
+        b.foo = "bar"
+        eq_(b.foo, "bar")
+        assert (
+            Revision("".join(["e", "f"]), None).revision
+            is Revision("".join(["e", "f"]), None).revision
+        )
+
     def test_add_revision_one_head(self):
         map_ = RevisionMap(
             lambda: [
@@ -125,6 +150,67 @@ class APITest(TestBase):
         eq_(repr(c), "Revision('c', None, dependencies=('a', 'b'))")
 
 
+class PartialIdentifierTest(TestBase):
+    def setUp(self):
+        self.map = RevisionMap(
+            lambda: [
+                Revision("ae1027a6acf", ()),
+                Revision("ae1027a6bcf", "ae1027a6acf"),
+                Revision("ae10f", "ae1027a6bcf"),
+                Revision("b1", "ae10f", branch_labels="aebranch"),
+                Revision("c1", "ae10f"),
+            ]
+        )
+
+    def test_unique_prefix(self):
+        eq_(self.map.get_revision("ae1027a6b").revision, "ae1027a6bcf")
+        eq_(self.map.get_revision("c").revision, "c1")
+
+    def test_ambiguous_prefix(self):
+        assert_raises_message(
+            RevisionError,
+            "Multiple revisions start with 'ae': 'ae1027a6acf', "
+            "'ae1027a6bcf', 'ae10f'...",
+            self.map.get_revision,
+            "ae",
+        )
+
+    def test_no_such_prefix(self):
+        assert_raises_message(
+            RevisionError,
+            "No such revision or branch 'ae2'",
+            self.map.get_revision,
+            "ae2",
+        )
+
+    def test_branch_label_prefix(self):
+        eq_(self.map.get_revision("aeb").revision, "b1")
+
+    def test_prefix_filtered_by_branch(self):
+        eq_(self.map.get_revision("aebranch@b").revision, "b1")
+
+    def test_add_revision(self):
+        self.map.add_revision(Revision("d1", "c1", branch_labels="dbranch"))
+        eq_(self.map.get_revision("dbr").revision, "d1")
+        assert_raises_message(
+            RevisionError,
+            "Multiple revisions start with 'd': 'd1', 'dbranch'...",
+            self.map.get_revision,
+            "d",
+        )
+
+        self.map.add_revision(Revision("ae10fab", "d1"))
+        eq_(self.map.get_revision("ae10f").revision, "ae10f")
+        eq_(self.map.get_revision("ae10fa").revision, "ae10fab")
+        assert_raises_message(
+            RevisionError,
+            "Multiple revisions start with 'ae10': 'ae1027a6acf', "
+            "'ae1027a6bcf', 'ae10f'...",
+            self.map.get_revision,
+            "ae10",
+        )
+
+
 class DownIterateTest(TestBase):
     def _assert_iteration(
         self,
@@ -1133,6 +1219,35 @@ class LargeMapTest(DownIterateTest):
                 assert remaining.intersection(ancestors)
 
 
+class DependencyRepeatsDownRevisionTest(DownIterateTest):
+    def setUp(self):
+        self.map = RevisionMap(
+            lambda: [
+                Revision("r0", ()),
+                Revision("r1", ("r0",)),
+                Revision("r2", ("r1",)),
+                Revision("r3", ("r0", "r2"), dependencies="r0"),
+                Revision("r4", ("r2",), dependencies="r1"),
+            ]
+        )
+
+    def test_heads_to_base(self):
+        self._assert_iteration("heads", "base", ["r3", "r4", "r2", "r1", "r0"])
+
+    def test_same_as_iteration_space(self):
+        self._assert_iteration(
+            "heads",
+            "base",
+            [
+                rev.revision
+                for rev in self.map._topological_iterate(
+                    self.map.get_revisions("heads"),
+                    set(["r0", "r1", "r2", "r3", "r4"]),
+                )
+            ],
+        )
+
+
 class DepResolutionFailedTest(DownIterateTest):
     def setUp(self):
         self.map = RevisionMap(
@@ -1154,3 +1269,550 @@ class DepResolutionFailedTest(DownIterateTest):
         assert_raises_message(
             RevisionError, "Dependency resolution failed;", list, iter_
         )
+
+
+class LineageIndexFixture(object):
+    def setUp(self):
+        super(LineageIndexFixture, self).setUp()
+        self.map.lineage_index = True
+
+
+class LineageIndexBranchTravellingTest(
+    LineageIndexFixture, BranchTravellingTest
+):
+    pass
+
+
+class LineageIndexMultipleBaseTest(LineageIndexFixture, MultipleBaseTest):
+    pass
+
+
+class LineageIndexCrossDependencyTestOne(
+    LineageIndexFixture, MultipleBaseCrossDependencyTestOne
+):
+    pass
+
+
+class LineageIndexCrossDependencyTestTwo(
+    LineageIndexFixture, MultipleBaseCrossDependencyTestTwo
+):
+    pass
+
+
+class LineageIndexTest(TestBase):
+    def _dependency_map(self, lineage_index):
+        return RevisionMap(
+            lambda: [
+                Revision("base1", (), branch_labels="b_1"),
+                Revision("a1a", ("base1",)),
+                Revision("a1b", ("base1",)),
+                Revision("b1a", ("a1a",)),
+                Revision("b1b", ("a1b",), dependencies="a3"),
+                Revision("base2", (), branch_labels="b_2"),
+                Revision("a2", ("base2",)),
+                Revision("b2", ("a2",)),
+                Revision("c2", ("b2",), dependencies="a3"),
+                Revision("d2", ("c2",)),
+                Revision("base3", (), branch_labels="b_3"),
+                Revision("a3", ("base3",)),
+                Revision("b3", ("a3",)),
+            ],
+            lineage_index=lineage_index,
+        )
+
+    def _large_map(self, lineage_index):
+        return RevisionMap(
+            lambda: _large_map.data, lineage_index=lineage_index
+        )
+
+    def _assert_same_as_traversal(self, map_, indexed):
+        assert indexed._lineage_index is not None
+        assert map_._lineage_index is None
+
+        revs = [r for r in map_._revision_map.values() if r is not None]
+        for rev in revs:
+            other = indexed.get_revision(rev.revision)
+            for include_dependencies in (True, False):
+                eq_(
+                    set(
+                        r.revision
+                        for r in map_._get_ancestor_nodes(
+                            [rev], include_dependencies=include_dependencies
+                        )
+                    ),
+                    set(
+                        r.revision
+                        for r in indexed._get_ancestor_nodes(
+                            [other], include_dependencies=include_dependencies
+                        )
+                    ),
+                )
+                eq_(
+                    set(
+                        r.revision
+                        for r in map_._get_descendant_nodes(
+                            [rev], include_dependencies=include_dependencies
+                        )
+                    ),
+                    set(
+                        r.revision
+                        for r in indexed._get_descendant_nodes(
+                            [other], include_dependencies=include_dependencies
+                        )
+                    ),
+                )
+            eq_(
+                set(
+                    r.revision
+                    for r in map_._get_descendant_nodes(
+                        [rev], check=True, omit_immediate_dependencies=True
+                    )
+                ),
+                set(
+                    r.revision
+                    for r in indexed._get_descendant_nodes(
+                        [other], check=True, omit_immediate_dependencies=True
+                    )
+                ),
+            )
+            eq_(
+                set(
+                    r.revision
+                    for r in map_._filter_into_branch_heads(
+                        map_._get_ancestor_nodes([rev])
+                    )
+                ),
+                set(
+                    r.revision
+                    for r in indexed._filter_into_branch_heads(
+                        indexed._get_ancestor_nodes([other])
+                    )
+                ),
+            )
+            for head in map_.heads:
+                eq_(
+                    map_._shares_lineage(rev, head),
+                    indexed._shares_lineage(other, head),
+                )
+                eq_(
+                    map_._shares_lineage(rev, head, include_dependencies=True),
+                    indexed._shares_lineage(
+                        other, head, include_dependencies=True
+                    ),
+                )
+
+    def test_large_map(self):
+        self._assert_same_as_traversal(
+            self._large_map(False), self._large_map(True)
+        )
+
+    def test_dependency_map(self):
+        self._assert_same_as_traversal(
+            self._dependency_map(False), self._dependency_map(True)
+        )
+
+    def test_iterate_large_map(self):
+        map_ = self._large_map(False)
+        indexed = self._large_map(True)
+        eq_(
+            [r.revision for r in map_.iterate_revisions("heads", "base")],
+            [r.revision for r in indexed.iterate_revisions("heads", "base")],
+        )
+
+    def test_check_overlaps(self):
+        map_ = self._dependency_map(True)
+        assert_raises_message(
+            RevisionError,
+            "Requested revision c2 overlaps with other requested "
+            "revisions a2",
+            list,
+            map_._get_ancestor_nodes(
+                map_.get_revisions(["c2", "a2"]), check=True
+            ),
+        )
+        assert_raises_message(
+            RevisionError,
+            "Requested revision a3 overlaps with other requested "
+            "revisions c2",
+            list,
+            map_._get_descendant_nodes(
+                map_.get_revisions(["a3", "c2"]), check=True
+            ),
+        )
+
+    def test_add_revision_updates_index(self):
+        map_ = self._dependency_map(True)
+        eq_(
+            set(
+                r.revision
+                for r in map_._get_descendant_nodes(map_.get_revisions(["d2"]))
+            ),
+            set(["d2"]),
+        )
+        index = map_._lineage_index
+        map_.add_revision(Revision("e2", ("d2",)))
+        assert map_._lineage_index is index
+        eq_(
+            set(
+                r.revision
+                for r in map_._get_descendant_nodes(map_.get_revisions(["d2"]))
+            ),
+            set(["d2", "e2"]),
+        )
+
+    def test_inconsistent_map_not_indexed(self):
+        map_ = self._dependency_map(True)
+        map_._revision_map["b3"].nextrev = frozenset(["a3"])
+        map_._revision_map["b3"]._all_nextrev = frozenset(["a3"])
+        eq_(map_._lineage_index, None)
+
+
+class IncrementalMapTest(TestBase):
+    def _map(self, revisions, lineage_index=False):
+        map_ = RevisionMap(lambda: revisions, lineage_index=lineage_index)
+        map_._revision_map
+        return map_
+
+    def _fixture(self, lineage_index=False):
+        return self._map(
+            [
+                Revision("a", ()),
+                Revision("b", ("a",)),
+                Revision("c1", ("b",), branch_labels="c1branch"),
+                Revision("d1", ("c1",)),
+                Revision("c2", ("b",)),
+                Revision("d2", ("c2",), dependencies="d1"),
+                Revision("e", ("d1", "d2")),
+                Revision("f", ("e",), branch_labels="fbranch"),
+            ],
+            lineage_index=lineage_index,
+        )
+
+    def _assert_same_as_rebuilt(self, map_):
+        revisions = list(
+            set(rev for rev in map_._revision_map.values() if rev is not None)
+        )
+        rebuilt = self._map(
+            [
+                Revision(
+                    rev.revision,
+                    rev.down_revision,
+                    branch_labels=rev._orig_branch_labels,
+                    dependencies=rev.dependencies,
+                )
+                for rev in revisions
+            ],
+            lineage_index=True,
+        )
+
+        eq_(set(map_.heads), set(rebuilt.heads))
+        eq_(set(map_._real_heads), set(rebuilt._real_heads))
+        eq_(sorted(map_.bases), sorted(rebuilt.bases))
+        eq_(sorted(map_._real_bases), sorted(rebuilt._real_bases))
+        eq_(
+            dict(
+                (key, rev.revision)
+                for key, rev in map_._revision_map.items()
+                if rev is not None
+            ),
+            dict(
+                (key, rev.revision)
+                for key, rev in rebuilt._revision_map.items()
+                if rev is not None
+            ),
+        )
+        eq_(map_._prefix_index._keys, rebuilt._prefix_index._keys)
+        for rev in revisions:
+            other = rebuilt.get_revision(rev.revision)
+            eq_(rev.branch_labels, other.branch_labels)
+            eq_(rev.nextrev, other.nextrev)
+            eq_(rev._all_nextrev, other._all_nextrev)
+            eq_(rev._resolved_dependencies, other._resolved_dependencies)
+            for include_dependencies in (True, False):
+                eq_(
+                    set(
+                        r.revision
+                        for r in map_._get_ancestor_nodes(
+                            [rev], include_dependencies=include_dependencies
+                        )
+                    ),
+                    set(
+                        r.revision
+                        for r in rebuilt._get_ancestor_nodes(
+                            [other], include_dependencies=include_dependencies
+                        )
+                    ),
+                )
+                eq_(
+                    set(
+                        r.revision
+                        for r in map_._get_descendant_nodes(
+                            [rev], include_dependencies=include_dependencies
+                        )
+                    ),
+                    set(
+                        r.revision
+                        for r in rebuilt._get_descendant_nodes(
+                            [other], include_dependencies=include_dependencies
+                        )
+                    ),
+                )
+
+    def test_add_head(self):
+        map_ = self._fixture()
+        map_.add_revision(Revision("g", ("f",), branch_labels="gbranch"))
+        eq_(map_.heads, ("g",))
+        eq_(
+            map_.get_revision("f").branch_labels,
+            set(["c1branch", "fbranch", "gbranch"]),
+        )
+        eq_(map_.get_revision("e").branch_labels, set(["c1branch"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_add_branch(self):
+        map_ = self._fixture()
+        map_.add_revision(Revision("g", ("e",), branch_labels="gbranch"))
+        eq_(set(map_.heads), set(["f", "g"]))
+        eq_(map_.get_revision("e").branch_labels, set(["c1branch"]))
+        eq_(map_.get_revision("f").branch_labels, set(["c1branch", "fbranch"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_add_base(self):
+        map_ = self._fixture()
+        map_.add_revision(Revision("x", ()))
+        eq_(set(map_.bases), set(["a", "x"]))
+        eq_(set(map_.heads), set(["f", "x"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_remove_head(self):
+        map_ = self._fixture()
+        map_.remove_revision("f")
+        eq_(map_.heads, ("e",))
+        eq_(map_.get_revision("e").branch_labels, set(["c1branch"]))
+        assert "fbranch" not in map_._revision_map
+        self._assert_same_as_rebuilt(map_)
+
+    def test_remove_branch(self):
+        map_ = self._fixture()
+        map_.remove_revision("f")
+        map_.remove_revision("e")
+        map_.add_revision(Revision("e", ("d1",)))
+        map_.remove_revision("e")
+        eq_(set(map_.heads), set(["d1", "d2"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_remove_referenced(self):
+        map_ = self._fixture()
+        assert_raises_message(
+            RevisionError,
+            "Revision d1 can't be removed as it's referenced by "
+            "revision\\(s\\) d2, e",
+            map_.remove_revision,
+            "d1",
+        )
+
+    def test_remove_unknown(self):
+        map_ = self._fixture()
+        assert_raises_message(
+            ResolutionError, "No such revision 'x'", map_.remove_revision, "x"
+        )
+        assert_raises_message(
+            ResolutionError,
+            "No such revision 'fbranch'",
+            map_.remove_revision,
+            "fbranch",
+        )
+
+    def test_replace_same_lineage(self):
+        map_ = self._fixture(lineage_index=True)
+        index = map_._lineage_index
+        old = map_.get_revision("d1")
+        new = Revision("d1", ("c1",))
+        map_.add_revision(new, _replace=True)
+
+        assert map_.get_revision("d1") is new
+        assert map_.get_revision("c1branch").nextrev == set(["d1"])
+        eq_(new.nextrev, old.nextrev)
+        eq_(new.branch_labels, old.branch_labels)
+        eq_(set(map_.heads), set(["f"]))
+        assert map_._lineage_index is index
+        self._assert_same_as_rebuilt(map_)
+
+    def test_replace_down_revision(self):
+        map_ = self._fixture(lineage_index=True)
+        map_.add_revision(Revision("d1", ("a",)), _replace=True)
+        eq_(
+            set(
+                r.revision
+                for r in map_._get_ancestor_nodes([map_.get_revision("e")])
+            ),
+            set(["e", "d1", "d2", "c2", "b", "a"]),
+        )
+        eq_(map_.get_revision("c1").nextrev, frozenset())
+        eq_(set(map_.heads), set(["f", "c1"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_replace_branch_labels(self):
+        map_ = self._fixture()
+        map_.add_revision(
+            Revision("c1", ("b",), branch_labels="newbranch"), _replace=True
+        )
+        assert "c1branch" not in map_._revision_map
+        eq_(map_.get_revision("newbranch").revision, "c1")
+        eq_(map_.get_revision("d1").branch_labels, set(["newbranch"]))
+        self._assert_same_as_rebuilt(map_)
+
+    def test_randomized(self):
+        random = Random(5)
+        for lineage_index in (False, True):
+            map_ = self._map([], lineage_index=lineage_index)
+            ids = []
+            for count in range(300):
+                op = random.random()
+                if op < 0.55 or not ids:
+                    rev = "%x%03d" % (random.randint(0, 40), count)
+                    down = tuple(
+                        random.sample(ids, min(len(ids), random.randint(0, 2)))
+                    )
+                    depends = [
+                        id_
+                        for id_ in random.sample(ids, min(len(ids), 1))
+                        if id_ not in down and random.random() < 0.2
+                    ]
+                    map_.add_revision(
+                        Revision(
+                            rev,
+                            down,
+                            branch_labels="l%d" % count
+                            if random.random() < 0.2
+                            else None,
+                            dependencies=depends,
+                        )
+                    )
+                    ids.append(rev)
+                elif op < 0.8:
+                    leaves = [
+                        id_
+                        for id_ in ids
+                        if not map_.get_revision(id_)._all_nextrev
+                    ]
+                    rev = random.choice(leaves)
+                    map_.remove_revision(rev)
+                    ids.remove(rev)
+                else:
+                    rev = map_.get_revision(random.choice(ids))
+                    descendants = set(
+                        r.revision for r in map_._get_descendant_nodes([rev])
+                    )
+                    down = [
+                        id_
+                        for id_ in random.sample(
+                            ids, min(len(ids), random.randint(0, 2))
+                        )
+                        if id_ not in descendants
+                    ]
+                    map_.add_revision(
+                        Revision(
+                            rev.revision,
+                            down,
+                            branch_labels=rev._orig_branch_labels,
+                            dependencies=rev.dependencies,
+                        ),
+                        _replace=True,
+                    )
+                if count % 20 == 0:
+                    self._assert_same_as_rebuilt(map_)
+            self._assert_same_as_rebuilt(map_)
+
+
+class TopologicalIterateTest(TestBase):
+    def _assert_same_as_scan(self, map_, idents):
+        for upper in idents:
+            for lower in idents:
+                for kw in (
+                    {},
+                    {"inclusive": False},
+                    {"implicit_base": True},
+                    {"select_for_downgrade": True},
+                ):
+                    try:
+                        expected = [
+                            rev.revision
+                            for rev in map_._iterate_revisions_by_scan(
+                                upper, lower, **kw
+                            )
+                        ]
+                    except RevisionError as err:
+                        expected = str(err)
+                    try:
+                        result = [
+                            rev.revision
+                            for rev in map_._iterate_revisions(
+                                upper, lower, **kw
+                            )
+                        ]
+                    except RevisionError as err:
+                        result = str(err)
+                    eq_(result, expected)
+
+    def test_large_map(self):
+        map_ = _large_map.map_
+        revs = sorted(
+            rev.revision
+            for rev in map_._revision_map.values()
+            if rev is not None
+        )
+        self._assert_same_as_scan(map_, ["heads", "base"] + revs[::25])
+
+    def test_cross_dependencies(self):
+        map_ = LineageIndexTest()._dependency_map(False)
+        self._assert_same_as_scan(
+            map_,
+            [
+                "heads",
+                "base",
+                "b_1@head",
+                "b_2@base",
+                "base1",
+                "a1b",
+                "b1b",
+                "a2",
+                "d2",
+                "base3",
+                "a3",
+                "b3",
+            ],
+        )
+
+    def test_simultaneous_branch_points_deterministic(self):
+        map_ = RevisionMap(
+            lambda: [
+                Revision("base1", ()),
+                Revision("x", "base1"),
+                Revision("a", "x"),
+                Revision("b", "x"),
+                Revision("base2", ()),
+                Revision("y", "base2"),
+                Revision("c", "y"),
+                Revision("d", "y"),
+            ]
+        )
+        eq_(
+            [rev.revision for rev in map_._iterate_revisions("heads", "base")],
+            ["a", "b", "c", "d", "y", "base2", "x", "base1"],
+        )
+        self._assert_same_as_scan(map_, ["heads", "base", "x", "y"])
+
+    def test_dependency_resolution_failed(self):
+        map_ = DepResolutionFailedTest()
+        map_.setUp()
+        for fn in (
+            map_.map._iterate_revisions,
+            map_.map._iterate_revisions_by_scan,
+        ):
+            assert_raises_message(
+                RevisionError,
+                "Dependency resolution failed;",
+                list,
+                fn("c1", "base1"),
+            )
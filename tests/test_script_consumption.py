@@ -1,18 +1,40 @@
 # coding: utf-8
 
 from contextlib import contextmanager
+import io
+import json
 import os
 import re
+import shutil
 import textwrap
+import time
+
+from sqlalchemy import Column
+from sqlalchemy import event
+from sqlalchemy import exc as sqla_exc
+from sqlalchemy import Integer
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import column
+from sqlalchemy.sql import table
 
 from alembic import command
+from alembic import op
 from alembic import util
+from alembic.ddl.impl import DefaultImpl
 from alembic.environment import EnvironmentContext
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.runtime import metrics
+from alembic.runtime.metrics import StatementProfiler
+from alembic.runtime.migration import StampStep
+from alembic.runtime.retry import LockRetryPolicy
 from alembic.script import Script
 from alembic.script import ScriptDirectory
 from alembic.testing import assert_raises_message
+from alembic.testing import assertions
 from alembic.testing import eq_
 from alembic.testing import mock
+from alembic.testing.env import _get_staging_directory
 from alembic.testing.env import _no_sql_testing_config
 from alembic.testing.env import _sqlite_file_db
 from alembic.testing.env import _sqlite_testing_config
@@ -477,6 +499,658 @@ run_migrations_online()
         command.stamp(self.cfg, c)
 
 
+class AutocommitBlockTest(TestBase):
+    __only_on__ = "sqlite"
+
+    def setUp(self):
+        staging_env()
+        self.bind = _sqlite_file_db()
+        self.bind.execute("CREATE TABLE t (x INTEGER)")
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _rows(self):
+        return [row[0] for row in self.bind.execute("SELECT x FROM t")]
+
+    @contextmanager
+    def _autocommit(self, conn):
+        # SQLite has no AUTOCOMMIT isolation level
+        with mock.patch.object(
+            DefaultImpl, "supports_autocommit", return_value=True
+        ), mock.patch.object(conn, "execution_options") as options:
+            yield options
+
+    def test_transaction_resumes_after_block(self):
+        with self.bind.connect() as conn:
+            context = MigrationContext.configure(
+                conn, opts={"transactional_ddl": True}
+            )
+            with self._autocommit(conn) as options:
+                try:
+                    with context.begin_transaction():
+                        conn.execute("INSERT INTO t (x) VALUES (1)")
+                        with context.autocommit_block():
+                            assert not conn.in_transaction()
+                            eq_(self._rows(), [1])
+                        assert conn.in_transaction()
+                        conn.execute("INSERT INTO t (x) VALUES (2)")
+                        raise Exception("migration failed")
+                except Exception:
+                    pass
+            assert not conn.in_transaction()
+            eq_(context._transaction, None)
+
+        eq_(self._rows(), [1])
+        eq_(options.mock_calls[0], mock.call(isolation_level="AUTOCOMMIT"))
+
+    def test_transaction_committed_after_block(self):
+        with self.bind.connect() as conn:
+            context = MigrationContext.configure(
+                conn, opts={"transactional_ddl": True}
+            )
+            with self._autocommit(conn):
+                with context.begin_transaction():
+                    with context.autocommit_block():
+                        pass
+                    conn.execute("INSERT INTO t (x) VALUES (1)")
+            assert not conn.in_transaction()
+        eq_(self._rows(), [1])
+
+    def test_unsupported_before_commit(self):
+        with self.bind.connect() as conn:
+            context = MigrationContext.configure(
+                conn, opts={"transactional_ddl": True}
+            )
+
+            def run():
+                with context.begin_transaction():
+                    conn.execute("INSERT INTO t (x) VALUES (1)")
+                    with context.autocommit_block():
+                        pass
+
+            assert_raises_message(
+                util.CommandError,
+                "The sqlite dialect doesn't support the AUTOCOMMIT "
+                "isolation level",
+                run,
+            )
+        eq_(self._rows(), [])
+
+    def test_coalesced_versions_written_before_block(self):
+        def block(**kw):
+            with context.autocommit_block():
+                pass
+
+        def fail(**kw):
+            raise Exception("ccc failed")
+
+        steps = [
+            StampStep(None, "aaa", True, True),
+            StampStep("aaa", "bbb", True, False),
+            StampStep("bbb", "ccc", True, False),
+        ]
+        steps[1].migration_fn = block
+        steps[2].migration_fn = fail
+
+        with self.bind.connect() as conn:
+            context = MigrationContext.configure(
+                conn,
+                opts={
+                    "transactional_ddl": True,
+                    "coalesce_version_writes": True,
+                    "fn": lambda heads, context: steps,
+                },
+            )
+            with self._autocommit(conn):
+                with context.begin_transaction():
+                    assert_raises_message(
+                        Exception, "ccc failed", context.run_migrations
+                    )
+
+        # the step before the block is committed along with its version
+        eq_(
+            [
+                row[0]
+                for row in self.bind.execute(
+                    "SELECT version_num FROM alembic_version"
+                )
+            ],
+            ["aaa"],
+        )
+
+    def test_offline(self):
+        buf = io.StringIO()
+        context = MigrationContext.configure(
+            dialect_name="postgresql",
+            opts={"as_sql": True, "output_buffer": buf},
+        )
+        with context.autocommit_block():
+            context.execute("VACUUM t")
+        with context.begin_transaction():
+            with context.autocommit_block():
+                context.execute("VACUUM t")
+        eq_(
+            buf.getvalue().split(";\n\n")[:-1],
+            ["VACUUM t", "BEGIN", "COMMIT", "VACUUM t", "BEGIN", "COMMIT"],
+        )
+
+
+class DataMigrationsFixture(object):
+    __only_on__ = "sqlite"
+
+    def setUp(self):
+        self.bind = _sqlite_file_db()
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b = self._revisions()
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _revisions(self):
+        a = util.rev_id()
+        b = util.rev_id()
+        self.env.generate_revision(a, "revision a", refresh=True)
+        write_script(
+            self.env,
+            a,
+            """\
+revision = '%s'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('foo', sa.Column('id', sa.Integer, primary_key=True))
+    op.execute("INSERT INTO foo (id) VALUES (1), (2), (3)")
+
+
+def downgrade():
+    op.drop_table('foo')
+
+"""
+            % a,
+        )
+        self.env.generate_revision(b, "revision b", refresh=True)
+        write_script(
+            self.env,
+            b,
+            """\
+revision = '%s'
+down_revision = '%s'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.execute("UPDATE foo SET id = id + 10 WHERE id > 1")
+    op.execute("DELETE FROM foo WHERE id = 1")
+
+
+def downgrade():
+    raise Exception("downgrade b failed")
+
+"""
+            % (b, a),
+        )
+        return a, b
+
+    @contextmanager
+    def _patch_environment(self, **kw):
+        conf = EnvironmentContext.configure
+
+        def configure(*arg, **opt):
+            opt.update(kw)
+            return conf(*arg, **opt)
+
+        with mock.patch.object(EnvironmentContext, "configure", configure):
+            yield
+
+
+class StepMetricsTest(DataMigrationsFixture, TestBase):
+    def test_metrics_in_callback(self):
+        seen = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(
+                (step.up_revision_id, step.metrics.to_dict(), step.metrics)
+            )
+
+        with self._patch_environment(
+            step_metrics=True, on_version_apply=on_version_apply
+        ):
+            command.upgrade(self.cfg, self.b)
+
+        eq_([rev for rev, snapshot, metrics in seen], [self.a, self.b])
+        (_, a_seen, a_metrics), (_, b_seen, b_metrics) = seen
+
+        # CREATE TABLE, INSERT, INSERT version; the version table is
+        # created online before the first step
+        eq_(a_seen["statements"], 3)
+        eq_(a_seen["ddl_statements"], 1)
+        eq_(a_seen["dml_statements"], 2)
+        eq_(a_seen["rows_affected"], 4)
+        assert a_seen["elapsed"] >= 0
+        eq_(a_seen["transaction_time"], None)
+
+        # UPDATE, DELETE, UPDATE version
+        eq_(b_seen["statements"], 3)
+        eq_(b_seen["ddl_statements"], 0)
+        eq_(b_seen["dml_statements"], 3)
+        eq_(b_seen["rows_affected"], 4)
+
+        # sqlite is not transactional_ddl, so no transaction per step
+        eq_(a_metrics.transaction_time, None)
+
+    def test_transaction_time(self):
+        seen = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(step.metrics)
+            eq_(step.metrics.transaction_time, None)
+
+        with self._patch_environment(
+            step_metrics=True,
+            transactional_ddl=True,
+            transaction_per_migration=True,
+            on_version_apply=on_version_apply,
+        ):
+            command.upgrade(self.cfg, self.b)
+
+        eq_(len(seen), 2)
+        for step_metrics in seen:
+            assert step_metrics.transaction_time >= step_metrics.elapsed
+
+    def test_no_metrics_by_default(self):
+        seen = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(step.metrics)
+
+        with self._patch_environment(on_version_apply=on_version_apply):
+            command.upgrade(self.cfg, self.b)
+        eq_(seen, [None, None])
+
+    def test_report(self):
+        report = os.path.join(_get_staging_directory(), "metrics.json")
+        with self._patch_environment(step_metrics_report=report):
+            command.upgrade(self.cfg, self.b)
+
+        with open(report) as file_:
+            data = json.load(file_)
+        eq_(data["dialect"], "sqlite")
+        eq_(data["as_sql"], False)
+        eq_(data["complete"], True)
+        eq_(
+            [
+                (step["direction"], step["from"], step["to"])
+                for step in data["steps"]
+            ],
+            [("upgrade", [], [self.a]), ("upgrade", [self.a], [self.b])],
+        )
+        eq_(
+            data["steps"][1]["description"],
+            "upgrade %s -> %s" % (self.a, self.b),
+        )
+        eq_(data["steps"][1]["rows_affected"], 4)
+
+    def test_report_incomplete(self):
+        report = os.path.join(_get_staging_directory(), "metrics.json")
+        command.upgrade(self.cfg, self.b)
+        with self._patch_environment(step_metrics_report=report):
+            assert_raises_message(
+                Exception,
+                "downgrade b failed",
+                command.downgrade,
+                self.cfg,
+                "base",
+            )
+
+        with open(report) as file_:
+            data = json.load(file_)
+        eq_(data["complete"], False)
+        eq_(
+            [(step["direction"], step["to"]) for step in data["steps"]],
+            [("downgrade", [self.a])],
+        )
+        eq_(data["steps"][0]["elapsed"], None)
+
+    def test_offline(self):
+        seen = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(step.metrics)
+
+        with self._patch_environment(
+            step_metrics=True, on_version_apply=on_version_apply
+        ):
+            with capture_context_buffer():
+                command.upgrade(self.cfg, self.b, sql=True)
+
+        eq_(
+            [
+                (
+                    metrics.statements,
+                    metrics.ddl_statements,
+                    metrics.dml_statements,
+                    metrics.rows_affected,
+                )
+                for metrics in seen
+            ],
+            [(4, 2, 2, None), (3, 0, 3, None)],
+        )
+
+
+class StatementProfilerTest(DataMigrationsFixture, TestBase):
+    def test_totals(self):
+        profiler = StatementProfiler()
+        with self._patch_environment(statement_profiler=profiler):
+            command.upgrade(self.cfg, self.b)
+
+        eq_(list(profiler.revisions), [self.a, self.b])
+        eq_(profiler.revisions[self.a].statements, 3)
+        eq_(profiler.revisions[self.b].statements, 3)
+
+        # the version table is created before the migrations run
+        eq_(sorted(profiler.tables), ["alembic_version", "foo"])
+        foo = profiler.tables["foo"]
+        eq_(foo.statements, 4)
+        assert foo.compile_time >= 0
+        assert foo.execute_time > 0
+        eq_(foo.total_time, foo.compile_time + foo.execute_time)
+        eq_(profiler.tables["alembic_version"].statements, 2)
+
+        report = profiler.to_dict()
+        eq_(
+            [entry["revision"] for entry in report["revisions"]],
+            [self.a, self.b],
+        )
+        eq_(
+            sorted(
+                (entry["table"], entry["statements"])
+                for entry in report["tables"]
+            ),
+            [("alembic_version", 2), ("foo", 4)],
+        )
+
+    def test_slow_statements_logged(self):
+        with mock.patch.object(metrics.log, "warning") as warning:
+            with self._patch_environment(slow_statement_threshold=0):
+                command.upgrade(self.cfg, self.b)
+
+        eq_(warning.call_count, 6)
+        args = warning.mock_calls[3][1]
+        eq_(args[1], self.b)
+        eq_(args[4], "UPDATE foo SET id = id + 10 WHERE id > 1")
+
+    def test_tables_of_constructs(self):
+        profiler = StatementProfiler()
+        context = MigrationContext.configure(
+            dialect_name="postgresql",
+            opts={"as_sql": True, "output_buffer": io.StringIO()},
+        )
+        op = Operations(context)
+        profiler.begin_run(context)
+        op.add_column("t1", Column("x", Integer), schema="s1")
+        op.create_index("ix_t2_x", "t2", ["x"])
+        op.create_foreign_key("fk_t3", "t3", "t1", ["x"], ["x"])
+        op.bulk_insert(table("t4", column("x", Integer)), [{"x": 1}])
+        op.execute('ALTER TABLE "t5" ADD COLUMN y INTEGER')
+        op.execute("VACUUM")
+        profiler.end_run(context)
+
+        eq_(
+            sorted(profiler.tables, key=str),
+            [None, "s1.t1", "t2", "t3", "t4", "t5"],
+        )
+
+    def test_ini_options(self):
+        self.cfg.set_main_option("statement_profiler", "false")
+        with mock.patch.object(StatementProfiler, "record") as record:
+            command.upgrade(self.cfg, self.a)
+        eq_(record.call_count, 0)
+
+        self.cfg.set_main_option(
+            "statement_profiler", "alembic.runtime.metrics:StatementProfiler",
+        )
+        self.cfg.set_main_option("slow_statement_threshold", "1000")
+        with mock.patch.object(
+            StatementProfiler, "record", autospec=True
+        ) as record:
+            command.upgrade(self.cfg, self.b)
+        eq_(record.call_count, 3)
+        eq_(record.mock_calls[0][1][0].threshold, 1000)
+
+    def test_ini_option_invalid(self):
+        self.cfg.set_main_option("statement_profiler", "yes")
+        assert_raises_message(
+            util.CommandError,
+            "statement_profiler should be 'true' or the 'module:Class' "
+            "path of a profiler class; got 'yes'",
+            command.upgrade,
+            self.cfg,
+            self.b,
+        )
+
+    def test_offline(self):
+        profiler = StatementProfiler()
+        with self._patch_environment(statement_profiler=profiler):
+            with capture_context_buffer():
+                command.upgrade(self.cfg, self.b, sql=True)
+
+        eq_(list(profiler.revisions), [self.a, self.b])
+        eq_(
+            sorted(
+                (table, stats.statements)
+                for table, stats in profiler.tables.items()
+            ),
+            [("alembic_version", 3), ("foo", 4)],
+        )
+        eq_(profiler.tables["foo"].execute_time, 0)
+
+
+class LockRetryTest(DataMigrationsFixture, TestBase):
+    def setUp(self):
+        super(LockRetryTest, self).setUp()
+        command.upgrade(self.cfg, self.b)
+        self.c = util.rev_id()
+        self.env.generate_revision(self.c, "revision c", refresh=True)
+        write_script(
+            self.env,
+            self.c,
+            """\
+revision = '%s'
+down_revision = '%s'
+
+from alembic import op
+
+
+def upgrade():
+    op.execute("INSERT INTO waiting (id) VALUES (1)")
+
+
+def downgrade():
+    pass
+
+"""
+            % (self.c, self.b),
+        )
+
+    @contextmanager
+    def _locked(self, released_after, delay=None):
+        # "waiting" is missing, standing in for a locked table, until
+        # the given number of retries
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if delay is not None:
+                time.sleep(delay)
+            if len(sleeps) == released_after:
+                op.get_bind().execute("CREATE TABLE waiting (id INTEGER)")
+
+        with mock.patch(
+            "alembic.ddl.impl.DefaultImpl.is_lock_timeout",
+            lambda self, err: "no such table: waiting" in str(err),
+        ), mock.patch(
+            "alembic.runtime.retry.LockRetryPolicy.sleep", side_effect=sleep,
+        ):
+            yield sleeps
+
+    def test_retry(self):
+        seen = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(step.metrics.to_dict())
+
+        with self._patch_environment(
+            lock_retries=3,
+            lock_retry_backoff=2,
+            step_metrics=True,
+            on_version_apply=on_version_apply,
+        ):
+            with self._locked(2) as sleeps:
+                command.upgrade(self.cfg, self.c)
+
+        eq_(len(sleeps), 2)
+        assert 1 <= sleeps[0] <= 2
+        assert 2 <= sleeps[1] <= 4
+        eq_(seen[0]["lock_retries"], 2)
+        eq_(seen[0]["lock_retry_delay"], sum(sleeps))
+        eq_(self.bind.scalar("SELECT id FROM waiting"), 1)
+
+    def test_savepoints_and_backoff_not_recorded(self):
+        seen = []
+        profiler = StatementProfiler()
+        statements = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            seen.append(step.metrics.to_dict())
+
+        def before(conn, cursor, statement, parameters, context, many):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", before)
+        try:
+            with self._patch_environment(
+                lock_retries=3,
+                transactional_ddl=True,
+                step_metrics=True,
+                statement_profiler=profiler,
+                on_version_apply=on_version_apply,
+            ):
+                with self._locked(1, delay=0.2) as sleeps:
+                    command.upgrade(self.cfg, self.c)
+        finally:
+            event.remove(Engine, "before_cursor_execute", before)
+
+        eq_(len(sleeps), 1)
+        # SAVEPOINT and ROLLBACK TO or RELEASE around each attempt of the
+        # INSERT and of the version table UPDATE
+        eq_(len([stmt for stmt in statements if "SAVEPOINT" in stmt]), 6)
+        # the INSERT, the CREATE TABLE run while "waiting", and the
+        # version table UPDATE
+        eq_((seen[0]["statements"], seen[0]["ddl_statements"]), (3, 1))
+        eq_(profiler.revisions[self.c].statements, 3)
+        assert profiler.revisions[self.c].compile_time < 0.2
+        eq_(
+            sorted(
+                (table, stats.statements)
+                for table, stats in profiler.tables.items()
+            ),
+            [("alembic_version", 1), ("waiting", 2)],
+        )
+
+    def test_retries_exhausted(self):
+        with self._patch_environment(lock_retries=2):
+            with self._locked(3) as sleeps:
+                assert_raises_message(
+                    Exception,
+                    "no such table: waiting",
+                    command.upgrade,
+                    self.cfg,
+                    self.c,
+                )
+        eq_(len(sleeps), 2)
+
+    def test_other_errors_not_retried(self):
+        with self._patch_environment(lock_retries=2):
+            with self._locked(1) as sleeps:
+                with mock.patch(
+                    "alembic.ddl.impl.DefaultImpl.is_lock_timeout",
+                    return_value=False,
+                ):
+                    assert_raises_message(
+                        Exception,
+                        "no such table: waiting",
+                        command.upgrade,
+                        self.cfg,
+                        self.c,
+                    )
+        eq_(sleeps, [])
+
+    def test_ini_options(self):
+        self.cfg.set_main_option("lock_timeout", "1.5")
+        self.cfg.set_main_option("lock_retries", "2")
+        self.cfg.set_main_option("lock_retry_backoff", "0.5")
+        policies = []
+
+        def on_version_apply(ctx, step, heads, run_args):
+            policies.append(ctx.lock_retry_policy)
+
+        with self._patch_environment(on_version_apply=on_version_apply):
+            with self._locked(1):
+                with assertions.expect_warnings(
+                    "lock_timeout isn't supported for the sqlite dialect"
+                ):
+                    command.upgrade(self.cfg, self.c)
+        policy = policies[0]
+        eq_(
+            (policy.lock_timeout, policy.retries, policy.backoff),
+            (1.5, 2, 0.5),
+        )
+
+    def test_delay(self):
+        policy = LockRetryPolicy(backoff=1, max_backoff=5, jitter=0)
+        eq_([policy.delay(n) for n in range(1, 6)], [1, 2, 4, 5, 5])
+
+    def test_set_lock_timeout_offline(self):
+        for dialect_name, expected in [
+            ("postgresql", ["SET lock_timeout = 2500;"]),
+            (
+                "mysql",
+                [
+                    "SET SESSION lock_wait_timeout = 3;",
+                    "SET SESSION innodb_lock_wait_timeout = 3;",
+                ],
+            ),
+        ]:
+            buf = io.StringIO()
+            context = MigrationContext.configure(
+                dialect_name=dialect_name,
+                opts={"as_sql": True, "output_buffer": buf},
+            )
+            context.impl.set_lock_timeout(2.5)
+            eq_(buf.getvalue().split("\n\n")[:-1], expected)
+
+    def test_is_lock_timeout(self):
+        for dialect_name, orig, expected in [
+            ("postgresql", mock.Mock(pgcode="55P03"), True),
+            ("postgresql", mock.Mock(pgcode="42P01"), False),
+            ("mysql", mock.Mock(args=(1205, "Lock wait timeout")), True),
+            ("mysql", mock.Mock(args=(1146, "Table doesn't exist")), False),
+        ]:
+            context = MigrationContext.configure(
+                dialect_name=dialect_name, opts={"as_sql": True}
+            )
+            err = sqla_exc.OperationalError("ALTER TABLE t", {}, orig)
+            eq_(context.impl.is_lock_timeout(err), expected)
+
+
 class EncodingTest(TestBase):
     def setUp(self):
         self.env = staging_env()
@@ -743,3 +1417,440 @@ class SourcelessNeedsFlagTest(TestBase):
         self.cfg.set_main_option("sourceless", "true")
         script = ScriptDirectory.from_config(self.cfg)
         eq_(script.get_heads(), [a])
+
+
+class RevisionIndexTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        self.cfg.set_main_option("revision_index", "true")
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _load(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=util.load_python_file
+        ) as load:
+            heads = script.get_heads()
+        return (
+            script,
+            heads,
+            set(os.path.basename(call[0][1]) for call in load.call_args_list),
+        )
+
+    def _rev_filename(self, script, rev):
+        return os.path.basename(script.get_revision(rev).path)
+
+    def test_index_written_and_used(self):
+        script, heads, loaded = self._load()
+        eq_(heads, [self.c])
+        eq_(len(loaded), 3)
+        assert os.path.exists(script._revision_index_path)
+
+        script, heads, loaded = self._load()
+        eq_(heads, [self.c])
+        eq_(loaded, set())
+
+        rev = script.get_revision(self.b)
+        eq_(rev.down_revision, self.a)
+        eq_(rev.doc, compat.u("Rev B, méil, %3"))
+        eq_(rev.module.revision, self.b)
+
+    def test_release_module(self):
+        self._load()
+        script, heads, loaded = self._load()
+        rev = script.get_revision(self.b)
+
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=util.load_python_file
+        ) as load:
+            module = rev.module
+            assert rev.module is module
+            eq_(load.call_count, 1)
+
+            rev.release_module()
+            eq_(rev.doc, compat.u("Rev B, méil, %3"))
+            eq_(load.call_count, 1)
+
+            assert rev.module is not module
+            eq_(rev.module.revision, self.b)
+            eq_(load.call_count, 2)
+
+            rev.module = module
+            assert rev.module is module
+            eq_(load.call_count, 2)
+
+    def test_index_not_used_by_default(self):
+        self.cfg.set_main_option("revision_index", "false")
+        script, heads, loaded = self._load()
+        eq_(len(loaded), 3)
+        assert not os.path.exists(script._revision_index_path)
+
+    def test_changed_file_reloaded(self):
+        script, heads, loaded = self._load()
+
+        write_script(
+            script,
+            self.c,
+            """\
+    "Rev C, changed"
+    revision = '%s'
+    down_revision = '%s'
+    branch_labels = ('foo', )
+
+    def upgrade():
+        pass
+
+
+    def downgrade():
+        pass
+
+    """
+            % (self.c, self.b),
+        )
+
+        script, heads, loaded = self._load()
+        eq_(loaded, set([self._rev_filename(script, self.c)]))
+        rev = script.get_revision(self.c)
+        eq_(rev.doc, "Rev C, changed")
+        eq_(rev.branch_labels, set(["foo"]))
+
+        script, heads, loaded = self._load()
+        eq_(loaded, set())
+
+    def test_touched_file_not_reloaded(self):
+        script, heads, loaded = self._load()
+        path = script.get_revision(self.a).path
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+        script, heads, loaded = self._load()
+        eq_(loaded, set())
+
+    def test_removed_file(self):
+        script, heads, loaded = self._load()
+        os.unlink(script.get_revision(self.c).path)
+
+        script, heads, loaded = self._load()
+        eq_(heads, [self.b])
+        eq_(loaded, set())
+
+    def test_corrupt_index_regenerated(self):
+        script, heads, loaded = self._load()
+        with open(script._revision_index_path, "w") as file_:
+            file_.write("{ not json")
+
+        script, heads, loaded = self._load()
+        eq_(heads, [self.c])
+        eq_(len(loaded), 3)
+
+        script, heads, loaded = self._load()
+        eq_(loaded, set())
+
+
+class LazyRevisionsTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        self.cfg.set_main_option("lazy_revisions", "true")
+
+    def tearDown(self):
+        clear_staging_env()
+
+    @contextmanager
+    def _assert_loaded(self, *revs):
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=util.load_python_file
+        ) as load:
+            yield
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(
+            set(os.path.basename(call[0][1]) for call in load.call_args_list),
+            set(
+                os.path.basename(script.get_revision(rev).path)
+                if rev != "env.py"
+                else rev
+                for rev in revs
+            ),
+        )
+
+    def test_headers_parsed(self):
+        with self._assert_loaded():
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(script.get_heads(), [self.c])
+            rev = script.get_revision(self.b)
+            eq_(rev.down_revision, self.a)
+            eq_(rev.doc, compat.u("Rev B, méil, %3"))
+            eq_(
+                [r.revision for r in script.walk_revisions()],
+                [self.c, self.b, self.a],
+            )
+
+    def test_upgrade_loads_only_steps_run(self):
+        with self._assert_loaded("env.py", self.b, self.c):
+            with capture_context_buffer() as buf:
+                command.upgrade(self.cfg, "%s:head" % self.a, sql=True)
+        assert "CREATE STEP 1" not in buf.getvalue()
+        assert "CREATE STEP 2" in buf.getvalue()
+        assert "CREATE STEP 3" in buf.getvalue()
+
+    def test_dynamic_down_revision_falls_back(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        write_script(
+            script,
+            self.c,
+            """\
+    "Rev C"
+    revision = '%s'
+    down_revision = '%s'.lower()
+
+    def upgrade():
+        pass
+
+
+    def downgrade():
+        pass
+
+    """
+            % (self.c, self.b),
+        )
+        with self._assert_loaded(self.c):
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(script.get_heads(), [self.c])
+            eq_(script.get_revision(self.c).down_revision, self.b)
+
+    def test_conditional_branch_labels_falls_back(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        write_script(
+            script,
+            self.c,
+            """\
+    "Rev C"
+    revision = '%s'
+    down_revision = '%s'
+    branch_labels = None
+    if True:
+        branch_labels = ('foo', )
+
+    def upgrade():
+        pass
+
+
+    def downgrade():
+        pass
+
+    """
+            % (self.c, self.b),
+        )
+        with self._assert_loaded(self.c):
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(script.get_revision(self.c).branch_labels, set(["foo"]))
+
+
+class RevisionLoadWorkersTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        script = ScriptDirectory.from_config(self.cfg)
+        write_script(
+            script,
+            self.c,
+            """\
+    "Rev C"
+    revision = '%s'
+    down_revision = '%s'.lower()
+
+    from alembic import op
+
+
+    def upgrade():
+        op.execute("CREATE STEP 3")
+
+
+    def downgrade():
+        op.execute("DROP STEP 3")
+
+    """
+            % (self.c, self.b),
+        )
+        self.cfg.set_main_option("revision_load_workers", "2")
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _headers(self, script):
+        return [
+            (
+                rev.revision,
+                rev.down_revision,
+                rev.branch_labels,
+                rev.dependencies,
+                rev.doc,
+                rev.path,
+            )
+            for rev in script.walk_revisions()
+        ]
+
+    def test_same_as_serial(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.revision_load_workers, 2)
+        with mock.patch(
+            "alembic.util.load_python_file", side_effect=util.load_python_file
+        ) as load:
+            parallel = self._headers(script)
+        eq_(load.mock_calls, [])
+
+        self.cfg.set_main_option("revision_load_workers", "1")
+        serial = self._headers(ScriptDirectory.from_config(self.cfg))
+        eq_(parallel, serial)
+        eq_([rev[0] for rev in parallel], [self.c, self.b, self.a])
+
+    def test_upgrade(self):
+        with capture_context_buffer() as buf:
+            command.upgrade(self.cfg, "%s:head" % self.a, sql=True)
+        assert "CREATE STEP 1" not in buf.getvalue()
+        assert "CREATE STEP 2" in buf.getvalue()
+        assert "CREATE STEP 3" in buf.getvalue()
+
+    def test_lazy_revisions(self):
+        self.cfg.set_main_option("lazy_revisions", "true")
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_heads(), [self.c])
+        eq_(script.get_revision(self.c).down_revision, self.b)
+        eq_(script.get_revision(self.b).doc, compat.u("Rev B, méil, %3"))
+
+    def test_revision_index(self):
+        self.cfg.set_main_option("revision_index", "true")
+        script = ScriptDirectory.from_config(self.cfg)
+        eq_(script.get_heads(), [self.c])
+        assert os.path.exists(script._revision_index_path)
+
+        with mock.patch("multiprocessing.Pool") as pool:
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(script.get_heads(), [self.c])
+        eq_(pool.mock_calls, [])
+
+    def test_duplicate_revision_warning(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        path = script.get_revision(self.b).path
+        shutil.copy(path, os.path.join(os.path.dirname(path), "copy_of_b.py"))
+
+        with assertions.expect_warnings(
+            "Revision %s is present more than once" % self.b
+        ):
+            script = ScriptDirectory.from_config(self.cfg)
+            eq_(script.get_heads(), [self.c])
+
+    def test_missing_revision_raises(self):
+        script = ScriptDirectory.from_config(self.cfg)
+        path = os.path.join(
+            os.path.dirname(script.get_revision(self.a).path), "foobar.py"
+        )
+        with open(path, "w") as fp:
+            fp.write("down_revision = None\n")
+
+        assert_raises_message(
+            util.CommandError,
+            "Could not determine revision id from filename foobar.py.",
+            ScriptDirectory.from_config(self.cfg).get_heads,
+        )
+
+
+class ParseModuleLiteralsTest(TestBase):
+    def setUp(self):
+        self.dir_ = os.path.join(_get_staging_directory(), "literals")
+        os.makedirs(self.dir_)
+
+    def tearDown(self):
+        clear_staging_env()
+
+    def _parse(self, text, filename="foo.py"):
+        with open(os.path.join(self.dir_, filename), "w") as file_:
+            file_.write(textwrap.dedent(text))
+        return util.parse_module_literals(
+            self.dir_, filename, ("revision", "down_revision", "x", "y")
+        )
+
+    def test_literals(self):
+        eq_(
+            self._parse(
+                """
+                '''the doc'''
+                import os
+                revision = 'a'
+                down_revision = ('b', 'c')
+                x = y = 5
+                z = 10
+
+                def upgrade():
+                    revision = 'nope'
+                """
+            ),
+            {
+                "__doc__": "the doc",
+                "revision": "a",
+                "down_revision": ("b", "c"),
+                "x": 5,
+                "y": 5,
+            },
+        )
+
+    def test_absent_names_omitted(self):
+        eq_(
+            self._parse(
+                """
+                revision = 'a'
+                revision = 'b'
+                z = compute()
+                """
+            ),
+            {"__doc__": None, "revision": "b"},
+        )
+
+    def _assert_dynamic(self, text):
+        eq_(self._parse("revision = 'a'\n" + textwrap.dedent(text)), None)
+
+    def test_dynamic_expression(self):
+        self._assert_dynamic("revision = compute()")
+
+    def test_dynamic_import(self):
+        self._assert_dynamic("from foo import revision")
+
+    def test_dynamic_conditional(self):
+        self._assert_dynamic(
+            """
+            if True:
+                revision = 'b'
+            """
+        )
+
+    def test_dynamic_loop(self):
+        self._assert_dynamic(
+            """
+            for revision in range(5):
+                pass
+            """
+        )
+
+    def test_dynamic_unpack(self):
+        self._assert_dynamic("revision, z = 'a', 'b'")
+
+    def test_dynamic_global(self):
+        self._assert_dynamic(
+            """
+            def upgrade():
+                global revision
+                revision = 'q'
+            """
+        )
+
+    def test_syntax_error(self):
+        eq_(self._parse("revision = ("), None)
+
+    def test_not_source(self):
+        eq_(self._parse("revision = 'a'", filename="foo.pyc"), None)
@@ -780,6 +780,79 @@ sa.Table('e3t1', m3, sa.Column('z', sa.Integer))
             rev.module.downgrade_engine3()
             eq_(op_mock.mock_calls[-1], mock.call.drop_table("e3t1"))
 
+    def _upgrade_fixture(self, engine2_upgrade=None):
+        if engine2_upgrade is None:
+            engine2_upgrade = "op.create_table('e2t1', sa.Column('y', INT))"
+        script = ScriptDirectory.from_config(self.cfg)
+        rev = util.rev_id()
+        script.generate_revision(
+            rev, "revision a", refresh=True, config=self.cfg
+        )
+        write_script(
+            script,
+            rev,
+            """
+revision = '%s'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import Integer as INT
+
+def upgrade(engine_name):
+    globals()["upgrade_%%s" %% engine_name]()
+
+def upgrade_engine1():
+    op.create_table('e1t1', sa.Column('x', sa.Integer))
+
+def upgrade_engine2():
+    %s
+
+def upgrade_engine3():
+    op.create_table('e3t1', sa.Column('z', sa.Integer))
+
+"""
+            % (rev, engine2_upgrade),
+        )
+        return rev
+
+    def _versions(self, engine):
+        with engine.connect() as conn:
+            return [
+                row[0]
+                for row in conn.execute(
+                    "select version_num from alembic_version"
+                )
+            ]
+
+    def test_upgrade_concurrently(self):
+        rev = self._upgrade_fixture()
+        command.upgrade(self.cfg, "heads")
+
+        for engine, table in [
+            (self.engine1, "e1t1"),
+            (self.engine2, "e2t1"),
+            (self.engine3, "e3t1"),
+        ]:
+            eq_(self._versions(engine), [rev])
+            eq_(
+                Inspector.from_engine(engine).get_table_names(),
+                ["alembic_version", table],
+            )
+
+    def test_upgrade_failure_rolls_back_all(self):
+        self._upgrade_fixture(engine2_upgrade="raise Exception('e2 failed')")
+        assert_raises_message(
+            CommandError,
+            r"Migrations failed for engine2 \(e2 failed\)",
+            command.upgrade,
+            self.cfg,
+            "heads",
+        )
+
+        for engine in (self.engine1, self.engine2, self.engine3):
+            eq_(self._versions(engine), [])
+
 
 class RewriterTest(TestBase):
     def test_all_traverse(self):
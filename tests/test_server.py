@@ -0,0 +1,177 @@
+import io
+import os
+import threading
+
+from alembic import command
+from alembic import config
+from alembic import util
+from alembic.script import ScriptDirectory
+from alembic.server import MigrationServer
+from alembic.server import send_command
+from alembic.testing import assert_raises_message
+from alembic.testing import eq_
+from alembic.testing import mock
+from alembic.testing.env import _get_staging_directory
+from alembic.testing.env import _sqlite_testing_config
+from alembic.testing.env import clear_staging_env
+from alembic.testing.env import staging_env
+from alembic.testing.env import three_rev_fixture
+from alembic.testing.fixtures import TestBase
+
+
+class MigrationServerTest(TestBase):
+    def setUp(self):
+        self.env = staging_env()
+        self.cfg = _sqlite_testing_config()
+        self.a, self.b, self.c = three_rev_fixture(self.cfg)
+        self.socket_path = os.path.abspath(
+            os.path.join(_get_staging_directory(), "alembic.sock")
+        )
+        self.server = MigrationServer(self.cfg, self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        clear_staging_env()
+
+    def _send(self, *argv):
+        buf = io.StringIO()
+        status = send_command(
+            self.socket_path,
+            ["-c", self.cfg.config_file_name] + list(argv),
+            buf,
+        )
+        return status, buf.getvalue()
+
+    def test_heads(self):
+        status, output = self._send("heads")
+        eq_(status, 0)
+        eq_(output, "%s (head)\n" % self.c)
+
+    def test_revisions_kept(self):
+        script = self.server.script
+        self._send("heads")
+        self._send("history")
+        assert self.server.script is script
+
+    def test_stamp_uses_engine(self):
+        with mock.patch.object(
+            self.server.engine, "connect", wraps=self.server.engine.connect
+        ) as connect:
+            status, output = self._send("stamp", self.b)
+            eq_(status, 0)
+            status, output = self._send("current")
+            eq_(status, 0)
+        eq_(output, "%s\n" % self.b)
+        eq_(connect.call_count, 2)
+
+    def test_new_revision_loaded(self):
+        d = util.rev_id()
+        script = ScriptDirectory.from_config(self.cfg)
+        script.generate_revision(d, "revision d", head=self.c)
+
+        status, output = self._send("heads")
+        eq_(status, 0)
+        eq_(output, "%s (head)\n" % d)
+
+    def test_command_error(self):
+        status, output = self._send("upgrade", "nosuchrev")
+        eq_(status, -1)
+        assert "FAILED: Can't locate revision identified by 'nosuchrev'" in (
+            output
+        )
+
+    def test_usage_error(self):
+        status, output = self._send("nosuchcommand")
+        eq_(status, 2)
+        assert "invalid choice: 'nosuchcommand'" in output
+
+    def test_other_config_rejected(self):
+        status, output = self._send("-n", "othersection", "heads")
+        eq_(status, -1)
+        assert "This server runs commands for section [alembic]" in output
+
+    def test_serve_rejected(self):
+        status, output = self._send("serve", "other.sock")
+        eq_(status, -1)
+        assert "Can't run 'serve' from within 'alembic serve'" in output
+
+    def test_socket_permissions(self):
+        eq_(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_output_not_via_sys_streams(self):
+        buf = io.StringIO()
+        argv = ["-c", self.cfg.config_file_name]
+        with mock.patch("sys.stdout", buf), mock.patch("sys.stderr", buf):
+            status, output = self.server.run_command(argv + ["heads"])
+            eq_(status, 0)
+            eq_(output, "%s (head)\n" % self.c)
+
+            status, output = self.server.run_command(
+                argv + ["upgrade", "--sql", self.a]
+            )
+            eq_(status, 0)
+            assert "INSERT INTO alembic_version" in output
+
+            status, output = self.server.run_command(argv + ["nosuchcommand"])
+            eq_(status, 2)
+            assert "invalid choice: 'nosuchcommand'" in output
+
+            status, output = self.server.run_command(
+                argv + ["upgrade", "nosuchrev"]
+            )
+            eq_(status, -1)
+            assert "FAILED: Can't locate revision" in output
+        eq_(buf.getvalue(), "")
+
+    def test_socket_in_use(self):
+        assert_raises_message(
+            util.CommandError,
+            "Socket %s is already in use" % self.socket_path,
+            MigrationServer,
+            self.cfg,
+            self.socket_path,
+        )
+
+    def test_command_line(self):
+        buf = io.StringIO()
+        with mock.patch("sys.stdout", buf):
+            config.CommandLine().main(
+                [
+                    "-c",
+                    self.cfg.config_file_name,
+                    "--socket",
+                    self.socket_path,
+                    "heads",
+                ]
+            )
+        eq_(buf.getvalue(), "%s (head)\n" % self.c)
+
+    def test_command_line_no_server(self):
+        buf = io.StringIO()
+        with mock.patch("sys.stdout", buf):
+            assert_raises_message(
+                SystemExit,
+                "-1",
+                config.CommandLine().main,
+                [
+                    "-c",
+                    self.cfg.config_file_name,
+                    "--socket",
+                    self.socket_path + ".other",
+                    "heads",
+                ],
+            )
+        assert "FAILED: Can't connect to %s.other" % self.socket_path in (
+            buf.getvalue()
+        )
+
+    def test_stamp_with_command_module(self):
+        # commands run directly don't interfere with the server's state
+        command.stamp(self.cfg, self.a)
+        status, output = self._send("current")
+        eq_(status, 0)
+        eq_(output, "%s\n" % self.a)
@@ -1,4 +1,7 @@
+import io
+
 from sqlalchemy import Column
+from sqlalchemy import create_engine
 from sqlalchemy import MetaData
 from sqlalchemy import String
 from sqlalchemy import Table
@@ -9,6 +12,7 @@ from alembic.testing import assert_raises
 from alembic.testing import assert_raises_message
 from alembic.testing import config
 from alembic.testing import eq_
+from alembic.testing import exclusions
 from alembic.testing import mock
 from alembic.testing.fixtures import TestBase
 from alembic.util import CommandError
@@ -172,6 +176,49 @@ class TestMigrationContext(TestBase):
             "alembic_version" in Inspector(self.connection).get_table_names()
         )
 
+    @exclusions.only_on("sqlite")
+    def test_get_heads_for_schemas(self):
+        # a connection of its own, as attached databases remain
+        # for the life of the connection
+        with create_engine("sqlite://").connect() as connection:
+            for schema in ("t1", "t2", "t3"):
+                connection.execute("ATTACH DATABASE ':memory:' AS %s" % schema)
+            for schema, heads in (("t1", ("a",)), ("t3", ("b", "c"))):
+                context = self.make_one(
+                    connection=connection,
+                    opts={"version_table_schema": schema},
+                )
+                context.stamp(
+                    mock.Mock(
+                        _stamp_revs=lambda revision, heads, new=heads: [
+                            _up(None, rev, True) for rev in new
+                        ]
+                    ),
+                    None,
+                )
+
+            context = self.make_one(connection=connection)
+            with mock.patch.object(
+                connection.dialect,
+                "has_table",
+                wraps=connection.dialect.has_table,
+            ) as has_table:
+                eq_(
+                    context.get_current_heads_for_schemas(["t1", "t2", "t3"]),
+                    {"t1": ("a",), "t2": (), "t3": ("b", "c")},
+                )
+            eq_(has_table.call_count, 3)
+
+    def test_get_heads_for_schemas_offline(self):
+        context = self.make_one(
+            dialect_name="postgresql",
+            opts={"starting_rev": "q", "as_sql": True},
+        )
+        eq_(
+            context.get_current_heads_for_schemas(["t1", "t2"]),
+            {"t1": ("q",), "t2": ("q",)},
+        )
+
 
 class UpdateRevTest(TestBase):
     __backend__ = True
@@ -254,6 +301,30 @@ class UpdateRevTest(TestBase):
         self.updater.update_to_step(_down("d2", "c2"))
         self._assert_heads(("c2", "d1"))
 
+    def test_statements_compiled_once(self):
+        statements = self.context._version_statements
+        self.updater.update_to_step(_up(None, "a", True))
+        with mock.patch.object(
+            self.context.impl, "_exec", wraps=self.context.impl._exec
+        ) as exec_:
+            self.updater.update_to_step(_up("a", "b"))
+            self.updater.update_to_step(_up("b", "c"))
+        assert self.context._version_statements is statements
+        eq_(
+            exec_.mock_calls,
+            [
+                mock.call(
+                    statements["update"],
+                    params={"from_version": "a", "to_version": "b"},
+                ),
+                mock.call(
+                    statements["update"],
+                    params={"from_version": "b", "to_version": "c"},
+                ),
+            ],
+        )
+        self._assert_heads(("c",))
+
     def test_update_no_match(self):
         self.updater.update_to_step(_up(None, "a", True))
         self.updater.heads.add("x")
@@ -302,3 +373,199 @@ class UpdateRevTest(TestBase):
             self.updater.update_to_step,
             _down("a", None, True),
         )
+
+
+class CoalesceUpdateRevTest(TestBase):
+    __backend__ = True
+
+    @classmethod
+    def setup_class(cls):
+        cls.bind = config.db
+
+    def setUp(self):
+        self.connection = self.bind.connect()
+        version_table.create(self.connection)
+
+    def tearDown(self):
+        version_table.drop(self.connection, checkfirst=True)
+        self.connection.close()
+
+    def make_one(self, steps=(), **opts):
+        opts.update(
+            version_table="version_table",
+            coalesce_version_writes=True,
+            fn=lambda heads, context: list(steps),
+        )
+        return migration.MigrationContext.configure(
+            connection=self.connection, opts=opts
+        )
+
+    def _run(self, context):
+        with mock.patch.object(
+            context.impl, "_exec", wraps=context.impl._exec
+        ) as exec_:
+            context.run_migrations()
+        return exec_.call_count
+
+    def test_flush_net_change(self):
+        context = self.make_one()
+        updater = migration.HeadMaintainer(context, (), coalesce=True)
+        updater.update_to_step(_up(None, "a", True))
+        updater.update_to_step(_up("a", "b"))
+        updater.update_to_step(_up(None, "c", True))
+        eq_(context.get_current_heads(), ())
+        updater.flush()
+        eq_(set(context.get_current_heads()), set(["b", "c"]))
+
+        updater.update_to_step(_up(("b", "c"), "d"))
+        updater.update_to_step(_down("d", ("e1", "e2")))
+        eq_(set(context.get_current_heads()), set(["b", "c"]))
+        updater.flush()
+        eq_(set(context.get_current_heads()), set(["e1", "e2"]))
+
+        updater.update_to_step(_down("e1", None, True))
+        updater.update_to_step(_down("e2", None, True))
+        updater.flush()
+        eq_(context.get_current_heads(), ())
+
+    def test_flush_no_change(self):
+        context = self.make_one()
+        updater = migration.HeadMaintainer(context, (), coalesce=True)
+        updater.update_to_step(_up(None, "a", True))
+        updater.update_to_step(_down("a", None, True))
+        with mock.patch.object(context.impl, "_exec") as exec_:
+            updater.flush()
+        eq_(exec_.mock_calls, [])
+
+    def test_flush_no_match(self):
+        context = self.make_one()
+        updater = migration.HeadMaintainer(context, ("x",), coalesce=True)
+        updater.update_to_step(_up("x", "b"))
+        assert_raises_message(
+            CommandError,
+            "Online migration expected to match one row when updating "
+            "'x' to 'b' in 'version_table'; 0 found",
+            updater.flush,
+        )
+
+    def test_run_in_transaction_writes_once(self):
+        steps = [_up(None, "a", True), _up("a", "b"), _up("b", "c")]
+        with self.connection.begin():
+            context = self.make_one(steps, transactional_ddl=True)
+            # a single INSERT
+            eq_(self._run(context), 1)
+        eq_(context.get_current_heads(), ("c",))
+
+    def test_run_in_transaction_failure(self):
+        def fail(**kw):
+            raise Exception("migration failed")
+
+        failing = _up("b", "c")
+        failing.migration_fn = fail
+        steps = [_up(None, "a", True), _up("a", "b"), failing]
+        context = self.make_one(steps, transactional_ddl=True)
+        self.connection.execute(version_table.insert(), version_num="x")
+        trans = self.connection.begin()
+        assert_raises_message(
+            Exception, "migration failed", self._run, context
+        )
+        trans.rollback()
+        eq_(context.get_current_heads(), ("x",))
+
+    def test_run_no_transaction_writes_per_step(self):
+        steps = [_up(None, "a", True), _up("a", "b"), _up("b", "c")]
+        context = self.make_one(steps, transactional_ddl=True)
+        eq_(self._run(context), 3)
+        eq_(context.get_current_heads(), ("c",))
+
+    def test_run_non_transactional_ddl_writes_per_step(self):
+        steps = [_up(None, "a", True), _up("a", "b"), _up("b", "c")]
+        with self.connection.begin():
+            context = self.make_one(steps, transactional_ddl=False)
+            eq_(self._run(context), 3)
+        eq_(context.get_current_heads(), ("c",))
+
+    def test_run_transaction_per_migration_writes_per_step(self):
+        steps = [_up(None, "a", True), _up("a", "b"), _up("b", "c")]
+        context = self.make_one(
+            steps, transactional_ddl=True, transaction_per_migration=True
+        )
+        eq_(self._run(context), 3)
+        eq_(context.get_current_heads(), ("c",))
+
+
+class OfflineCoalesceUpdateRevTest(TestBase):
+    def _run(self, in_transaction):
+        buf = io.StringIO()
+        steps = [_up(None, "a", True), _up("a", "b"), _up("b", "c")]
+        context = migration.MigrationContext.configure(
+            dialect_name="postgresql",
+            opts={
+                "as_sql": True,
+                "output_buffer": buf,
+                "version_table": "version_table",
+                "coalesce_version_writes": True,
+                "fn": lambda heads, context: steps,
+            },
+        )
+        if in_transaction:
+            with context.begin_transaction():
+                context.run_migrations()
+        else:
+            context.run_migrations()
+        return [
+            line
+            for line in buf.getvalue().split("\n")
+            if line.startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+
+    def test_in_transaction_writes_once(self):
+        eq_(
+            self._run(True),
+            ["INSERT INTO version_table (version_num) VALUES ('c');"],
+        )
+
+    def test_no_transaction_writes_per_step(self):
+        eq_(len(self._run(False)), 3)
+
+
+class OfflineUpdateRevTest(TestBase):
+    def setUp(self):
+        self.buf = io.StringIO()
+        self.context = migration.MigrationContext.configure(
+            dialect_name="sqlite",
+            opts={
+                "as_sql": True,
+                "output_buffer": self.buf,
+                "version_table": "version_table",
+            },
+        )
+        self.updater = migration.HeadMaintainer(self.context, ())
+
+    def test_versions_rendered_inline(self):
+        self.updater.update_to_step(_up(None, "a", True))
+        self.updater.update_to_step(_up("a", "b'c"))
+        self.updater.update_to_step(_down("b'c", None, True))
+        eq_(
+            [line for line in self.buf.getvalue().split("\n") if line],
+            [
+                "INSERT INTO version_table (version_num) VALUES ('a');",
+                "UPDATE version_table SET version_num='b''c' "
+                "WHERE version_table.version_num = 'a';",
+                "DELETE FROM version_table "
+                "WHERE version_table.version_num = 'b''c';",
+            ],
+        )
+
+    def test_statements_compiled_once(self):
+        with mock.patch.object(
+            self.context.impl,
+            "_compile_offline",
+            wraps=self.context.impl._compile_offline,
+        ) as compile_:
+            self.updater.update_to_step(_up(None, "a", True))
+            self.updater.update_to_step(_up("a", "b"))
+            self.updater.update_to_step(_up("b", "c"))
+            self.updater.update_to_step(_up("c", "d"))
+        eq_(len(compile_.mock_calls), 2)
+        assert "version_num='d' WHERE " in self.buf.getvalue()
@@ -20,7 +20,7 @@ class MigrationTest(TestBase):
         revs = self.env._downgrade_revs(destination, source)
         eq_(revs, expected)
         heads = set(util.to_tuple(source, default=()))
-        head = HeadMaintainer(mock.Mock(), heads)
+        head = HeadMaintainer(mock.MagicMock(), heads)
         for rev in revs:
             head.update_to_step(rev)
         eq_(head.heads, expected_heads)
@@ -29,7 +29,7 @@ class MigrationTest(TestBase):
         revs = self.env._upgrade_revs(destination, source)
         eq_(revs, expected)
         heads = set(util.to_tuple(source, default=()))
-        head = HeadMaintainer(mock.Mock(), heads)
+        head = HeadMaintainer(mock.MagicMock(), heads)
         for rev in revs:
             head.update_to_step(rev)
         eq_(head.heads, expected_heads)
@@ -534,7 +534,7 @@ class TwinMergeTest(MigrationTest):
         cls.d2 = env.generate_revision("d2", "d2", head=cls.c2.revision)
 
     def test_upgrade(self):
-        head = HeadMaintainer(mock.Mock(), [self.a.revision])
+        head = HeadMaintainer(mock.MagicMock(), [self.a.revision])
 
         steps = [
             (self.up_(self.b3), ("b3",)),
@@ -593,7 +593,7 @@ class NotQuiteTwinMergeTest(MigrationTest):
         cls.d2 = env.generate_revision("d2", "d2", head=cls.c2.revision)
 
     def test_upgrade(self):
-        head = HeadMaintainer(mock.Mock(), [self.a.revision])
+        head = HeadMaintainer(mock.MagicMock(), [self.a.revision])
 
         """
         upgrade a -> b2, b2
@@ -652,13 +652,13 @@ class DependsOnBranchTestOne(MigrationTest):
 
     def test_downgrade_to_dependency(self):
         heads = [self.c2.revision, self.d1.revision]
-        head = HeadMaintainer(mock.Mock(), heads)
+        head = HeadMaintainer(mock.MagicMock(), heads)
         head.update_to_step(self.down_(self.d1))
         eq_(head.heads, set([self.c2.revision]))
 
     def test_stamp_across_dependency(self):
         heads = [self.e1.revision, self.c2.revision]
-        head = HeadMaintainer(mock.Mock(), heads)
+        head = HeadMaintainer(mock.MagicMock(), heads)
         for step in self.env._stamp_revs(self.b1.revision, heads):
             head.update_to_step(step)
         eq_(head.heads, set([self.b1.revision]))